@@ -0,0 +1,64 @@
+import inspect
+from functools import wraps
+from fastapi import Depends
+from fastapi.routing import APIRoute
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+from starlette.concurrency import run_in_threadpool
+
+
+def run_blocking(fn, *args):
+    """Call fn(*args) from a handler body without stalling the event loop.
+
+    In async mode handlers run on the loop (inside AsyncSession.run_sync), so work
+    that blocks outside the async session (the sync engine, CPU-bound rendering)
+    is sent to the threadpool and awaited. Sync handlers already run on a worker
+    thread and call fn directly.
+    """
+    if in_greenlet():
+        return await_only(run_in_threadpool(fn, *args))
+    return fn(*args)
+
+
+def _async_endpoint(endpoint, db_param: str, async_dep):
+    """Wrap a sync `def handler(..., db: Session)` as `async def handler(..., db: AsyncSession)`.
+
+    The original body runs inside AsyncSession.run_sync, i.e. on the event loop
+    with its I/O going through the async driver, so no threadpool slot is held
+    while waiting on the database. Anything else that blocks goes through
+    run_blocking().
+    """
+    sig = inspect.signature(endpoint)
+
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        adb = kwargs.pop(db_param)
+        return await adb.run_sync(lambda db: endpoint(*args, **{db_param: db}, **kwargs))
+
+    params = [p.replace(default=Depends(async_dep)) if p.name == db_param else p for p in sig.parameters.values()]
+    wrapper.__signature__ = sig.replace(parameters=params)
+    del wrapper.__wrapped__  # so FastAPI reads __signature__ instead of the sync endpoint
+    return wrapper
+
+
+def install_async_routes(app, sync_dep, async_dep):
+    """Swap every route that depends on `sync_dep` for an async twin using `async_dep`."""
+    routes = []
+    for route in app.router.routes:
+        if isinstance(route, APIRoute):
+            db_param = next(
+                (p.name for p in inspect.signature(route.endpoint).parameters.values() if getattr(p.default, "dependency", None) is sync_dep),
+                None,
+            )
+            if db_param:
+                route = APIRoute(
+                    route.path,
+                    _async_endpoint(route.endpoint, db_param, async_dep),
+                    response_model=route.response_model,
+                    status_code=route.status_code,
+                    methods=route.methods,
+                    name=route.name,
+                    response_class=route.response_class,
+                    dependencies=route.dependencies,
+                )
+        routes.append(route)
+    app.router.routes[:] = routes
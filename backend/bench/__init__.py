@@ -0,0 +1 @@
+"""API benchmarks; run each module from backend/ as ``python -m bench.<module>`` (see its docstring)."""
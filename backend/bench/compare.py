@@ -0,0 +1,38 @@
+"""Compare two bench.driver result files.
+
+    python -m bench.compare bench/results/before.json bench/results/after.json
+"""
+import argparse
+import json
+
+
+def _delta(old, new):
+    if old in (None, 0) or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"base {base['meta'].get('commit')}  vs  head {head['meta'].get('commit')}")
+    print(f"{'scenario':16} {'rps':>18} {'p50 ms':>22} {'p95 ms':>22} {'p99 ms':>22}")
+    for name in sorted(set(base["results"]) & set(head["results"])):
+        b, h = base["results"][name], head["results"][name]
+        cells = [
+            f"{b[k]}->{h[k]} ({_delta(b[k], h[k])})"
+            for k in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+        ]
+        print(f"{name:16} {cells[0]:>18} {cells[1]:>22} {cells[2]:>22} {cells[3]:>22}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Fill the database at DATABASE_URL with a synthetic factory dataset.
+
+    python -m bench.datagen --scale 10 --reset
+
+Scale 1 is ~100 products, 2k POs, ~80k stock movements, ~3k invoices and a
+history row per entity (~170k rows in all); scale 10 is ~1.7M rows. Rows go in
+with chunked executemany inserts, and derived data (PO balances, invoice totals,
+daily rollups, the invoice number counter) is written directly so the API sees a consistent
+dataset without replaying it through the handlers.
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, delete, func, select, update
+
+from database import engine, Base
+from migrations import upgrade
+from models import Product, Material, PurchaseOrder, POBalance, StockIN, StockOUT, Invoice, HistoryLog, Counter
+from invoice_numbers import COUNTER_NAME, SEQUENCE_NAME, format_invoice_no
+from versions import VERSION_PREFIX
+from rollups import rebuild_rollups
+from history_store import drop_rotated
+
+CHUNK = 10_000
+
+PRODUCTS_PER_SCALE = 100
+POS_PER_SCALE = 2_000
+MATERIALS_PER_PRODUCT = 5
+INS_PER_PO = 20
+OUTS_PER_PO = 20
+OUTS_PER_INVOICE = 10
+
+
+class ChunkedWriter:
+    """Buffers rows per table and flushes them as executemany inserts.
+
+    Every flush writes all buffers in foreign-key order, so a child chunk never
+    reaches the database before the parent rows it points at.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffers = {}
+        self.counts = {}
+        self.order = {t.name: i for i, t in enumerate(Base.metadata.sorted_tables)}
+
+    def add(self, model, row):
+        buf = self.buffers.setdefault(model, [])
+        buf.append(row)
+        if len(buf) >= CHUNK:
+            self.flush()
+
+    def flush(self):
+        for model in sorted(self.buffers, key=lambda m: self.order[m.__tablename__]):
+            rows = self.buffers[model]
+            if rows:
+                self.conn.execute(insert(model), rows)
+                self.counts[model.__tablename__] = self.counts.get(model.__tablename__, 0) + len(rows)
+                self.buffers[model] = []
+
+
+def _uid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate(conn, scale: float, seed: int = 42, days: int = 730):
+    rng = random.Random(seed)
+    w = ChunkedWriter(conn)
+    start_day = date.today() - timedelta(days=days)
+
+    def history(action, details, ref_type, ref_id, ts):
+        w.add(HistoryLog, dict(ts=ts, action=action, by="Admin", details=details, ref_type=ref_type, ref_id=ref_id))
+
+    products = []
+    for n in range(max(1, int(PRODUCTS_PER_SCALE * scale))):
+        p = dict(id=_uid(rng), name=f"Product {n:06d}", code=f"P{n:06d}", rate=round(rng.uniform(50, 5000), 2), is_active=rng.random() > 0.05)
+        products.append(p)
+        w.add(Product, p)
+        history("Product Created", f"Product {p['name']} ({p['code']}) created", "product", p["id"], datetime.combine(start_day, datetime.min.time()))
+        for m in range(MATERIALS_PER_PRODUCT):
+            mid = _uid(rng)
+            w.add(Material, dict(id=mid, product_id=p["id"], name=f"Material {n}-{m}", is_active=rng.random() > 0.1))
+            history("Material Added", f"Material {n}-{m} added", "material", mid, datetime.combine(start_day, datetime.min.time()))
+
+    invoice_no = 0
+    pending_outs = []  # uninvoiced OUT rows waiting to be grouped into an invoice
+
+    def close_invoice():
+        nonlocal invoice_no
+        if not pending_outs:
+            return
+        invoice_no += 1
+        inv_id = _uid(rng)
+        inv_date = max(o["date"] for o, _ in pending_outs)
+        status = rng.choice(["Draft", "Ready", "Printed", "Printed"])
+        w.add(Invoice, dict(
+            id=inv_id, invoice_no=format_invoice_no(invoice_no), date=inv_date, status=status,
+            print_count=1 if status == "Printed" else 0, line_count=len(pending_outs),
+            total_amount=sum(o["qty"] * rate for o, rate in pending_outs),
+        ))
+        for o, _ in pending_outs:
+            o["invoice_id"] = inv_id
+            w.add(StockOUT, o)
+        history("Invoice Created", f"Invoice {format_invoice_no(invoice_no)} created with {len(pending_outs)} items", "invoice", inv_id, datetime.combine(inv_date, datetime.min.time()))
+        pending_outs.clear()
+
+    for n in range(max(1, int(POS_PER_SCALE * scale))):
+        p = rng.choice(products)
+        po_id = _uid(rng)
+        po_no = f"PO-{n:07d}"
+        created = start_day + timedelta(days=rng.randrange(days - 60))
+        w.add(PurchaseOrder, dict(id=po_id, product_id=p["id"], po_no=po_no, po_qty=INS_PER_PO * 60, created_at=datetime.combine(created, datetime.min.time()), is_active=True))
+        history("PO Created", f"PO {po_no} (Qty {INS_PER_PO * 60}) created", "po", po_id, datetime.combine(created, datetime.min.time()))
+
+        total_in = total_out = 0
+        for _ in range(rng.randint(INS_PER_PO // 2, INS_PER_PO * 3 // 2)):
+            qty = rng.randint(10, 100)
+            total_in += qty
+            d = created + timedelta(days=rng.randrange(30))
+            in_id = _uid(rng)
+            w.add(StockIN, dict(id=in_id, po_id=po_id, date=d, qty=qty, note=None, edited=False))
+            history("Stock IN Added", f"IN Qty {qty} for PO {po_no}", "stock_in", in_id, datetime.combine(d, datetime.min.time()))
+
+        for _ in range(rng.randint(OUTS_PER_PO // 2, OUTS_PER_PO * 3 // 2)):
+            qty = rng.randint(1, 60)
+            if total_out + qty > total_in:
+                break
+            total_out += qty
+            d = created + timedelta(days=30 + rng.randrange(30))
+            out = dict(id=_uid(rng), date=d, product_id=p["id"], po_id=po_id, qty=qty, note=None, invoice_id=None)
+            history("Stock OUT Added", f"OUT Qty {qty} for PO {po_no}", "stock_out", out["id"], datetime.combine(d, datetime.min.time()))
+            if rng.random() < 0.8:
+                pending_outs.append((out, p["rate"]))
+                if len(pending_outs) >= OUTS_PER_INVOICE:
+                    close_invoice()
+            else:
+                w.add(StockOUT, out)
+
+        w.add(POBalance, dict(po_id=po_id, total_in=total_in, total_out=total_out, available=total_in - total_out))
+
+    close_invoice()
+    w.flush()
+    return w.counts, invoice_no
+
+
+def reset(conn):
+    for table in reversed(Base.metadata.sorted_tables):
+        if table is Counter.__table__:
+            # Keep the change versions: they must only ever grow (see versions.py)
+            conn.execute(delete(table).where(Counter.name.not_like(VERSION_PREFIX + "%")))
+        else:
+            conn.execute(delete(table))
+    drop_rotated(conn)
+
+
+def sync_invoice_numbers(conn, last_no: int):
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(f"DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}")  # recreated from MAX(invoice_no) on next use
+        return
+    conn.execute(delete(Counter).where(Counter.name == COUNTER_NAME))
+    conn.execute(insert(Counter).values(name=COUNTER_NAME, value=last_no))
+
+
+def seed(conn, scale: float, seed: int = 42) -> dict:
+    """Generate a dataset plus everything derived from it; returns row counts per table."""
+    counts, last_no = generate(conn, scale, seed=seed)
+    sync_invoice_numbers(conn, last_no)
+    rebuild_rollups(conn)
+    # Invalidate ETags and caches built on the previous data
+    conn.execute(update(Counter).where(Counter.name.like(VERSION_PREFIX + "%")).values(value=Counter.value + 1))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic factory dataset")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="delete all existing rows first")
+    args = parser.parse_args()
+
+    upgrade(engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        if args.reset:
+            reset(conn)
+        elif conn.execute(select(func.count()).select_from(PurchaseOrder)).scalar():
+            raise SystemExit("Database already has data; pass --reset to replace it")
+        counts = seed(conn, args.scale, seed=args.seed)
+
+    total = sum(counts.values())
+    for table, n in sorted(counts.items()):
+        print(f"{table:16} {n:>10,}")
+    print(f"{'total':16} {total:>10,} rows in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Drive each API endpoint at a given concurrency and record latency / throughput.
+
+    python -m bench.driver --clients 50 --seconds 10                # starts uvicorn on DATABASE_URL
+    DB_ASYNC=1 python -m bench.driver --clients 200                 # same, async mode
+    python -m bench.driver --url http://127.0.0.1:8000 --only dashboard,outs
+
+Results are printed and saved as JSON under bench/results/ (see bench.compare).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import httpx
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def _pick(ids):
+    return random.choice(ids) if ids else "missing"
+
+
+# name -> (method, path/body factory). Factories get the sample ids fetched at start-up.
+SCENARIOS = {
+    "products": lambda s: ("GET", "/products/", None),
+    "pos": lambda s: ("GET", "/pos/", None),
+    "outs": lambda s: ("GET", "/outs/", None),
+    "invoices": lambda s: ("GET", "/invoices/", None),
+    "history": lambda s: ("GET", "/history/?limit=100", None),
+    "dashboard": lambda s: ("GET", "/dashboard/", None),
+    "po_ins": lambda s: ("GET", f"/pos/{_pick(s['pos'])}/ins/", None),
+    "invoice_detail": lambda s: ("GET", f"/invoices/{_pick(s['invoices'])}", None),
+    "materials": lambda s: ("GET", f"/products/{_pick(s['products'])}/materials/", None),
+    "create_in": lambda s: ("POST", "/ins/", {"po_id": _pick(s["pos"]), "date": date.today().isoformat(), "qty": 5}),
+    "create_out": lambda s: ("POST", "/outs/", {"product_id": s["po_product"].get(p := _pick(s["pos"]), ""), "po_id": p, "date": date.today().isoformat(), "qty": 1}),
+    "bulk_ins_50": lambda s: ("POST", "/ins/bulk", {"items": [{"po_id": _pick(s["pos"]), "date": date.today().isoformat(), "qty": 1} for _ in range(50)]}),
+}
+
+
+async def _sample_ids(http: httpx.AsyncClient):
+    snap = (await http.get("/dashboard/", params={"limit": 200})).json()
+    return {
+        "products": [p["id"] for p in snap["products"]],
+        "pos": [p["id"] for p in snap["pos"]],
+        "po_product": {p["id"]: p["product_id"] for p in snap["pos"]},
+        "invoices": [i["id"] for i in snap["invoices"]],
+    }
+
+
+async def _worker(http, factory, samples, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        method, path, body = factory(samples)
+        started = time.perf_counter()
+        try:
+            r = await http.request(method, path, json=body)
+            if r.status_code >= 400:
+                errors.append(r.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+def summarize(latencies, errors, seconds):
+    latencies = sorted(latencies)
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / seconds, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+async def run(url: str, scenarios, clients: int, seconds: float):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as http:
+        samples = await _sample_ids(http)
+        results = {}
+        for name in scenarios:
+            latencies, errors = [], []
+            deadline = time.perf_counter() + seconds
+            await asyncio.gather(*(_worker(http, SCENARIOS[name], samples, deadline, latencies, errors) for _ in range(clients)))
+            results[name] = summarize(latencies, errors, seconds)
+            print(f"{name:16} {json.dumps(results[name])}", flush=True)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_server(port: int):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=Path(__file__).resolve().parent.parent,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/products/?limit=1", timeout=1)
+            return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("uvicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API load driver")
+    parser.add_argument("--url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--only", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--out", help="result file (default: bench/results/<timestamp>-<commit>.json)")
+    args = parser.parse_args()
+
+    scenarios = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    proc, url = (None, args.url) if args.url else _start_server(args.port)
+    try:
+        results = asyncio.run(run(url, scenarios, args.clients, args.seconds))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    commit = _git_commit()
+    db_url = os.getenv("DATABASE_URL", "")
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "database": db_url.split("://", 1)[0] if db_url else "default",
+            "async": os.getenv("DB_ASYNC", "0") == "1",
+            "clients": args.clients,
+            "seconds": args.seconds,
+        },
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{report['meta']['timestamp'].replace(':', '')}-{commit or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
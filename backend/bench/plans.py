@@ -0,0 +1,290 @@
+"""Check that every endpoint's SQL is served by indexes, not full table scans.
+
+    python -m bench.plans --scale 0.1          # reset + seed DATABASE_URL, then check
+    python -m bench.plans --verbose --json plans.json
+    python -m pytest tests/test_query_plans.py   # the same check as a test
+
+Drives each route in main.py once through a TestClient (writes included, so
+point DATABASE_URL at a scratch database), records every statement the request
+issued and runs EXPLAIN on it: EXPLAIN QUERY PLAN on SQLite, EXPLAIN (FORMAT
+JSON) with enable_seqscan off on Postgres, where a seeded dataset is too small
+for the planner to prefer an index on its own. A plain scan of a table fails
+the run unless ALLOWED_SCANS lists it; index and covering-index scans pass.
+"""
+import argparse
+import json
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, inspect, select
+
+from bench.datagen import reset, seed
+from database import SessionLocal, engine
+from migrations import upgrade
+from pagination import NEXT_CURSOR_HEADER
+from models import Invoice, Material, PurchaseOrder, StockIN, StockOUT
+
+# (step, table) -> why reading the whole table is the point of the query
+ALLOWED_SCANS = {
+    ("GET /sync", "products"): "full snapshot",
+    ("GET /sync", "materials"): "full snapshot",
+    ("GET /sync", "purchase_orders"): "full snapshot",
+    ("GET /sync", "stock_ins"): "full snapshot",
+    ("GET /sync", "stock_outs"): "full snapshot",
+    ("GET /sync", "invoices"): "full snapshot",
+    ("POST /products/", "products"): "catalog.py loads the product index (capped) after a product write",
+    ("POST /import/pos", "products"): "code -> id lookup map, loaded once per file",
+    ("POST /import/movements", "purchase_orders"): "po_no lookup map, loaded once per file",
+}
+
+DML = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+class Recorder:
+    """Collects the statements run on the engine while a step is active."""
+
+    def __init__(self):
+        self.steps = {}  # step -> [(statement, parameters)]
+        self._current = None
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current is not None and DML.match(statement):
+            self._current.append((statement, parameters[0] if executemany else parameters))
+
+    @contextmanager
+    def step(self, name: str):
+        self._current = self.steps.setdefault(name, [])
+        try:
+            yield
+        finally:
+            self._current = None
+
+
+def explain(conn, statement: str, parameters):
+    """(plan lines, fully scanned tables) for one statement."""
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, scans = [], []
+
+        def walk(node, depth):
+            relation = node.get("Relation Name")
+            lines.append("  " * depth + " ".join(filter(None, [node["Node Type"], relation, node.get("Index Name")])))
+            if node["Node Type"] == "Seq Scan":
+                scans.append(relation)
+            for child in node.get("Plans", ()):
+                walk(child, depth + 1)
+
+        walk(plan[0]["Plan"], 0)
+        return lines, scans
+
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    lines = [detail for _, _, _, detail in rows]
+    return lines, [m.group(1) for m in map(SQLITE_SCAN.match, lines) if m]
+
+
+def _ok(response):
+    if response.status_code >= 400:
+        raise SystemExit(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:500]}")
+    return response
+
+
+def _samples() -> dict:
+    """Ids of existing rows for the routes that act on one, read outside any step."""
+    db = SessionLocal()
+    try:
+        po = db.query(PurchaseOrder).filter(PurchaseOrder.is_active == True).join(StockIN).order_by(PurchaseOrder.id).first()
+        return {
+            "po_id": po.id,
+            "product": {"id": po.product.id, "name": po.product.name, "code": po.product.code, "rate": po.product.rate},
+            "invoice_id": db.query(Invoice.id).join(StockOUT).order_by(Invoice.id).limit(1).scalar(),
+            "material_product_id": db.query(Material.product_id).filter(Material.is_active == True).order_by(Material.id).limit(1).scalar(),
+            "uninvoiced_day": db.query(func.max(StockOUT.date)).filter(StockOUT.invoice_id == None).scalar() or date.today(),
+        }
+    finally:
+        db.close()
+
+
+def drive(client: TestClient, recorder: Recorder):
+    """Call every route once (twice where a parameter switches to another query)."""
+    step = recorder.step
+    s = _samples()
+    sample_product, inv_id = s["product"], s["invoice_id"]
+    today = date.today().isoformat()
+    tag = uuid.uuid4().hex[:8]
+
+    # List routes: first page, then the cursor page
+    for path in ("/products/", "/pos/", "/outs/", "/invoices/", "/history/"):
+        with step(f"GET {path}"):
+            r = _ok(client.get(path, params={"limit": 2}))
+        with step(f"GET {path}?cursor"):
+            _ok(client.get(path, params={"limit": 2, "cursor": r.headers[NEXT_CURSOR_HEADER]}))
+
+    # Products / materials
+    with step("POST /products/"):
+        product = _ok(client.post("/products/", json={"name": f"Plan {tag}", "code": f"PLAN-{tag}", "rate": 10})).json()
+    with step("PUT /products/{id} rate"):
+        _ok(client.put(f"/products/{sample_product['id']}", json={**sample_product, "rate": sample_product["rate"] + 1}))
+    with step("PUT /products/{id} rename"):
+        _ok(client.put(f"/products/{sample_product['id']}", json={**sample_product, "name": f"{sample_product['name']} {tag}", "rate": sample_product["rate"] + 1}))
+    with step("POST /materials/"):
+        material = _ok(client.post("/materials/", json={"product_id": s["material_product_id"], "name": f"Plan {tag}"})).json()
+    with step("GET /products/{id}/materials/"):
+        _ok(client.get(f"/products/{s['material_product_id']}/materials/"))
+    with step("DELETE /materials/{id}"):
+        _ok(client.delete(f"/materials/{material['id']}"))
+
+    # POs and movements
+    with step("POST /pos/"):
+        new_po = _ok(client.post("/pos/", json={"product_id": product["id"], "po_no": f"PLAN-{tag}", "po_qty": 100})).json()
+    with step("GET /pos/{id}/ins/"):
+        _ok(client.get(f"/pos/{s['po_id']}/ins/"))
+    with step("POST /ins/"):
+        stock_in = _ok(client.post("/ins/", json={"po_id": new_po["id"], "date": today, "qty": 50})).json()
+    with step("POST /ins/bulk"):
+        _ok(client.post("/ins/bulk", json={"items": [{"po_id": new_po["id"], "date": today, "qty": 1}] * 10}))
+    with step("PUT /ins/{id}"):
+        _ok(client.put(f"/ins/{stock_in['id']}", json={"po_id": new_po["id"], "date": today, "qty": 40}))
+    with step("POST /outs/"):
+        _ok(client.post("/outs/", json={"product_id": product["id"], "po_id": new_po["id"], "date": today, "qty": 2}))
+    with step("POST /outs/bulk"):
+        outs = _ok(client.post("/outs/bulk", json={"items": [{"product_id": product["id"], "po_id": new_po["id"], "date": today, "qty": 1}] * 10})).json()
+    extra = _ok(client.post("/ins/", json={"po_id": new_po["id"], "date": today, "qty": 1})).json()
+    with step("DELETE /ins/{id}"):
+        _ok(client.delete(f"/ins/{extra['id']}"))
+
+    # Invoices
+    with step("POST /invoices/"):
+        new_inv = _ok(client.post("/invoices/", json={"out_ids": [o["id"] for o in outs[:5]]})).json()
+    with step("POST /invoices/{id}/items"):
+        _ok(client.post(f"/invoices/{new_inv['id']}/items", json={"out_ids": [o["id"] for o in outs[5:]]}))
+    with step("DELETE /invoices/{id}/items/{out_id}"):
+        _ok(client.delete(f"/invoices/{new_inv['id']}/items/{outs[0]['id']}"))
+    with step("PUT /invoices/{id}/status"):
+        _ok(client.put(f"/invoices/{inv_id}/status", params={"status_val": "Ready"}))
+    with step("GET /invoices/{id}"):
+        _ok(client.get(f"/invoices/{inv_id}"))
+    with step("GET /invoices/{id}/document"):
+        _ok(client.get(f"/invoices/{new_inv['id']}/document"))
+    with step("POST /invoices/documents"):
+        _ok(client.post("/invoices/documents", json={"invoice_ids": [inv_id, new_inv["id"]]}))
+    day = s["uninvoiced_day"]
+    batch = {"date_from": (day - timedelta(days=7)).isoformat(), "date_to": day.isoformat(), "group_by": "po"}
+    with step("POST /invoices/batch dry_run"):
+        _ok(client.post("/invoices/batch", json={**batch, "dry_run": True}))
+    with step("POST /invoices/batch"):
+        _ok(client.post("/invoices/batch", json=batch))
+
+    # Reads across tables
+    with step("GET /dashboard/"):
+        _ok(client.get("/dashboard/"))
+    with step("GET /dashboard/?product_id"):
+        _ok(client.get("/dashboard/", params={"product_id": sample_product["id"], "po_status": "open"}))
+    since = (date.today() - timedelta(days=30)).isoformat()
+    with step("GET /reports/movements"):
+        _ok(client.get("/reports/movements", params={"date_from": since, "granularity": "week"}))
+    with step("GET /reports/movements?po_id"):
+        _ok(client.get("/reports/movements", params={"date_from": since, "group_by": "po", "po_id": s["po_id"]}))
+    with step("GET /sync"):
+        watermark = _ok(client.get("/sync")).json()["watermark"]
+    with step("GET /sync?since"):
+        _ok(client.get("/sync", params={"since": watermark}))
+    with step("GET /search"):
+        _ok(client.get("/search", params={"q": sample_product["code"][:3]}))
+    with step("GET /history/search"):
+        _ok(client.get("/history/search", params={"ref_type": "invoice", "ref_id": inv_id, "include_archived": False}))
+    with step("GET /history/search?date"):
+        _ok(client.get("/history/search", params={"date_from": since, "limit": 50, "include_archived": False}))
+    for dataset in ("stock-ins", "stock-outs", "invoices", "history"):
+        with step(f"GET /export/{dataset}"):
+            _ok(client.get(f"/export/{dataset}"))
+        with step(f"GET /export/{dataset}?date"):
+            _ok(client.get(f"/export/{dataset}", params={"date_from": since}))
+    with step("POST /import/pos"):
+        _ok(client.post("/import/pos", content=f"po_no,product_code,po_qty\nPLAN-{tag}-I,{product['code']},10\n"))
+    with step("POST /import/movements"):
+        _ok(client.post("/import/movements", content=f"type,po_no,date,qty\nIN,PLAN-{tag}-I,{today},5\nOUT,PLAN-{tag}-I,{today},2\n"))
+
+    # Soft deletes last, so the steps above see the sample rows
+    with step("DELETE /products/{id}"):
+        _ok(client.delete(f"/products/{product['id']}"))
+
+
+def check(recorder: Recorder):
+    """Explain every recorded statement; returns ({step: [entry]}, failures)."""
+    tables = set(inspect(engine).get_table_names())  # catalog lookups (sqlite_master, ...) don't count
+    report, failures = {}, []
+    with engine.connect() as conn:
+        for name, statements in recorder.steps.items():
+            entries = report[name] = []
+            unique = {}
+            for statement, parameters in statements:
+                unique.setdefault(statement, parameters)
+            for statement, parameters in unique.items():
+                with conn.begin() as trans:
+                    lines, scans = explain(conn, statement, parameters)
+                    trans.rollback()
+                scans = sorted({t for t in scans if t in tables})
+                entries.append({"sql": " ".join(statement.split()), "plan": lines, "full_scans": scans})
+                failures += [(name, t, statement) for t in scans if (name, t) not in ALLOWED_SCANS]
+    return report, failures
+
+
+def _print(report, verbose: bool):
+    for name, entries in report.items():
+        scanned = sorted({t for e in entries for t in e["full_scans"]})
+        bad = [t for t in scanned if (name, t) not in ALLOWED_SCANS]
+        status = f"FULL SCAN: {', '.join(bad)}" if bad else f"ok (allowed scan: {', '.join(scanned)})" if scanned else "ok"
+        print(f"{name:40} {len(entries):>3} statements  {status}")
+        if verbose:
+            for e in entries:
+                print("    " + e["sql"][:160])
+                for line in e["plan"]:
+                    print("        " + line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, help="reset the database and seed a dataset of this scale first")
+    parser.add_argument("--verbose", action="store_true", help="print every statement with its plan")
+    parser.add_argument("--json", help="write the plans to this file (to diff between runs)")
+    args = parser.parse_args()
+
+    upgrade(engine)
+    if args.scale:
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            reset(conn)
+            seed(conn, args.scale)
+        print(f"seeded scale {args.scale} in {time.perf_counter() - started:.1f}s")
+    with engine.connect() as conn:
+        if not conn.execute(select(func.count()).select_from(StockOUT)).scalar():
+            raise SystemExit("Database is empty; pass --scale to seed it")
+
+    import main as app_main
+
+    recorder = Recorder()
+    drive(TestClient(app_main.app), recorder)
+    report, failures = check(recorder)
+    _print(report, args.verbose)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+    print(f"{sum(map(len, report.values()))} statements explained in {len(report)} steps")
+    if failures:
+        print(f"{len(failures)} statement(s) fall back to a full table scan:")
+        for name, table, statement in failures:
+            print(f"  {name}: {table}: {' '.join(statement.split())[:200]}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
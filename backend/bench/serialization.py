@@ -0,0 +1,80 @@
+"""Time list responses through the ORM + response_model path and the projected fast path.
+
+    python -m bench.serialization --rows 10000
+
+"before" is what FastAPI does with ORM objects returned under a response_model:
+validate each one (from_attributes), dump to JSON-able Python and encode with
+the stdlib json module. "after" is serialization.Projection + FastJSONResponse.
+Both bodies must be byte-identical; the run fails otherwise.
+"""
+import argparse
+import statistics
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import schemas
+from database import SessionLocal, engine
+from history_store import history_source
+from migrations import upgrade
+from models import Invoice, Product, PurchaseOrder, StockOUT
+from serialization import FastJSONResponse, Projection, orjson
+
+# name -> (schema, source, sort columns); history is resolved per session
+DATASETS = {
+    "stock_outs": (schemas.StockOUT, StockOUT, lambda src: [StockOUT.date.desc(), StockOUT.id.desc()]),
+    "purchase_orders": (schemas.PurchaseOrder, PurchaseOrder, lambda src: [PurchaseOrder.id]),
+    "invoices": (schemas.Invoice, Invoice, lambda src: [Invoice.date.desc(), Invoice.id.desc()]),
+    "products": (schemas.Product, Product, lambda src: [Product.id]),
+    "history": (schemas.HistoryLog, None, lambda src: [src.c.ts.desc(), src.c.id.desc()]),
+}
+
+
+def _before(db, schema, source, order, rows):
+    objs = db.query(source).order_by(*order).limit(rows).all()
+    adapter = TypeAdapter(List[schema])
+    return JSONResponse(adapter.dump_python(adapter.validate_python(objs, from_attributes=True), mode="json")).body
+
+
+def _after(db, schema, source, order, rows):
+    projection = Projection(schema, source)
+    return FastJSONResponse(projection.dicts(db.query(*projection.columns).order_by(*order).limit(rows).all())).body
+
+
+def _time(fn, name, rows, repeat):
+    schema, source, order = DATASETS[name]
+    timings, body = [], None
+    for _ in range(repeat):
+        db = SessionLocal()  # fresh session: no identity map carried between runs
+        try:
+            src = source if source is not None else history_source(db)
+            started = time.perf_counter()
+            body = fn(db, schema, src, order(src), rows)
+            timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            db.close()
+    return statistics.median(timings), body
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", choices=sorted(DATASETS), action="append")
+    args = parser.parse_args()
+
+    upgrade(engine)
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib json'}")
+    print(f"{'dataset':16} {'rows':>6} {'before ms':>10} {'after ms':>10} {'speedup':>8}  body")
+    failed = False
+    for name in args.only or DATASETS:
+        before_ms, before = _time(_before, name, args.rows, args.repeat)
+        after_ms, after = _time(_after, name, args.rows, args.repeat)
+        same = before == after
+        failed |= not same
+        count = before.count(b'"id":')
+        print(f"{name:16} {count:>6} {before_ms:>10.1f} {after_ms:>10.1f} {before_ms / after_ms:>7.1f}x  {'identical' if same else 'DIFFERENT'}")
+    if failed:
+        raise SystemExit(1)
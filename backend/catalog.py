@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Product, Material
+from versions import read_versions
+
+# Products are cached as one complete snapshot (so "code not taken" can be answered
+# from memory) up to CATALOG_MAX_PRODUCTS; beyond that lookups go to the database,
+# and the cache only remembers that it is over the cap until the products change.
+CATALOG_MAX_PRODUCTS = int(os.getenv("CATALOG_MAX_PRODUCTS", "50000"))
+# Material lists are cached per product, least recently used evicted first
+CATALOG_MAX_MATERIAL_LISTS = int(os.getenv("CATALOG_MAX_MATERIAL_LISTS", "1000"))
+# How often readers re-check the table versions for writes made by other workers
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "1.0"))
+
+
+class CachedProduct:
+    __slots__ = ("id", "name", "code", "rate", "is_active")
+
+    def __init__(self, id, name, code, rate, is_active):
+        self.id, self.name, self.code, self.rate, self.is_active = id, name, code, rate, is_active
+
+    @classmethod
+    def of(cls, p):
+        return cls(p.id, p.name, p.code, p.rate, p.is_active)
+
+
+_OVER_CAP = ()  # _products when the catalogue is too large to snapshot
+
+
+class CachedMaterial:
+    __slots__ = ("id", "product_id", "name", "is_active")
+
+    def __init__(self, id, product_id, name, is_active):
+        self.id, self.product_id, self.name, self.is_active = id, product_id, name, is_active
+
+    @classmethod
+    def of(cls, m):
+        return cls(m.id, m.product_id, m.name, m.is_active)
+
+
+class CatalogCache:
+    """In-process cache of products (by id, code and name) and active materials per product.
+
+    Entries are immutable snapshots, safe to share between threads. Writes made
+    through this process are applied when they commit (write-through); writes from
+    other workers are noticed through the products/materials change versions,
+    re-read at most every check_interval seconds, or immediately with force=True.
+    """
+
+    def __init__(self, max_products: int = CATALOG_MAX_PRODUCTS, max_material_lists: int = CATALOG_MAX_MATERIAL_LISTS, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.max_products = max_products
+        self.max_material_lists = max_material_lists
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._versions = {}      # table -> version the cached data is at least as new as
+        self._generation = 0     # bumped on every invalidation, so in-flight loads don't store stale data
+        self._products = None    # id -> CachedProduct; None = not loaded, _OVER_CAP = too many to cache
+        self._by_code = {}
+        self._by_name = {}
+        self._materials = OrderedDict()  # product_id -> tuple of active CachedMaterial
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    # --- version checks ---
+    def sync(self, db: Session, force: bool = False):
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        current = read_versions(db, ("products", "materials"))
+        with self._lock:
+            self._checked_at = now
+            if current.get("products") != self._versions.get("products"):
+                self._drop_products()
+            if current.get("materials") != self._versions.get("materials"):
+                self._drop_materials()
+            self._versions = current
+
+    def _drop_products(self):
+        if self._products is not None:
+            self.stats["invalidations"] += 1
+        self._generation += 1
+        self._products = None
+        self._by_code, self._by_name = {}, {}
+
+    def _drop_materials(self):
+        if self._materials:
+            self.stats["invalidations"] += 1
+        self._generation += 1
+        self._materials.clear()
+
+    # --- products ---
+    def _product_index(self, db: Session):
+        """(by id, by code, by name), or None when the catalogue is over max_products."""
+        with self._lock:
+            if self._products is _OVER_CAP:
+                return None
+            if self._products is not None:
+                self.stats["hits"] += 1
+                return self._products, self._by_code, self._by_name
+            self.stats["misses"] += 1
+            generation = self._generation
+
+        rows = db.query(Product.id, Product.name, Product.code, Product.rate, Product.is_active).limit(self.max_products + 1).all()
+        if len(rows) > self.max_products:
+            with self._lock:
+                if generation == self._generation:
+                    self._products = _OVER_CAP  # until the products version moves
+            return None
+        products = {row.id: CachedProduct(*row) for row in rows}
+        by_code = {p.code: p for p in products.values()}
+        by_name = {p.name: p for p in products.values()}
+        with self._lock:
+            if generation == self._generation:
+                self._products, self._by_code, self._by_name = products, by_code, by_name
+        return products, by_code, by_name
+
+    def product_by_code(self, db: Session, code: str):
+        self.sync(db)
+        index = self._product_index(db)
+        if index is None:
+            p = db.query(Product).filter(Product.code == code).first()
+            return CachedProduct.of(p) if p else None
+        return index[1].get(code)
+
+    def product_by_name(self, db: Session, name: str):
+        self.sync(db)
+        index = self._product_index(db)
+        if index is None:
+            p = db.query(Product).filter(Product.name == name).first()
+            return CachedProduct.of(p) if p else None
+        return index[2].get(name)
+
+    def rates(self, db: Session, product_ids) -> dict:
+        self.sync(db)
+        index = self._product_index(db)
+        if index is None:
+            return dict(db.query(Product.id, Product.rate).filter(Product.id.in_(set(product_ids))).all())
+        return {pid: index[0][pid].rate for pid in product_ids if pid in index[0]}
+
+    # --- materials ---
+    def materials(self, db: Session, product_id: str):
+        self.sync(db)
+        with self._lock:
+            cached = self._materials.get(product_id)
+            if cached is not None:
+                self._materials.move_to_end(product_id)
+                self.stats["hits"] += 1
+                return cached
+            self.stats["misses"] += 1
+            generation = self._generation
+
+        rows = db.query(Material).filter(Material.product_id == product_id, Material.is_active == True).all()
+        mats = tuple(CachedMaterial.of(m) for m in rows)
+        with self._lock:
+            if generation == self._generation:
+                self._store_materials(product_id, mats)
+        return mats
+
+    def _store_materials(self, product_id, mats):
+        self._materials[product_id] = mats
+        self._materials.move_to_end(product_id)
+        while len(self._materials) > self.max_material_lists:
+            self._materials.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # --- write-through ---
+    def product_written(self, db: Session, product, version):
+        """Queue a product write made in db's transaction; applied to the cache once it commits."""
+        db.info.setdefault("catalog_writes", []).append((self._apply_product, CachedProduct.of(product), version))
+
+    def material_written(self, db: Session, material, version):
+        db.info.setdefault("catalog_writes", []).append((self._apply_material, CachedMaterial.of(material), version))
+
+    def _advance(self, table: str, version) -> bool:
+        """True if `version` directly follows the cached one, i.e. no other worker wrote in between."""
+        current = self._versions.get(table)
+        if version is None or current is None or version != current + 1:
+            return False
+        self._versions[table] = version
+        return True
+
+    def _apply_product(self, product: CachedProduct, version):
+        with self._lock:
+            if self._products is None or not self._advance("products", version):
+                self._drop_products()
+                return
+            if self._products is _OVER_CAP:
+                return  # still over the cap, and nothing is cached to update
+            self._generation += 1
+            # Copy-on-write, so readers holding the previous dicts keep a consistent view
+            products, by_code, by_name = dict(self._products), dict(self._by_code), dict(self._by_name)
+            old = products.get(product.id)
+            if old is not None:
+                if by_code.get(old.code) is old:
+                    del by_code[old.code]
+                if by_name.get(old.name) is old:
+                    del by_name[old.name]
+            products[product.id] = by_code[product.code] = by_name[product.name] = product
+            self._products, self._by_code, self._by_name = products, by_code, by_name
+
+    def _apply_material(self, material: CachedMaterial, version):
+        with self._lock:
+            if not self._advance("materials", version):
+                self._drop_materials()
+                return
+            self._generation += 1
+            cached = self._materials.get(material.product_id)
+            if cached is not None:
+                mats = tuple(m for m in cached if m.id != material.id)
+                if material.is_active:
+                    mats += (material,)
+                self._store_materials(material.product_id, mats)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "products": len(self._products) if self._products else 0,
+                "over_cap": self._products is _OVER_CAP,
+                "material_lists": len(self._materials),
+                "versions": dict(self._versions),
+            }
+
+
+catalog = CatalogCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_catalog_writes(session):
+    for apply, snapshot, version in session.info.pop("catalog_writes", ()):
+        apply(snapshot, version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_writes(session):
+    session.info.pop("catalog_writes", None)
@@ -0,0 +1,350 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Invoice, Product, PurchaseOrder, StockOUT
+from async_mode import run_blocking
+
+try:
+    from weasyprint import HTML
+except (ImportError, OSError):  # optional (requirements-pdf.txt); OSError when pango is missing. HTML works without it
+    HTML = None
+
+INVOICE_RENDER_DIR = os.getenv("INVOICE_RENDER_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_cache"))
+INVOICE_RENDER_CACHE_MB = float(os.getenv("INVOICE_RENDER_CACHE_MB", "200"))
+# Worker processes for bulk PDF renders (0 = render in-process). HTML is cheaper
+# to render than to ship to a worker and back, so it always renders in-process.
+INVOICE_RENDER_WORKERS = int(os.getenv("INVOICE_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Smaller PDF batches render in-process too
+INVOICE_RENDER_POOL_MIN = int(os.getenv("INVOICE_RENDER_POOL_MIN", "4"))
+# Bump when the template changes, so documents cached by older code are re-rendered
+RENDER_VERSION = 1
+
+FORMATS = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+SELLER = ("Samara Industry", "C/135,1, Welangalla, Gataheththa.")
+BUYER = ("OREL Corporation", "NO.76, Orel Park, Artigala Road,\nMeegoda, Sri Lanka.")
+
+
+class RenderUnavailable(Exception):
+    pass
+
+
+# --- Data ---
+def _items_query():
+    return (
+        select(
+            StockOUT.invoice_id, StockOUT.date, StockOUT.qty, Product.name, Product.code, Product.rate, PurchaseOrder.po_no,
+        )
+        .join(Product, Product.id == StockOUT.product_id)
+        .join(PurchaseOrder, PurchaseOrder.id == StockOUT.po_id)
+        .order_by(StockOUT.invoice_id, StockOUT.date, StockOUT.id)
+    )
+
+
+def document_data(db: Session, invoices) -> dict:
+    """Everything the template needs for these invoices as plain data (one query), keyed by invoice id."""
+    data = {
+        inv.id: dict(id=inv.id, invoice_no=inv.invoice_no, date=inv.date.isoformat(), content_version=inv.content_version or 0, items=[])
+        for inv in invoices
+    }
+    if data:
+        for invoice_id, day, qty, name, code, rate, po_no in db.execute(_items_query().where(StockOUT.invoice_id.in_(data))):
+            data[invoice_id]["items"].append(dict(date=day.isoformat(), qty=qty, product_name=name, product_code=code, rate=rate, po_no=po_no))
+    return data
+
+
+# --- Rendering (runs in worker processes: plain data in, bytes out) ---
+_CSS = """
+@page { size: A4; margin: 16mm 14mm; }
+body { font-family: Helvetica, Arial, sans-serif; font-size: 10pt; color: #111; }
+h1 { font-size: 18pt; margin: 0 0 2mm; }
+.meta { color: #555; margin-bottom: 8mm; }
+.parties { display: flex; justify-content: space-between; margin-bottom: 8mm; }
+.parties .to { text-align: right; }
+.label { font-size: 8pt; text-transform: uppercase; letter-spacing: .05em; color: #666; font-weight: bold; }
+.name { font-size: 12pt; font-weight: bold; }
+table { width: 100%; border-collapse: collapse; }
+th, td { padding: 1.5mm 2mm; border-bottom: 1px solid #ddd; text-align: left; }
+th { background: #f3f4f6; font-size: 8.5pt; }
+thead { display: table-header-group; }
+tr { page-break-inside: avoid; }
+.num { text-align: right; font-variant-numeric: tabular-nums; }
+tfoot td { font-weight: bold; border-top: 2px solid #111; border-bottom: none; }
+"""
+
+
+def _money(value) -> str:
+    return f"{value:,.2f}"
+
+
+def _party(label: str, party, css: str) -> str:
+    name, address = party
+    return f'<div class="{css}"><div class="label">{label}</div><div class="name">{escape(name)}</div><div>{escape(address).replace(chr(10), "<br>")}</div></div>'
+
+
+def render_html(doc: dict) -> str:
+    rows = []
+    total = 0.0
+    for item in doc["items"]:
+        amount = item["qty"] * item["rate"]
+        total += amount
+        rows.append(
+            f"<tr><td>{escape(item['date'])}</td><td>{escape(item['product_name'])}</td><td>{escape(item['product_code'])}</td>"
+            f"<td>{escape(item['po_no'])}</td><td class=\"num\">{item['qty']}</td><td class=\"num\">{_money(item['rate'])}</td>"
+            f"<td class=\"num\">{_money(amount)}</td></tr>"
+        )
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Invoice {escape(doc['invoice_no'])}</title>"
+        f"<style>{_CSS}</style></head><body>"
+        f"<h1>Invoice {escape(doc['invoice_no'])}</h1><div class=\"meta\">Date: {escape(doc['date'])} &middot; {len(doc['items'])} item(s)</div>"
+        f"<div class=\"parties\">{_party('From', SELLER, 'from')}{_party('To', BUYER, 'to')}</div>"
+        "<table><thead><tr><th>Date</th><th>Product</th><th>Code</th><th>PO No</th><th class=\"num\">Qty</th>"
+        "<th class=\"num\">Rate</th><th class=\"num\">Amount</th></tr></thead>"
+        f"<tbody>{''.join(rows)}</tbody>"
+        f"<tfoot><tr><td colspan=\"6\">Total</td><td class=\"num\">{_money(total)}</td></tr></tfoot></table>"
+        "</body></html>"
+    )
+
+
+def render_document(doc: dict, fmt: str) -> bytes:
+    html = render_html(doc)
+    if fmt == "pdf":
+        if HTML is None:
+            raise RenderUnavailable("PDF rendering needs weasyprint")
+        return HTML(string=html).write_pdf()
+    return html.encode("utf-8")
+
+
+def _render_job(args):
+    doc, fmt = args
+    return render_document(doc, fmt)
+
+
+# --- Cache ---
+class RenderCache:
+    """Rendered documents on disk, one file per (invoice, content version, format).
+
+    A file never changes once written: editing an invoice's lines bumps its
+    content_version, which names a new file (the old one is removed). Status
+    changes and print counts don't touch the content version, so reprints are
+    cache hits. Least recently served files go first when the directory
+    outgrows max_bytes; several processes can share the directory.
+
+    Writes keep a running total of the directory size instead of scanning it:
+    the first write (and each write that takes the total over max_bytes) runs
+    tidy(), which rescans and resets the total, so other processes' writes
+    are picked up there.
+    """
+
+    def __init__(self, directory: str = INVOICE_RENDER_DIR, max_bytes: int = int(INVOICE_RENDER_CACHE_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0  # superseded versions removed
+        self._bytes = None  # running directory size; None until the first tidy()
+
+    def _path(self, invoice_id: str, content_version: int, fmt: str) -> str:
+        return os.path.join(self.directory, f"{invoice_id}.{content_version}.r{RENDER_VERSION}.{fmt}")
+
+    def get(self, invoice_id: str, content_version: int, fmt: str):
+        path = self._path(invoice_id, content_version, fmt)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-served time for eviction
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return body
+
+    def size(self, invoice_id: str, content_version: int, fmt: str):
+        """Size of the cached document, None when it isn't cached."""
+        return _size(self._path(invoice_id, content_version, fmt))
+
+    def put(self, invoice_id: str, content_version: int, fmt: str, body: bytes, tidy: bool = True):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(invoice_id, content_version, fmt)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        replaced = _size(path) or 0
+        os.replace(tmp, path)  # readers never see a partial file
+        # the usual supersede is one version back; tidy() catches any others
+        previous = self._path(invoice_id, content_version - 1, fmt)
+        superseded = _size(previous)
+        if superseded is not None and _remove(previous):
+            with self._lock:
+                self.invalidations += 1
+        else:
+            superseded = 0
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(body) - replaced - superseded
+        if tidy:
+            self.maybe_tidy()
+
+    def maybe_tidy(self):
+        """tidy() when the running total is unknown or over max_bytes."""
+        with self._lock:
+            over = self._bytes is None or self._bytes > self.max_bytes
+        if over:
+            self.tidy()
+
+    def tidy(self):
+        """Drop superseded versions, then the least recently served files while over max_bytes (one scan)."""
+        newest = {}
+        files = []
+        for entry in os.scandir(self.directory):
+            parts = entry.name.split(".")
+            if len(parts) != 4:  # {invoice_id}.{content_version}.r{RENDER_VERSION}.{fmt}; skips temp files
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            invoice_id, version, render_version, fmt = parts
+            key = (invoice_id, fmt)
+            rank = (render_version == f"r{RENDER_VERSION}", int(version))
+            files.append((st.st_mtime, st.st_size, entry.path, key, rank))
+            newest[key] = max(newest.get(key, rank), rank)
+
+        total = 0
+        live = []
+        for f in files:
+            if f[4] < newest[f[3]]:
+                if _remove(f[2]):
+                    with self._lock:
+                        self.invalidations += 1
+            else:
+                total += f[1]
+                live.append(f)
+        for _, size, path, _, _ in sorted(live):
+            if total <= self.max_bytes:
+                break
+            if _remove(path):
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+        with self._lock:
+            self._bytes = total
+
+    def snapshot(self) -> dict:
+        sizes = []
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                try:
+                    sizes.append(entry.stat().st_size)
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            return {
+                "files": len(sizes),
+                "bytes": sum(sizes),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _size(path: str):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+render_cache = RenderCache()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: a forked worker would inherit (and on exit close) the parent's DB connections
+            _pool = ProcessPoolExecutor(max_workers=INVOICE_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _render_jobs(jobs, fmt: str) -> list:
+    """Render (doc, fmt) jobs; PDF batches above INVOICE_RENDER_POOL_MIN go to the worker pool."""
+    if fmt != "pdf" or INVOICE_RENDER_WORKERS < 1 or len(jobs) <= INVOICE_RENDER_POOL_MIN:
+        return [_render_job(job) for job in jobs]
+    return list(_render_pool().map(_render_job, jobs, chunksize=max(1, len(jobs) // (INVOICE_RENDER_WORKERS * 4))))
+
+
+def _check_format(fmt: str):
+    if fmt == "pdf" and HTML is None:
+        raise RenderUnavailable("PDF rendering needs weasyprint")
+
+
+def invoice_document(db: Session, inv: Invoice, fmt: str = "html"):
+    """(body, cached) for one invoice: from the cache, else rendered here and stored."""
+    _check_format(fmt)
+    version = inv.content_version or 0
+    body = render_cache.get(inv.id, version, fmt)
+    if body is not None:
+        return body, True
+    doc = document_data(db, [inv])[inv.id]
+    body = run_blocking(render_document, doc, fmt)
+    render_cache.put(inv.id, version, fmt, body)
+    return body, False
+
+
+def render_invoices(db: Session, invoices, fmt: str = "html") -> list:
+    """Make sure every invoice has a cached document; missing PDFs render in the worker pool.
+
+    Returns (invoice, size, cached) per invoice.
+    """
+    _check_format(fmt)
+    results = {}
+    missing = []
+    for inv in invoices:
+        size = render_cache.size(inv.id, inv.content_version or 0, fmt)
+        if size is not None:
+            results[inv.id] = (inv, size, True)
+        else:
+            missing.append(inv)
+    if missing:
+        docs = document_data(db, missing)
+        jobs = [(docs[inv.id], fmt) for inv in missing]
+        bodies = run_blocking(_render_jobs, jobs, fmt)
+        for inv, body in zip(missing, bodies):
+            render_cache.put(inv.id, inv.content_version or 0, fmt, body, tidy=False)
+            results[inv.id] = (inv, len(body), False)
+        render_cache.maybe_tidy()
+    return [results[inv.id] for inv in invoices]
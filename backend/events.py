@@ -0,0 +1,227 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per client before it is considered too slow and told to resync
+CHANGE_FEED_BUFFER = int(os.getenv("CHANGE_FEED_BUFFER", "100"))
+CHANGE_FEED_HEARTBEAT = float(os.getenv("CHANGE_FEED_HEARTBEAT", "15"))
+# Fan events out across uvicorn workers through Postgres LISTEN/NOTIFY
+CHANGE_FEED_PG_NOTIFY = os.getenv("CHANGE_FEED_PG_NOTIFY", "0") == "1"
+NOTIFY_CHANNEL = "samara_changes"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more; bigger events are cut down in emit()
+CHANGE_FEED_MAX_PAYLOAD = int(os.getenv("CHANGE_FEED_MAX_PAYLOAD", "7900"))
+
+RESYNC = json.dumps({"type": "resync"})
+
+
+class Subscription:
+    __slots__ = ("queue",)
+
+    def __init__(self, maxsize: int):
+        self.queue = asyncio.Queue(maxsize)
+
+
+class Broker:
+    """Fans change events out to the subscribers on the event loop.
+
+    publish() may be called from any thread. Each subscriber has a bounded
+    queue; one that falls behind loses its backlog and gets a single "resync"
+    event instead, so a stuck client never holds more than buffer_size events.
+    """
+
+    def __init__(self, buffer_size: int = CHANGE_FEED_BUFFER):
+        self.buffer_size = buffer_size
+        self._subs = set()
+        self._loop = None
+        self._ids = itertools.count(1)
+        self.stats = {"published": 0, "dropped": 0, "resyncs": 0}
+
+    def subscribe(self) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(self.buffer_size)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subs.discard(sub)
+
+    def publish(self, events):
+        loop = self._loop
+        if loop is None or not self._subs:
+            return
+        try:
+            loop.call_soon_threadsafe(self._deliver, events)
+        except RuntimeError:
+            pass  # loop closed during shutdown
+
+    def _deliver(self, events):
+        for ev in events:
+            item = (next(self._ids), json.dumps(ev, default=str))
+            self.stats["published"] += 1
+            for sub in self._subs:
+                if sub.queue.full():
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                        self.stats["dropped"] += 1
+                    sub.queue.put_nowait((item[0], RESYNC))
+                    self.stats["resyncs"] += 1
+                else:
+                    sub.queue.put_nowait(item)
+
+    def snapshot(self) -> dict:
+        return {"subscribers": len(self._subs), **self.stats}
+
+
+broker = Broker()
+
+
+async def event_stream(heartbeat: float = CHANGE_FEED_HEARTBEAT):
+    """Server-sent events for one client; ends when the client disconnects."""
+    sub = broker.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event_id, payload = await asyncio.wait_for(sub.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {event_id}\ndata: {payload}\n\n"
+    finally:
+        broker.unsubscribe(sub)
+
+
+class PgNotifyBridge:
+    """Carries committed events between workers over Postgres LISTEN/NOTIFY.
+
+    One thread NOTIFYs what this process commits, another LISTENs and hands
+    every notification (this process's own included) to the local broker.
+    Each thread holds its own connection, detached from the pool.
+    """
+
+    def __init__(self, engine, broker: Broker):
+        self.engine = engine
+        self.broker = broker
+        self._outbox = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for target, name in ((self._notify_loop, "change-notify"), (self._listen_loop, "change-listen")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+        self._outbox.put(None)
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    def send(self, events):
+        self._outbox.put(events)
+
+    def _connect(self):
+        raw = self.engine.raw_connection()
+        raw.detach()
+        raw.driver_connection.autocommit = True
+        return raw
+
+    def _notify_loop(self):
+        raw = None
+        while not self._stop.is_set():
+            events = self._outbox.get()
+            if events is None:
+                break
+            for ev in events:  # one at a time, so a bad event doesn't take the rest of its batch with it
+                try:
+                    raw = raw or self._connect()
+                    with raw.cursor() as cur:
+                        cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, json.dumps(ev, default=str)))
+                except Exception:
+                    logger.exception("Change feed NOTIFY failed, %s event dropped", ev.get("type"))
+                    if raw is not None and raw.driver_connection.closed:
+                        raw = None
+        if raw is not None:
+            raw.close()
+
+    def _listen_loop(self):
+        raw = None
+        while not self._stop.is_set():
+            try:
+                if raw is None:
+                    raw = self._connect()
+                    with raw.cursor() as cur:
+                        cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                conn = raw.driver_connection
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                events = [json.loads(n.payload) for n in conn.notifies]
+                conn.notifies.clear()
+                if events:
+                    self.broker.publish(events)
+            except Exception:
+                logger.exception("Change feed LISTEN failed, reconnecting")
+                raw = None
+                self._stop.wait(1.0)
+        if raw is not None:
+            raw.close()
+
+
+_bridge = None
+
+
+def start_pg_bridge(engine):
+    global _bridge
+    if _bridge is None:
+        _bridge = PgNotifyBridge(engine, broker)
+        _bridge.start()
+    return _bridge
+
+
+def stop_pg_bridge():
+    global _bridge
+    if _bridge is not None:
+        _bridge.stop()
+        _bridge = None
+
+
+def emit(db: Session, type: str, **data):
+    """Queue a change event on db's transaction; it is published only if the transaction commits.
+
+    Events are notifications, not data: keep them to ids and counts. One whose
+    JSON exceeds CHANGE_FEED_MAX_PAYLOAD goes out as {"type", "truncated": true},
+    which tells clients to refetch.
+    """
+    ev = {"type": type, **data}
+    if len(json.dumps(ev, default=str).encode()) > CHANGE_FEED_MAX_PAYLOAD:
+        logger.warning("Change event %s is over %d bytes, sent truncated", type, CHANGE_FEED_MAX_PAYLOAD)
+        ev = {"type": type, "truncated": True}
+    db.info.setdefault("change_events", []).append(ev)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    events = session.info.pop("change_events", None)
+    if not events:
+        return
+    if _bridge is not None:
+        _bridge.send(events)
+    else:
+        broker.publish(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_events(session):
+    session.info.pop("change_events", None)
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import Product, PurchaseOrder, StockIN, StockOUT, Invoice
+from history_store import history_source
+
+YIELD_PER = 2000   # rows fetched per round trip from the server-side cursor
+CHUNK_ROWS = 500   # rows per chunk written to the response
+
+MEDIA_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def _stock_ins(db):
+    return (
+        select(
+            StockIN.id, StockIN.date, StockIN.po_id, PurchaseOrder.po_no,
+            PurchaseOrder.product_id, Product.code.label("product_code"), Product.name.label("product_name"),
+            StockIN.qty, StockIN.note, StockIN.edited,
+        )
+        .join(PurchaseOrder, PurchaseOrder.id == StockIN.po_id)
+        .join(Product, Product.id == PurchaseOrder.product_id)
+        .order_by(StockIN.date, StockIN.id),
+        StockIN.date,
+    )
+
+
+def _stock_outs(db):
+    return (
+        select(
+            StockOUT.id, StockOUT.date, StockOUT.po_id, PurchaseOrder.po_no,
+            StockOUT.product_id, Product.code.label("product_code"), Product.name.label("product_name"),
+            StockOUT.qty, Product.rate, (StockOUT.qty * Product.rate).label("amount"),
+            StockOUT.note, StockOUT.invoice_id, Invoice.invoice_no,
+        )
+        .join(PurchaseOrder, PurchaseOrder.id == StockOUT.po_id)
+        .join(Product, Product.id == StockOUT.product_id)
+        .outerjoin(Invoice, Invoice.id == StockOUT.invoice_id)
+        .order_by(StockOUT.date, StockOUT.id),
+        StockOUT.date,
+    )
+
+
+def _invoices(db):
+    return (
+        select(
+            Invoice.id, Invoice.invoice_no, Invoice.date, Invoice.status, Invoice.print_count,
+            Invoice.line_count, Invoice.total_amount,
+        ).order_by(Invoice.date, Invoice.id),
+        Invoice.date,
+    )
+
+
+def _history(db):
+    # Every month still in the database, rotated SQLite tables included
+    h = history_source(db)
+    return (
+        select(h.c.id, h.c.ts, h.c.action, h.c.by, h.c.details, h.c.ref_type, h.c.ref_id).order_by(h.c.ts, h.c.id),
+        h.c.ts,
+    )
+
+
+EXPORTS = {
+    "stock-ins": _stock_ins,
+    "stock-outs": _stock_outs,
+    "invoices": _invoices,
+    "history": _history,
+}
+
+
+def build_query(db, name: str, date_from: date = None, date_to: date = None):
+    stmt, date_col = EXPORTS[name](db)
+    is_ts = date_col.type.python_type is datetime
+    if date_from:
+        stmt = stmt.where(date_col >= (datetime.combine(date_from, time.min) if is_ts else date_from))
+    if date_to:
+        # inclusive end date
+        stmt = stmt.where(date_col < datetime.combine(date_to + timedelta(days=1), time.min) if is_ts else date_col <= date_to)
+    return stmt
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def stream_export(name: str, fmt: str, date_from: date = None, date_to: date = None):
+    """Yield the export as text chunks, reading rows through a server-side cursor.
+
+    Opens its own session: the generator outlives the request handler.
+    """
+    db = SessionLocal()
+    try:
+        stmt = build_query(db, name, date_from, date_to)
+        result = db.execute(stmt.execution_options(yield_per=YIELD_PER))
+        columns = list(result.keys())
+        buf = io.StringIO()
+        writer = csv.writer(buf) if fmt == "csv" else None
+        if writer:
+            writer.writerow(columns)
+            yield buf.getvalue()  # first bytes go out before the first row is fetched
+            buf.seek(0)
+            buf.truncate()
+
+        for partition in result.partitions(CHUNK_ROWS):
+            for row in partition:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    buf.write(json.dumps(dict(zip(columns, row)), default=_json_default))
+                    buf.write("\n")
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    finally:
+        db.close()
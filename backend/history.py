@@ -0,0 +1,147 @@
+import os
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from models import HistoryLog
+
+logger = logging.getLogger(__name__)
+
+# Buffered mode trades strict atomicity of the audit row for fewer write round trips:
+# rows reach the buffer only when their transaction commits, but one that is still
+# buffered when the process dies is lost.
+HISTORY_BUFFERED = os.getenv("HISTORY_BUFFERED", "0") == "1"
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "500"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))
+
+
+class HistoryBuffer:
+    """Collects HistoryLog rows and writes them in batches from a background thread.
+
+    A batch is flushed when it reaches max_rows or every max_delay seconds,
+    whichever comes first. stop() drains whatever is left.
+    """
+
+    def __init__(self, session_factory, max_rows: int = 500, max_delay: float = 1.0):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="history-buffer", daemon=True)
+            self._thread.start()
+
+    def add(self, rows):
+        with self._lock:
+            self._rows.extend(rows)
+            full = len(self._rows) >= self.max_rows
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+
+        db = self.session_factory()
+        try:
+            db.execute(insert(HistoryLog), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put them back in front so the next flush retries them in order
+            with self._lock:
+                self._rows[:0] = rows
+            raise
+        finally:
+            db.close()
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.max_delay)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("History flush failed, will retry")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+_buffer = None
+
+
+def start_buffering(session_factory, max_rows: int = HISTORY_BATCH_SIZE, max_delay: float = HISTORY_FLUSH_INTERVAL):
+    global _buffer
+    if _buffer is None:
+        _buffer = HistoryBuffer(session_factory, max_rows=max_rows, max_delay=max_delay)
+        _buffer.start()
+    return _buffer
+
+
+def stop_buffering():
+    global _buffer
+    if _buffer is not None:
+        _buffer.stop()
+        _buffer = None
+
+
+def _row(action: str, details: str, ref_type: str = None, ref_id: str = None, ts: datetime = None):
+    return dict(ts=ts or datetime.utcnow(), action=action, details=details, ref_type=ref_type, ref_id=ref_id, by="Admin")
+
+
+def log_history(db: Session, action: str, details: str, ref_type: str = None, ref_id: str = None):
+    """Record an audit row as part of the caller's transaction (the caller commits).
+
+    In buffered mode the row is handed to the background writer instead, once
+    the caller's transaction commits.
+    """
+    if _buffer is not None:
+        db.info.setdefault("history_rows", []).append(_row(action, details, ref_type, ref_id))
+        return
+    db.add(HistoryLog(**_row(action, details, ref_type, ref_id)))
+
+
+def log_history_many(db: Session, entries):
+    """Like log_history for many (action, details, ref_type, ref_id) tuples, as one executemany."""
+    now = datetime.utcnow()
+    rows = [_row(*entry, ts=now) for entry in entries]
+    if not rows:
+        return
+    if _buffer is not None:
+        db.info.setdefault("history_rows", []).extend(rows)
+        return
+    db.execute(insert(HistoryLog), rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_committed_history(session):
+    rows = session.info.pop("history_rows", None)
+    if not rows:
+        return
+    if _buffer is not None:
+        _buffer.add(rows)
+    else:
+        logger.warning("History buffer stopped before commit, %d row(s) not written", len(rows))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_history(session):
+    session.info.pop("history_rows", None)
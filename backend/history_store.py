@@ -0,0 +1,359 @@
+"""Monthly partitions, retention and archives for history_logs.
+
+On Postgres history_logs is natively partitioned by month on ts, with a
+DEFAULT partition catching rows for months that have no partition yet. SQLite
+has no partitioning, so history_logs holds the current month and rotate()
+moves closed months into tables of their own (history_logs_pYYYYMM).
+
+Partitions older than HISTORY_RETENTION_MONTHS are written to gzipped JSONL
+files in HISTORY_ARCHIVE_DIR and dropped. search_history() reads both.
+Run the maintenance from cron:
+
+    python history_store.py [--retention-months N] [--dry-run]
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, time
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, text, union_all
+from sqlalchemy.orm import Session
+
+from models import HistoryLog
+
+logger = logging.getLogger(__name__)
+
+# Months kept in the database (the current one included); 0 keeps everything
+HISTORY_RETENTION_MONTHS = int(os.getenv("HISTORY_RETENTION_MONTHS", "12"))
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_archive"))
+# Postgres partitions created ahead of time, so inserts never land in the default partition
+HISTORY_PREMAKE_MONTHS = int(os.getenv("HISTORY_PREMAKE_MONTHS", "2"))
+
+TABLE = HistoryLog.__tablename__
+PARTITION_PREFIX = TABLE + "_p"
+DEFAULT_PARTITION = TABLE + "_default"
+_PARTITION_RE = re.compile(rf"^{PARTITION_PREFIX}(\d{{4}})(\d{{2}})$")
+_ARCHIVE_RE = re.compile(r"^history-(\d{4})-(\d{2})(?:\.\d+)?\.jsonl\.gz$")
+COLUMNS = [c.name for c in HistoryLog.__table__.columns]
+
+
+def month_start(d) -> datetime:
+    return datetime(d.year, d.month, 1)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    y, m = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return datetime(y, m + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def _parse_partition(name: str):
+    m = _PARTITION_RE.match(name)
+    return datetime(int(m.group(1)), int(m.group(2)), 1) if m else None
+
+
+# --- Postgres: native range partitions ---
+def _pg_kind(conn):
+    return conn.exec_driver_sql(f"SELECT relkind FROM pg_class WHERE relname = '{TABLE}' AND relkind IN ('r', 'p')").scalar()
+
+
+def _pg_create_parent(conn):
+    conn.exec_driver_sql(f"""CREATE TABLE {TABLE} (
+        id INTEGER NOT NULL DEFAULT nextval('{TABLE}_id_seq'),
+        ts TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        action VARCHAR NOT NULL,
+        "by" VARCHAR,
+        details TEXT,
+        ref_type VARCHAR,
+        ref_id VARCHAR,
+        PRIMARY KEY (id, ts)
+    ) PARTITION BY RANGE (ts)""")
+    conn.exec_driver_sql(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+    conn.exec_driver_sql(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+
+def _pg_partitioned_months(conn):
+    rows = conn.exec_driver_sql(
+        f"SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        f"JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = '{TABLE}'"
+    )
+    return {m for m in (_parse_partition(name) for (name,) in rows) if m}
+
+
+def _pg_create_partition(conn, month: datetime):
+    """Add the partition for a month, moving in any of its rows that went to the default partition."""
+    lo, hi = month, add_months(month, 1)
+    name = partition_name(month)
+    conn.exec_driver_sql(
+        f"CREATE TEMP TABLE _history_moved ON COMMIT DROP AS "
+        f"SELECT * FROM {DEFAULT_PARTITION} WHERE ts >= '{lo:%Y-%m-%d}' AND ts < '{hi:%Y-%m-%d}'"
+    )
+    conn.exec_driver_sql(f"DELETE FROM {DEFAULT_PARTITION} WHERE ts >= '{lo:%Y-%m-%d}' AND ts < '{hi:%Y-%m-%d}'")
+    conn.exec_driver_sql(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{lo:%Y-%m-%d}') TO ('{hi:%Y-%m-%d}')")
+    conn.exec_driver_sql(f"INSERT INTO {TABLE} SELECT * FROM _history_moved")
+    conn.exec_driver_sql("DROP TABLE _history_moved")
+
+
+def _pg_ensure_partitions(conn, now: datetime):
+    have = _pg_partitioned_months(conn)
+    current = month_start(now)
+    wanted = {add_months(current, n) for n in range(HISTORY_PREMAKE_MONTHS + 1)}
+    wanted |= {month_start(ts) for (ts,) in conn.exec_driver_sql(f"SELECT DISTINCT date_trunc('month', ts) FROM {DEFAULT_PARTITION}")}
+    created = sorted(wanted - have)
+    for month in created:
+        _pg_create_partition(conn, month)
+    return created
+
+
+def _pg_install(engine):
+    with engine.begin() as conn:
+        kind = _pg_kind(conn)
+        if kind == "p":
+            return
+        if kind is None:
+            conn.exec_driver_sql(f"CREATE SEQUENCE IF NOT EXISTS {TABLE}_id_seq")
+            _pg_create_parent(conn)
+            return
+        # A plain table from an older version: swap in the partitioned one and copy the rows over
+        logger.warning("Converting %s to a partitioned table", TABLE)
+        conn.exec_driver_sql(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned")
+        conn.exec_driver_sql(f"ALTER TABLE {TABLE}_unpartitioned ALTER COLUMN id DROP DEFAULT")
+        conn.exec_driver_sql(f"ALTER INDEX IF EXISTS {TABLE}_pkey RENAME TO {TABLE}_unpartitioned_pkey")
+        _pg_create_parent(conn)
+        conn.exec_driver_sql(f"INSERT INTO {TABLE} ({', '.join(map(_quote, COLUMNS))}) SELECT id, COALESCE(ts, now() at time zone 'utc'), action, \"by\", details, ref_type, ref_id FROM {TABLE}_unpartitioned")
+        conn.exec_driver_sql(f"DROP TABLE {TABLE}_unpartitioned")
+
+
+def _quote(name: str) -> str:
+    return f'"{name}"'
+
+
+# --- SQLite: rotation tables ---
+def _month_table(name: str) -> Table:
+    return Table(
+        name, MetaData(),
+        *(Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in HistoryLog.__table__.columns),
+        Index(f"ix_{name}_ts_id", "ts", "id"),
+        Index(f"ix_{name}_ref", "ref_type", "ref_id", "ts"),
+    )
+
+
+def _sqlite_rotated_months(conn):
+    rows = conn.execute(text(f"SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '{PARTITION_PREFIX}%'"))
+    return {m for m in (_parse_partition(name) for (name,) in rows) if m}
+
+
+def _sqlite_install(engine):
+    # ids must keep growing after rotation empties the hot table, hence AUTOINCREMENT
+    with engine.begin() as conn:
+        sql = conn.execute(text(f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name = '{TABLE}'")).scalar()
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            return
+        for (index,) in conn.execute(text(f"SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = '{TABLE}' AND sql IS NOT NULL")).all():
+            conn.exec_driver_sql(f"DROP INDEX {index}")
+        conn.exec_driver_sql(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_old")
+        HistoryLog.__table__.create(conn)
+        cols = ", ".join(map(_quote, COLUMNS))
+        conn.exec_driver_sql(f"INSERT INTO {TABLE} ({cols}) SELECT {cols} FROM {TABLE}_old")
+        conn.exec_driver_sql(f"DROP TABLE {TABLE}_old")
+
+
+def _sqlite_rotate(conn, now: datetime):
+    """Move every closed month out of the hot table into its own table."""
+    hot = HistoryLog.__table__
+    month = func.strftime("%Y%m", hot.c.ts)
+    months = sorted(datetime.strptime(m, "%Y%m") for (m,) in conn.execute(select(month).where(hot.c.ts < month_start(now)).distinct()) if m)
+    for m in months:
+        table = _month_table(partition_name(m))
+        table.create(conn, checkfirst=True)
+        in_month = (hot.c.ts >= m) & (hot.c.ts < add_months(m, 1))
+        conn.execute(insert(table).from_select(COLUMNS, select(*(hot.c[c] for c in COLUMNS)).where(in_month)))
+        conn.execute(delete(hot).where(in_month))
+    return months
+
+
+# --- Common ---
+def install_history_partitions(engine):
+    """Set up history_logs for partitioning; run before create_all (see migrations.upgrade)."""
+    if engine.dialect.name == "postgresql":
+        _pg_install(engine)
+        with engine.begin() as conn:
+            _pg_ensure_partitions(conn, datetime.utcnow())
+    elif engine.dialect.name == "sqlite":
+        _sqlite_install(engine)
+
+
+def partition_months(conn) -> list:
+    """Months that have a partition (Postgres) or a rotated table (SQLite), oldest first."""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        return sorted(_pg_partitioned_months(conn))
+    if dialect == "sqlite":
+        return sorted(_sqlite_rotated_months(conn))
+    return []
+
+
+def rotate(conn, now: datetime = None) -> list:
+    """Postgres: create upcoming partitions. SQLite: rotate closed months out of the hot table."""
+    now = now or datetime.utcnow()
+    if conn.dialect.name == "postgresql":
+        return _pg_ensure_partitions(conn, now)
+    if conn.dialect.name == "sqlite":
+        return _sqlite_rotate(conn, now)
+    return []
+
+
+def history_source(db):
+    """A selectable with the history_logs columns covering every month still in the database."""
+    bind = db.get_bind() if isinstance(db, Session) else db
+    if bind.dialect.name != "sqlite":
+        return HistoryLog.__table__
+    months = sorted(_sqlite_rotated_months(db), reverse=True)
+    if not months:
+        return HistoryLog.__table__
+    tables = [HistoryLog.__table__] + [_month_table(partition_name(m)) for m in months]
+    # SQLite merges the branches' (ts, id) index scans instead of sorting the union
+    return union_all(*(select(*(t.c[c] for c in COLUMNS)) for t in tables)).subquery(TABLE)
+
+
+def drop_rotated(conn):
+    """Drop SQLite's rotated month tables (bench.datagen --reset)."""
+    if conn.dialect.name == "sqlite":
+        for month in _sqlite_rotated_months(conn):
+            conn.exec_driver_sql(f"DROP TABLE {partition_name(month)}")
+
+
+# --- Archives ---
+def _archive_path(archive_dir: str, month: datetime) -> str:
+    base = os.path.join(archive_dir, f"history-{month:%Y-%m}")
+    path, n = base + ".jsonl.gz", 1
+    while os.path.exists(path):
+        # Rows for an archived month that arrived later (backdated) get a file of their own
+        path, n = f"{base}.{n}.jsonl.gz", n + 1
+    return path
+
+
+def _row_json(row) -> str:
+    return json.dumps({c: (v.isoformat() if isinstance(v, datetime) else v) for c, v in zip(COLUMNS, row)})
+
+
+def archive_partitions(engine, retention_months: int = HISTORY_RETENTION_MONTHS, archive_dir: str = HISTORY_ARCHIVE_DIR, now: datetime = None, dry_run: bool = False) -> list:
+    """Write partitions older than the retention window to gzipped JSONL and drop them.
+
+    Each month is archived in its own transaction, and the file is complete on
+    disk before the partition is dropped. Returns (month, rows, path) tuples.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.utcnow()), 1 - retention_months)
+    with engine.connect() as conn:
+        expired = [m for m in partition_months(conn) if m < cutoff]
+    if dry_run:
+        return [(m, None, None) for m in expired]
+
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for month in expired:
+        name = partition_name(month)
+        path = _archive_path(archive_dir, month)
+        tmp = path + ".tmp"
+        with engine.begin() as conn:
+            cols = ", ".join(map(_quote, COLUMNS))
+            rows = conn.exec_driver_sql(f"SELECT {cols} FROM {name} ORDER BY ts, id")
+            count = 0
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(_row_json(row) + "\n")
+                    count += 1
+            os.replace(tmp, path)
+            conn.exec_driver_sql(f"DROP TABLE {name}")
+        archived.append((month, count, path))
+    return archived
+
+
+def archive_files(archive_dir: str = HISTORY_ARCHIVE_DIR) -> list:
+    """(month, path) for every archive file, newest month first."""
+    if not os.path.isdir(archive_dir):
+        return []
+    files = []
+    for name in os.listdir(archive_dir):
+        m = _ARCHIVE_RE.match(name)
+        if m:
+            files.append((datetime(int(m.group(1)), int(m.group(2)), 1), os.path.join(archive_dir, name)))
+    return sorted(files, reverse=True)
+
+
+# --- Queries ---
+def _day_bounds(date_from: date = None, date_to: date = None):
+    lo = datetime.combine(date_from, time.min) if date_from else None
+    hi = datetime.combine(date_to, time.max) if date_to else None
+    return lo, hi
+
+
+def search_history(db: Session, ref_type: str = None, ref_id: str = None, date_from: date = None, date_to: date = None, limit: int = 100, include_archived: bool = True, archive_dir: str = HISTORY_ARCHIVE_DIR) -> list:
+    """History entries matching ref_type/ref_id and an inclusive date range, newest first.
+
+    Reads the database first; archive files are only opened for months that
+    could still contribute to the newest `limit` entries.
+    """
+    lo, hi = _day_bounds(date_from, date_to)
+    h = history_source(db)
+    stmt = select(*(h.c[c] for c in COLUMNS))
+    if ref_type:
+        stmt = stmt.where(h.c.ref_type == ref_type)
+    if ref_id:
+        stmt = stmt.where(h.c.ref_id == ref_id)
+    if lo:
+        stmt = stmt.where(h.c.ts >= lo)
+    if hi:
+        stmt = stmt.where(h.c.ts <= hi)
+    rows = [dict(r, archived=False) for r in db.execute(stmt.order_by(h.c.ts.desc(), h.c.id.desc()).limit(limit)).mappings()]
+    if not include_archived:
+        return rows
+
+    seen = {r["id"] for r in rows}
+    for month, path in archive_files(archive_dir):
+        if (lo and add_months(month, 1) <= lo) or (hi and month > hi):
+            continue
+        if len(rows) >= limit and add_months(month, 1) <= rows[-1]["ts"]:
+            break  # every older file is older than what we already have
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if (ref_type and entry["ref_type"] != ref_type) or (ref_id and entry["ref_id"] != ref_id) or entry["id"] in seen:
+                    continue
+                entry["ts"] = datetime.fromisoformat(entry["ts"]) if entry["ts"] else None
+                if (lo and entry["ts"] < lo) or (hi and entry["ts"] > hi):
+                    continue
+                seen.add(entry["id"])
+                rows.append(dict(entry, archived=True))
+        rows.sort(key=lambda r: (r["ts"], r["id"]), reverse=True)
+        del rows[limit:]
+    return rows
+
+
+if __name__ == "__main__":
+    from database import engine
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Rotate history_logs partitions and archive the expired ones")
+    parser.add_argument("--retention-months", type=int, default=HISTORY_RETENTION_MONTHS, help="months kept in the database, 0 = keep all")
+    parser.add_argument("--archive-dir", default=HISTORY_ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="only list the partitions that would be archived")
+    args = parser.parse_args()
+
+    upgrade(engine)
+    if not args.dry_run:
+        with engine.begin() as conn:
+            for month in rotate(conn):
+                print(f"Partition {partition_name(month)} created")
+    for month, count, path in archive_partitions(engine, args.retention_months, args.archive_dir, dry_run=args.dry_run):
+        if args.dry_run:
+            print(f"Would archive {partition_name(month)}")
+        else:
+            print(f"Archived {partition_name(month)}: {count} rows -> {path}")
@@ -0,0 +1,243 @@
+"""Bulk import of legacy POs and stock movements from CSV.
+
+    python importer.py pos legacy_pos.csv             # po_no,product_code,po_qty[,created_at]
+    python importer.py movements legacy_stock.csv     # type,po_no,date,qty[,note]  (type is IN or OUT)
+
+The file is read in chunks; po_no / product code are resolved through lookup
+maps loaded once up front. Rows go in with COPY on Postgres (psycopg2) and
+executemany elsewhere, and each chunk writes one summary HistoryLog entry.
+Movements are validated in file order against the PO balances, so an OUT
+can never exceed the IN booked before it. The whole import is one transaction:
+any invalid row rejects the file. Like every handler, the import bumps the
+change versions of the tables it wrote last, after taking the balance locks,
+and then stamps the new rows with them.
+"""
+import argparse
+import csv
+import io
+import os
+from datetime import date, datetime
+from uuid import uuid4
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import Product, PurchaseOrder, POBalance, StockIN, StockOUT
+from ledger import lock_balances, apply_movement
+from history import log_history
+from versions import bump_versions, stamp_where
+from rollups import Rollups
+from events import emit
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "5000"))
+MAX_ERRORS = 100
+
+
+class CSVImportError(ValueError):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid row(s)")
+        self.errors = errors
+
+
+def _chunks(reader, size):
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _positive_int(value, field):
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        n = 0
+    if n <= 0:
+        raise ValueError(f"{field} must be a positive integer, got {value!r}")
+    return n
+
+
+def _insert_rows(db: Session, model, rows):
+    if not rows:
+        return
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql" or bind.dialect.driver != "psycopg2":
+        db.execute(insert(model), rows)
+        return
+
+    columns = list(rows[0])
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])  # None -> empty field -> NULL
+    buf.seek(0)
+    # Raw DBAPI connection of the session's own transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+
+
+def _import_pos(db: Session, reader, source, import_id, errors):
+    products = dict(db.query(Product.code, Product.id).all())
+    po_nos = {po_no for (po_no,) in db.query(PurchaseOrder.po_no).all()}
+    now = datetime.utcnow()
+    imported = []
+
+    for chunk in _chunks(reader, IMPORT_CHUNK_ROWS):
+        pos, balances = [], []
+        for line, row in chunk:
+            try:
+                po_no = row["po_no"].strip()
+                product_id = products.get(row["product_code"].strip())
+                if product_id is None:
+                    raise ValueError(f"unknown product code {row['product_code']!r}")
+                if not po_no or po_no in po_nos:
+                    raise ValueError(f"PO number {po_no!r} is empty or already exists")
+                created_at = datetime.fromisoformat(row["created_at"]) if row.get("created_at") else now
+                po_qty = _positive_int(row["po_qty"], "po_qty")
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append({"line": line, "detail": str(e)})
+                continue
+            po_nos.add(po_no)
+            po_id = str(uuid4())
+            pos.append(dict(id=po_id, product_id=product_id, po_no=po_no, po_qty=po_qty, created_at=created_at, is_active=True, revision=0, updated_at=now))
+            balances.append(dict(po_id=po_id, total_in=0, total_out=0, available=0))
+
+        if len(errors) >= MAX_ERRORS:
+            break
+        if errors or not pos:
+            continue  # keep validating, nothing will be committed
+        _insert_rows(db, PurchaseOrder, pos)
+        _insert_rows(db, POBalance, balances)
+        log_history(db, "POs Imported", f"Imported {len(pos)} POs (lines {chunk[0][0]}-{chunk[-1][0]}) from {source}", "import", import_id)
+        imported.extend(po["id"] for po in pos)
+
+    if not errors:
+        _stamp_imported(db, {PurchaseOrder: imported})
+    return {"pos": len(imported)}
+
+
+def _import_movements(db: Session, reader, source, import_id, errors):
+    pos = {po_no: (po_id, product_id) for po_id, po_no, product_id in db.query(PurchaseOrder.id, PurchaseOrder.po_no, PurchaseOrder.product_id).all()}
+    bals = {}
+    imported = {StockIN: [], StockOUT: []}
+
+    for chunk in _chunks(reader, IMPORT_CHUNK_ROWS):
+        new_ids = {pos[row.get("po_no", "").strip()][0] for _, row in chunk if row.get("po_no", "").strip() in pos} - bals.keys()
+        if new_ids:
+            bals.update(lock_balances(db, new_ids))
+
+        ins, outs = [], []
+        rollups = Rollups()
+        now = datetime.utcnow()
+        for line, row in chunk:
+            try:
+                kind = row["type"].strip().upper()
+                if kind not in ("IN", "OUT"):
+                    raise ValueError(f"type must be IN or OUT, got {row['type']!r}")
+                po = pos.get(row["po_no"].strip())
+                if po is None:
+                    raise ValueError(f"unknown PO {row['po_no']!r}")
+                day = date.fromisoformat(row["date"].strip())
+                qty = _positive_int(row["qty"], "qty")
+                note = (row.get("note") or "").strip() or None
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append({"line": line, "detail": str(e)})
+                continue
+
+            po_id, product_id = po
+            bal = bals[po_id]
+            if kind == "IN":
+                apply_movement(bal, in_delta=qty)
+                rollups.stock_in(day, product_id, po_id, qty)
+                ins.append(dict(id=str(uuid4()), po_id=po_id, date=day, qty=qty, note=note, edited=False, revision=0, updated_at=now))
+            elif qty > bal.available:
+                errors.append({"line": line, "detail": f"OUT {qty} exceeds available {bal.available} for PO {row['po_no'].strip()}"})
+            else:
+                apply_movement(bal, out_delta=qty)
+                rollups.stock_out(day, product_id, po_id, qty)
+                outs.append(dict(id=str(uuid4()), date=day, product_id=product_id, po_id=po_id, qty=qty, note=note, invoice_id=None, revision=0, updated_at=now))
+
+        if len(errors) >= MAX_ERRORS:
+            break
+        if errors or not (ins or outs):
+            continue
+        _insert_rows(db, StockIN, ins)
+        _insert_rows(db, StockOUT, outs)
+        rollups.apply(db)
+        log_history(db, "Stock Imported", f"Imported {len(ins)} IN / {len(outs)} OUT rows (lines {chunk[0][0]}-{chunk[-1][0]}) from {source}", "import", import_id)
+        imported[StockIN].extend(row["id"] for row in ins)
+        imported[StockOUT].extend(row["id"] for row in outs)
+
+    if not errors:
+        _stamp_imported(db, imported)
+    return {"ins": len(imported[StockIN]), "outs": len(imported[StockOUT])}
+
+
+def _stamp_imported(db: Session, imported: dict):
+    """Bump the versions of the tables written (last, as handlers do) and stamp the new rows, keyed by model."""
+    imported = {model: ids for model, ids in imported.items() if ids}
+    if not imported:
+        return
+    versions = bump_versions(db, *(model.__tablename__ for model in imported))
+    for model, ids in imported.items():
+        for i in range(0, len(ids), IMPORT_CHUNK_ROWS):
+            stamp_where(db, versions, model, model.id.in_(ids[i:i + IMPORT_CHUNK_ROWS]))
+
+
+IMPORTERS = {
+    "pos": _import_pos,
+    "movements": _import_movements,
+}
+
+
+def import_csv(db: Session, kind: str, f, source: str = "upload", dry_run: bool = False) -> dict:
+    """Import a CSV text stream in one transaction; raises CSVImportError listing bad lines.
+
+    With dry_run the file is fully validated and then rolled back. The per-chunk
+    history rows and the completion event are part of the transaction (buffered
+    history waits for the commit too), so a dry run or rejected file leaves none.
+    """
+    errors = []
+    import_id = str(uuid4())
+    try:
+        summary = IMPORTERS[kind](db, csv.DictReader(f), source, import_id, errors)
+        if errors:
+            raise CSVImportError(errors[:MAX_ERRORS])
+        emit(db, "import.completed", import_id=import_id, kind=kind, **summary)
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"import_id": import_id, "kind": kind, "dry_run": dry_run, **summary}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Import legacy POs or stock movements from CSV")
+    parser.add_argument("kind", choices=sorted(IMPORTERS))
+    parser.add_argument("path")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, don't write")
+    args = parser.parse_args()
+
+    upgrade(engine)
+    db = SessionLocal()
+    try:
+        with open(args.path, newline="", encoding="utf-8-sig") as f:
+            summary = import_csv(db, args.kind, f, source=os.path.basename(args.path), dry_run=args.dry_run)
+    except CSVImportError as e:
+        for err in e.errors:
+            print(f"line {err['line']}: {err['detail']}")
+        raise SystemExit(f"Import rejected: {e}")
+    finally:
+        db.close()
+    print(summary)
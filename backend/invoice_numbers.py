@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import deque
+from sqlalchemy import text, update, insert, func, cast, Integer
+from sqlalchemy.exc import IntegrityError
+
+from models import Counter, Invoice
+
+INVOICE_PREFIX = "SI-"
+INVOICE_NO_BLOCK_SIZE = int(os.getenv("INVOICE_NO_BLOCK_SIZE", "1"))
+SEQUENCE_NAME = "invoice_no_seq"
+COUNTER_NAME = "invoice_no"
+
+
+def format_invoice_no(n: int) -> str:
+    return f"{INVOICE_PREFIX}{str(n).zfill(5)}"
+
+
+def _max_existing(conn) -> int:
+    # One-off scan used only to seed the sequence/counter on a database that predates it
+    suffix = cast(func.substr(Invoice.invoice_no, len(INVOICE_PREFIX) + 1), Integer)
+    return conn.execute(func.coalesce(func.max(suffix), 0).select()).scalar()
+
+
+class InvoiceNumberAllocator:
+    """Hands out invoice numbers without counting the invoices table.
+
+    Postgres uses a sequence; other databases bump a row in `counters` under the
+    write lock. Numbers are reserved in their own short transaction, like a
+    sequence, so a rolled-back invoice leaves a gap rather than a duplicate.
+    With block_size > 1 each process reserves that many numbers at a time.
+    """
+
+    def __init__(self, engine, block_size: int = 1):
+        self.engine = engine
+        self.block_size = max(1, block_size)
+        self._reserved = deque()
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def next_invoice_no(self) -> str:
+        with self._lock:
+            if not self._reserved:
+                self._reserved.extend(self._reserve(self.block_size))
+            return format_invoice_no(self._reserved.popleft())
+
+    def next_invoice_nos(self, n: int) -> list:
+        """n numbers in order: what's left of the reserved block, the rest reserved in one go."""
+        with self._lock:
+            numbers = [self._reserved.popleft() for _ in range(min(n, len(self._reserved)))]
+            if len(numbers) < n:
+                numbers += sorted(self._reserve(n - len(numbers)))
+            return [format_invoice_no(x) for x in numbers]
+
+    def _reserve(self, n: int):
+        if self.engine.dialect.name == "postgresql":
+            return self._reserve_sequence(n)
+        return self._reserve_counter(n)
+
+    def _reserve_sequence(self, n: int):
+        with self.engine.begin() as conn:
+            if not self._ready:
+                if conn.execute(text("SELECT to_regclass(:name)"), {"name": SEQUENCE_NAME}).scalar() is None:
+                    start = _max_existing(conn) + 1
+                    conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME} START WITH {start}"))
+                self._ready = True
+            return [
+                row[0]
+                for row in conn.execute(text(f"SELECT nextval('{SEQUENCE_NAME}') FROM generate_series(1, :n)"), {"n": n})
+            ]
+
+    def _reserve_counter(self, n: int):
+        for _ in range(2):
+            try:
+                with self.engine.begin() as conn:
+                    end = conn.execute(
+                        update(Counter).where(Counter.name == COUNTER_NAME).values(value=Counter.value + n).returning(Counter.value)
+                    ).scalar()
+                    if end is None:
+                        end = _max_existing(conn) + n
+                        conn.execute(insert(Counter).values(name=COUNTER_NAME, value=end))
+                return list(range(end - n + 1, end + 1))
+            except IntegrityError:
+                # Another worker seeded the counter first; bump it instead
+                continue
+        raise RuntimeError("Could not allocate an invoice number")
@@ -0,0 +1,158 @@
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Product, PurchaseOrder, StockOUT, Invoice
+from catalog import catalog
+from rollups import Rollups
+from versions import stamped
+
+BATCH_GROUPINGS = ("product", "po", "day")
+# Groups attached per UPDATE (one CASE branch each)
+BATCH_CHUNK = 1000
+
+
+def adjust_invoice_totals(db: Session, inv: Invoice, outs, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) OUT lines from the invoice's running totals and the daily rollups."""
+    if not outs:
+        return
+    catalog.sync(db, force=True)  # the totals are stored, so don't price from a stale rate
+    rates = catalog.rates(db, {o.product_id for o in outs})
+    inv.content_version = (inv.content_version or 0) + 1
+    inv.line_count = (inv.line_count or 0) + sign * len(outs)
+    inv.total_amount = (inv.total_amount or 0) + sign * sum(o.qty * rates.get(o.product_id, 0) for o in outs)
+    rollups = Rollups()
+    for o in outs:
+        rollups.invoiced(o.date, o.product_id, o.po_id, o.qty, rates.get(o.product_id, 0), sign)
+    rollups.apply(db)
+
+
+def recompute_invoice_totals(db: Session, invoice_ids=None):
+    """Set line_count / total_amount from stock_outs x products in one UPDATE (bumping content_version).
+
+    `invoice_ids` may be a list or a subquery; None recomputes every invoice.
+    Callers that bump the invoices version stamp the rows afterwards (versions.stamp_where).
+    """
+    line_count = select(func.count(StockOUT.id)).where(StockOUT.invoice_id == Invoice.id).scalar_subquery()
+    total_amount = (
+        select(func.coalesce(func.sum(StockOUT.qty * Product.rate), 0))
+        .join(Product, Product.id == StockOUT.product_id)
+        .where(StockOUT.invoice_id == Invoice.id)
+        .scalar_subquery()
+    )
+    stmt = update(Invoice).values(line_count=line_count, total_amount=total_amount, content_version=Invoice.content_version + 1)
+    if invoice_ids is not None:
+        stmt = stmt.where(Invoice.id.in_(invoice_ids))
+    db.execute(stmt, execution_options={"synchronize_session": False})
+
+
+def touch_invoice_content(db: Session, invoice_ids):
+    """Mark invoices' printed content as changed (e.g. a product on them was renamed)."""
+    db.execute(
+        update(Invoice).where(Invoice.id.in_(invoice_ids)).values(content_version=Invoice.content_version + 1),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def invoice_items(db: Session, invoice_id: str):
+    """Line items of an invoice with product and PO details, in one join."""
+    return (
+        db.query(
+            StockOUT.id, StockOUT.date, StockOUT.qty, StockOUT.note,
+            StockOUT.product_id, Product.name.label("product_name"), Product.code.label("product_code"), Product.rate,
+            StockOUT.po_id, PurchaseOrder.po_no,
+            (StockOUT.qty * Product.rate).label("amount"),
+        )
+        .join(Product, Product.id == StockOUT.product_id)
+        .join(PurchaseOrder, PurchaseOrder.id == StockOUT.po_id)
+        .filter(StockOUT.invoice_id == invoice_id)
+        .order_by(StockOUT.date, StockOUT.id)
+        .all()
+    )
+
+
+# --- Batch invoicing ---
+def _batch_key(group_by: str):
+    return {"product": StockOUT.product_id, "po": StockOUT.po_id, "day": StockOUT.date}[group_by]
+
+
+def _uninvoiced(date_from, date_to):
+    return (StockOUT.invoice_id == None, StockOUT.date >= date_from, StockOUT.date <= date_to)
+
+
+def plan_batch_invoices(db: Session, date_from, date_to, group_by: str = "product") -> list:
+    """One planned invoice per group of uninvoiced OUTs in the date range, with its totals (one query)."""
+    key = _batch_key(group_by)
+    label = {"product": Product.code, "po": PurchaseOrder.po_no, "day": StockOUT.date}[group_by]
+    stmt = (
+        select(
+            key, label, func.count(StockOUT.id), func.sum(StockOUT.qty), func.sum(StockOUT.qty * Product.rate),
+            func.min(StockOUT.date), func.max(StockOUT.date),
+        )
+        .join(Product, Product.id == StockOUT.product_id)
+        .where(*_uninvoiced(date_from, date_to))
+        .group_by(key, label)
+        .order_by(label)
+    )
+    if group_by == "po":
+        stmt = stmt.join(PurchaseOrder, PurchaseOrder.id == StockOUT.po_id)
+    return [
+        dict(key=k, label=str(l), line_count=n, qty=int(q), total_amount=float(amount or 0), date_from=first, date_to=last)
+        for k, l, n, q, amount, first, last in db.execute(stmt)
+    ]
+
+
+def create_batch_invoices(db: Session, groups: list, date_from, date_to, group_by: str, versions: dict, day) -> list:
+    """Create the planned invoices and attach their OUTs with set-based UPDATEs (the caller commits).
+
+    Each group needs invoice_id / invoice_no set. OUTs invoiced by someone else
+    since the plan are skipped; the totals and rollups are taken from what was
+    actually attached, and an invoice left with no lines is dropped. Returns
+    the groups that were invoiced, with their final totals.
+    """
+    db.execute(insert(Invoice), [
+        dict(id=g["invoice_id"], invoice_no=g["invoice_no"], date=day, status="Draft", print_count=0,
+             line_count=g["line_count"], total_amount=g["total_amount"], **stamped(versions, "invoices"))
+        for g in groups
+    ])
+
+    key = _batch_key(group_by)
+    for i in range(0, len(groups), BATCH_CHUNK):
+        chunk = groups[i:i + BATCH_CHUNK]
+        db.execute(
+            update(StockOUT)
+            .where(*_uninvoiced(date_from, date_to), key.in_([g["key"] for g in chunk]))
+            .values(invoice_id=case({g["key"]: g["invoice_id"] for g in chunk}, value=key), **stamped(versions, "stock_outs")),
+            execution_options={"synchronize_session": False},
+        )
+
+    ids = [g["invoice_id"] for g in groups]
+    attached = db.execute(
+        select(StockOUT.invoice_id, StockOUT.date, StockOUT.product_id, StockOUT.po_id, func.count(StockOUT.id), func.sum(StockOUT.qty), Product.rate)
+        .join(Product, Product.id == StockOUT.product_id)
+        .where(StockOUT.invoice_id.in_(ids))
+        .group_by(StockOUT.invoice_id, StockOUT.date, StockOUT.product_id, StockOUT.po_id, Product.rate)
+    ).all()
+
+    totals = {}
+    rollups = Rollups()
+    for invoice_id, out_date, product_id, po_id, n, qty, rate in attached:
+        rollups.invoiced(out_date, product_id, po_id, qty, rate)
+        t = totals.setdefault(invoice_id, dict(line_count=0, qty=0, total_amount=0.0, date_from=out_date, date_to=out_date))
+        t["line_count"] += n
+        t["qty"] += qty
+        t["total_amount"] += qty * rate
+        t["date_from"], t["date_to"] = min(t["date_from"], out_date), max(t["date_to"], out_date)
+    rollups.apply(db)
+
+    # Invoices were inserted with the planned totals; fix the few that changed under us
+    drifted = [
+        dict(id=g["invoice_id"], line_count=t["line_count"], total_amount=t["total_amount"])
+        for g in groups
+        if (t := totals.get(g["invoice_id"])) and (t["line_count"] != g["line_count"] or abs(t["total_amount"] - g["total_amount"]) > 0.005)
+    ]
+    if drifted:
+        db.execute(update(Invoice), drifted)
+    empty = [i for i in ids if i not in totals]
+    if empty:
+        db.execute(delete(Invoice).where(Invoice.id.in_(empty)), execution_options={"synchronize_session": False})
+    return [{**g, **totals[g["invoice_id"]]} for g in groups if g["invoice_id"] in totals]
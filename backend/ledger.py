@@ -0,0 +1,110 @@
+import argparse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import PurchaseOrder, POBalance, StockIN, StockOUT
+
+
+def _raw_totals(db: Session, po_id: str):
+    sum_in = db.query(func.coalesce(func.sum(StockIN.qty), 0)).filter(StockIN.po_id == po_id).scalar()
+    sum_out = db.query(func.coalesce(func.sum(StockOUT.qty), 0)).filter(StockOUT.po_id == po_id).scalar()
+    return int(sum_in), int(sum_out)
+
+
+def lock_balance(db: Session, po_id: str):
+    """Return the balance row for a PO, locked FOR UPDATE until the caller commits.
+
+    Rows missing for POs created before the ledger existed are seeded from the
+    raw stock tables. The PO row is locked first so two writers can't both seed it.
+    Returns None when there is no such PO.
+    """
+    bal = db.query(POBalance).filter(POBalance.po_id == po_id).with_for_update().first()
+    if bal:
+        return bal
+
+    if db.query(PurchaseOrder.id).filter(PurchaseOrder.id == po_id).with_for_update().first() is None:
+        return None
+    bal = db.query(POBalance).filter(POBalance.po_id == po_id).with_for_update().first()
+    if bal:
+        return bal
+
+    sum_in, sum_out = _raw_totals(db, po_id)
+    bal = POBalance(po_id=po_id, total_in=sum_in, total_out=sum_out, available=sum_in - sum_out)
+    db.add(bal)
+    db.flush()
+    return bal
+
+
+def lock_balances(db: Session, po_ids) -> dict:
+    """Lock the balance rows for several POs at once, keyed by po_id.
+
+    Rows are locked in po_id order so concurrent batches can't deadlock.
+    POs that don't exist are left out.
+    """
+    po_ids = sorted(set(po_ids))
+    bals = {
+        b.po_id: b
+        for b in db.query(POBalance).filter(POBalance.po_id.in_(po_ids)).order_by(POBalance.po_id).with_for_update().all()
+    }
+    for po_id in po_ids:
+        if po_id not in bals and (bal := lock_balance(db, po_id)) is not None:
+            bals[po_id] = bal
+    return bals
+
+
+def apply_movement(bal: POBalance, in_delta: int = 0, out_delta: int = 0):
+    bal.total_in += in_delta
+    bal.total_out += out_delta
+    bal.available = bal.total_in - bal.total_out
+
+
+def rebuild_balances(db: Session, fix: bool = True):
+    """Recompute every PO balance from stock_ins / stock_outs.
+
+    Returns a list of (po_id, stored, expected) tuples for rows that were wrong
+    or missing. With fix=False nothing is written (verify only).
+    """
+    ins = dict(db.query(StockIN.po_id, func.sum(StockIN.qty)).group_by(StockIN.po_id).all())
+    outs = dict(db.query(StockOUT.po_id, func.sum(StockOUT.qty)).group_by(StockOUT.po_id).all())
+    stored = {b.po_id: b for b in db.query(POBalance).with_for_update().all()}
+
+    mismatches = []
+    for (po_id,) in db.query(PurchaseOrder.id).all():
+        sum_in, sum_out = int(ins.get(po_id) or 0), int(outs.get(po_id) or 0)
+        expected = (sum_in, sum_out, sum_in - sum_out)
+        bal = stored.get(po_id)
+        current = (bal.total_in, bal.total_out, bal.available) if bal else None
+        if current == expected:
+            continue
+        mismatches.append((po_id, current, expected))
+        if not fix:
+            continue
+        if bal is None:
+            db.add(POBalance(po_id=po_id, total_in=sum_in, total_out=sum_out, available=sum_in - sum_out))
+        else:
+            bal.total_in, bal.total_out, bal.available = expected
+
+    if fix:
+        db.commit()
+    return mismatches
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, Base, engine
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify per-PO stock balances")
+    parser.add_argument("--verify", action="store_true", help="only report mismatches, don't write")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        mismatches = rebuild_balances(db, fix=not args.verify)
+    finally:
+        db.close()
+
+    for po_id, current, expected in mismatches:
+        print(f"PO {po_id}: stored {current} -> expected {expected}")
+    print(f"{len(mismatches)} balance(s) {'out of sync' if args.verify else 'rebuilt'}")
+    if args.verify and mismatches:
+        raise SystemExit(1)
@@ -1,15 +1,44 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import func, insert
+from typing import List, Optional
 from datetime import date, datetime
 from uuid import uuid4
-
-from database import engine, get_db, Base
-from models import Product, Material, PurchaseOrder, StockIN, StockOUT, Invoice, HistoryLog
+import io
+import tempfile
+import time
+
+from database import engine, get_db, Base, SessionLocal, DB_ASYNC, async_engine, get_async_db, pool_metrics, replica_engine, async_replica_engine
+from models import Product, Material, PurchaseOrder, POBalance, StockIN, StockOUT, Invoice, Tombstone
+from ledger import lock_balance, lock_balances, apply_movement
+from history import log_history, log_history_many, start_buffering, stop_buffering, HISTORY_BUFFERED
+from history_store import history_source, search_history
+from pagination import paginate, NEXT_CURSOR_HEADER
+from invoice_numbers import InvoiceNumberAllocator, INVOICE_NO_BLOCK_SIZE
+from invoicing import adjust_invoice_totals, recompute_invoice_totals, touch_invoice_content, invoice_items, plan_batch_invoices, create_batch_invoices, BATCH_GROUPINGS
+from documents import invoice_document, render_invoices, render_cache, shutdown_render_pool, RenderUnavailable, FORMATS as DOCUMENT_FORMATS
+from migrations import upgrade
+from exports import stream_export, EXPORTS, MEDIA_TYPES
+from importer import import_csv, CSVImportError, IMPORTERS
+from versions import bump_versions, conditional_get, stamp, stamp_where, stamped
+from catalog import catalog
+from rollups import Rollups, reprice_rollups, movement_report, GRANULARITIES, GROUPINGS
+from sync import changes_since, decode_watermark
+from search import search, SEARCH_TYPES
+from events import emit, event_stream, broker, start_pg_bridge, stop_pg_bridge, CHANGE_FEED_PG_NOTIFY
+from async_mode import install_async_routes, run_blocking
+from serialization import Projection, json_response
+from replicas import get_read_db, get_async_read_db, replica_router, client_key, READ_METHODS
+from request_metrics import (
+    RouteMetrics, instrument_engine, start_request, end_request, check_budget, bind_budget, query_budget,
+    render_pool_metrics, render_cache_metrics, QUERY_BUDGET_ENFORCE,
+)
 import schemas
 
-app = FastAPI(title="Samara Industry Factory System API")
+app = FastAPI(title="Samara Industry Factory System API", dependencies=[Depends(bind_budget)] if QUERY_BUDGET_ENFORCE else [])
 
 # --- CORS ---
 origins = [
@@ -22,95 +51,205 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "X-Render-Cache"],
 )
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# --- Request metrics ---
+route_metrics = RouteMetrics()
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+if replica_engine is not None:
+    instrument_engine(replica_engine)
+if async_replica_engine is not None:
+    instrument_engine(async_replica_engine.sync_engine)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats, token = start_request()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        end_request(token)
+    if request.method not in READ_METHODS and replica_router.enabled:
+        # Read-your-writes: this client's reads stay on the primary for a while
+        replica_router.wrote(client_key(request))
+
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    route_metrics.observe(request.method, path, response.status_code, time.perf_counter() - started, stats)
+    if QUERY_BUDGET_ENFORCE and route is not None and not stats.committed:
+        # Writes were checked at commit (request_metrics); this covers read-only routes
+        check_budget(route.endpoint, stats, f"{request.method} {path}")
+    return response
+
+# Create tables (and add columns/indexes missing from older databases)
+upgrade(engine)
+
+invoice_numbers = InvoiceNumberAllocator(engine, block_size=INVOICE_NO_BLOCK_SIZE)
+
+# Route query budgets below allow for seeding a PO's balance row on first touch
+# (ledger.lock_balance); bulk routes must stay constant whatever the batch size.
+LEDGER = 5
+
+# List endpoints select just these columns and skip ORM/response_model encoding
+PRODUCT_ROWS = Projection(schemas.Product, Product)
+PO_ROWS = Projection(schemas.PurchaseOrder, PurchaseOrder)
+STOCK_IN_ROWS = Projection(schemas.StockIN, StockIN)
+STOCK_OUT_ROWS = Projection(schemas.StockOUT, StockOUT)
+INVOICE_ROWS = Projection(schemas.Invoice, Invoice)
 
 def gen_id():
     return str(uuid4())
 
-# --- Logging Helper ---
-def log_history(db: Session, action: str, details: str, ref_type: str = None, ref_id: str = None):
-    log = HistoryLog(ts=datetime.utcnow(), action=action, details=details, ref_type=ref_type, ref_id=ref_id, by="Admin")
-    db.add(log)
-    db.commit()
-
-from datetime import datetime
+def emit_balance(db: Session, bal: POBalance, po_no: str = None):
+    emit(db, "po.balance", po_id=bal.po_id, po_no=po_no, total_in=bal.total_in, total_out=bal.total_out, available=bal.available)
+
+# --- History buffering (optional) ---
+@app.on_event("startup")
+def start_history_buffer():
+    if HISTORY_BUFFERED:
+        start_buffering(SessionLocal)
+    if CHANGE_FEED_PG_NOTIFY and engine.dialect.name == "postgresql":
+        start_pg_bridge(engine)
+    replica_router.start()
+
+@app.on_event("shutdown")
+async def flush_history_buffer():
+    stop_buffering()
+    stop_pg_bridge()
+    replica_router.stop()
+    shutdown_render_pool()
+    if async_engine is not None:
+        await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
 
 # --- Products ---
 @app.post("/products/", response_model=schemas.Product)
+@query_budget(7)
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    if db.query(Product).filter(Product.code == product.code).first():
+    catalog.sync(db, force=True)
+    if catalog.product_by_code(db, product.code):
         raise HTTPException(status_code=400, detail="Product code already registered")
     
-    if db.query(Product).filter(Product.name == product.name).first():
+    if catalog.product_by_name(db, product.name):
         raise HTTPException(status_code=400, detail="Product name already exists")
 
     db_product = Product(id=gen_id(), **product.dict(), is_active=True)
     db.add(db_product)
+    log_history(db, "Product Created", f"Product {product.name} ({product.code}) created", "product", db_product.id)
+    versions = bump_versions(db, "products")
+    stamp(versions, db_product)
+    catalog.product_written(db, db_product, versions.get("products"))
+    emit(db, "product.created", id=db_product.id, code=product.code, name=product.name)
     db.commit()
     db.refresh(db_product)
-    log_history(db, "Product Created", f"Product {product.name} ({product.code}) created", "product", db_product.id)
     return db_product
 
 @app.get("/products/", response_model=List[schemas.Product])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Product).filter(Product.is_active == True).offset(skip).limit(limit).all()
+@query_budget(3)
+def read_products(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_read_db)):
+    not_modified = conditional_get(db, request, response, "products")
+    if not_modified is not None:
+        return not_modified
+    q = db.query(*PRODUCT_ROWS.columns).filter(Product.is_active == True)
+    rows = paginate(q, response, [Product.id], [None], cursor=cursor, skip=skip, limit=limit)
+    return json_response(PRODUCT_ROWS.dicts(rows), response)
 
 @app.put("/products/{product_id}", response_model=schemas.Product)
+@query_budget(9)
 def update_product(product_id: str, product: schemas.ProductCreate, db: Session = Depends(get_db)):
     db_product = db.query(Product).filter(Product.id == product_id).first()
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     old_val = f"{db_product.name} ({db_product.code})"
+    old_rate = db_product.rate
+    renamed = (db_product.name, db_product.code) != (product.name, product.code)
     for key, value in product.dict().items():
         setattr(db_product, key, value)
     
+    invoiced = db.query(StockOUT.invoice_id).filter(StockOUT.product_id == product_id, StockOUT.invoice_id != None)
+    if product.rate != old_rate:
+        db.flush()
+        recompute_invoice_totals(db, invoiced)
+        reprice_rollups(db, product_id, product.rate)
+        # Versions last, like every other writer; the repriced invoices get theirs in a follow-up UPDATE
+        versions = bump_versions(db, "products", "invoices")
+        stamp_where(db, versions, Invoice, Invoice.id.in_(invoiced))
+    else:
+        if renamed:
+            # Printed invoices show the product's name and code
+            touch_invoice_content(db, invoiced)
+        versions = bump_versions(db, "products")
+    stamp(versions, db_product)
+    log_history(db, "Product Updated", f"Product updated from {old_val} to {product.name} ({product.code})", "product", product_id)
+    catalog.product_written(db, db_product, versions.get("products"))
+    emit(db, "product.updated", id=product_id, code=product.code, name=product.name, rate=product.rate)
     db.commit()
     db.refresh(db_product)
-    log_history(db, "Product Updated", f"Product updated from {old_val} to {product.name} ({product.code})", "product", product_id)
     return db_product
 
 @app.delete("/products/{product_id}")
+@query_budget(5)
 def delete_product(product_id: str, db: Session = Depends(get_db)):
     db_product = db.query(Product).filter(Product.id == product_id).first()
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     db_product.is_active = False
-    db.commit()
     log_history(db, "Product Deleted", f"Product {db_product.name} ({db_product.code}) deleted", "product", product_id)
+    versions = bump_versions(db, "products")
+    stamp(versions, db_product)
+    catalog.product_written(db, db_product, versions.get("products"))
+    emit(db, "product.deleted", id=product_id)
+    db.commit()
     return {"ok": True}
 
 # --- Materials ---
 @app.post("/materials/", response_model=schemas.Material)
+@query_budget(5)
 def create_material(material: schemas.MaterialCreate, db: Session = Depends(get_db)):
     db_mat = Material(id=gen_id(), **material.dict(), is_active=True)
     db.add(db_mat)
+    log_history(db, "Material Added", f"Material {material.name} added", "material", db_mat.id)
+    versions = bump_versions(db, "materials")
+    stamp(versions, db_mat)
+    catalog.material_written(db, db_mat, versions.get("materials"))
+    emit(db, "material.created", id=db_mat.id, product_id=material.product_id)
     db.commit()
     db.refresh(db_mat)
-    log_history(db, "Material Added", f"Material {material.name} added", "material", db_mat.id)
     return db_mat
 
 @app.get("/products/{product_id}/materials/", response_model=List[schemas.Material])
-def read_materials(product_id: str, db: Session = Depends(get_db)):
-    return db.query(Material).filter(Material.product_id == product_id, Material.is_active == True).all()
+@query_budget(4)
+def read_materials(product_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = conditional_get(db, request, response, "materials")
+    if not_modified is not None:
+        return not_modified
+    return catalog.materials(db, product_id)
 
 @app.delete("/materials/{material_id}")
+@query_budget(5)
 def delete_material(material_id: str, db: Session = Depends(get_db)):
     db_mat = db.query(Material).filter(Material.id == material_id).first()
     if not db_mat:
         raise HTTPException(status_code=404, detail="Material not found")
     
     db_mat.is_active = False
-    db.commit()
     log_history(db, "Material Deleted", f"Material {db_mat.name} deleted", "material", material_id)
+    versions = bump_versions(db, "materials")
+    stamp(versions, db_mat)
+    catalog.material_written(db, db_mat, versions.get("materials"))
+    emit(db, "material.deleted", id=material_id, product_id=db_mat.product_id)
+    db.commit()
     return {"ok": True}
 
 # --- POs ---
 @app.post("/pos/", response_model=schemas.PurchaseOrder)
+@query_budget(7)
 def create_po(po: schemas.PurchaseOrderCreate, db: Session = Depends(get_db)):
     # Check if PO exists
     exists = db.query(PurchaseOrder).filter(PurchaseOrder.po_no == po.po_no).first()
@@ -119,120 +258,232 @@ def create_po(po: schemas.PurchaseOrderCreate, db: Session = Depends(get_db)):
         
     db_po = PurchaseOrder(id=gen_id(), **po.dict(),  created_at=datetime.utcnow(), is_active=True)
     db.add(db_po)
+    db.add(POBalance(po_id=db_po.id, total_in=0, total_out=0, available=0))
+    log_history(db, "PO Created", f"PO {po.po_no} (Qty {po.po_qty}) created", "po", db_po.id)
+    stamp(bump_versions(db, "purchase_orders"), db_po)
+    emit(db, "po.created", id=db_po.id, po_no=po.po_no, product_id=po.product_id)
     db.commit()
     db.refresh(db_po)
-    log_history(db, "PO Created", f"PO {po.po_no} (Qty {po.po_qty}) created", "po", db_po.id)
     return db_po
 
 @app.get("/pos/", response_model=List[schemas.PurchaseOrder])
-def read_pos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(PurchaseOrder).filter(PurchaseOrder.is_active == True).offset(skip).limit(limit).all()
+@query_budget(3)
+def read_pos(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_read_db)):
+    not_modified = conditional_get(db, request, response, "purchase_orders")
+    if not_modified is not None:
+        return not_modified
+    q = db.query(*PO_ROWS.columns).filter(PurchaseOrder.is_active == True)
+    rows = paginate(q, response, [PurchaseOrder.id], [None], cursor=cursor, skip=skip, limit=limit)
+    return json_response(PO_ROWS.dicts(rows), response)
 
 # --- Stock IN ---
 @app.post("/ins/", response_model=schemas.StockIN)
+@query_budget(LEDGER + 8)
 def create_stock_in(stock_in: schemas.StockINCreate, db: Session = Depends(get_db)):
+    bal = lock_balance(db, stock_in.po_id)
+    if bal is None:
+        raise HTTPException(status_code=404, detail="PO not found")
     db_in = StockIN(id=gen_id(), **stock_in.dict(), edited=False)
     db.add(db_in)
-    db.commit()
-    db.refresh(db_in)
+    apply_movement(bal, in_delta=stock_in.qty)
     
     po = db.query(PurchaseOrder).filter(PurchaseOrder.id == stock_in.po_id).first()
     po_no = po.po_no if po else "Unknown PO"
+    if po:
+        Rollups().stock_in(stock_in.date, po.product_id, stock_in.po_id, stock_in.qty).apply(db)
     
     log_history(db, "Stock IN Added", f"IN Qty {stock_in.qty} for PO {po_no}", "stock_in", db_in.id)
+    stamp(bump_versions(db, "stock_ins"), db_in)
+    emit(db, "stock_in.created", id=db_in.id, po_id=stock_in.po_id, po_no=po_no, qty=stock_in.qty)
+    emit_balance(db, bal, po_no)
+    db.commit()
+    db.refresh(db_in)
     return db_in
 
+@app.post("/ins/bulk", response_model=List[schemas.StockIN])
+@query_budget(LEDGER + 7)
+def create_stock_ins_bulk(bulk: schemas.StockINBulk, db: Session = Depends(get_db)):
+    """Insert a whole batch of INs in one transaction; any bad row rejects the batch."""
+    pos = {po_id: (po_no, product_id) for po_id, po_no, product_id in db.query(PurchaseOrder.id, PurchaseOrder.po_no, PurchaseOrder.product_id).filter(PurchaseOrder.id.in_({i.po_id for i in bulk.items}))}
+    po_nos = {po_id: po_no for po_id, (po_no, _) in pos.items()}
+    errors = [{"row": n, "detail": f"PO {i.po_id} not found"} for n, i in enumerate(bulk.items) if i.po_id not in po_nos]
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    bals = lock_balances(db, po_nos.keys())
+    rows = [dict(id=gen_id(), **i.dict(), edited=False) for i in bulk.items]
+    rollups = Rollups()
+    for row in rows:
+        apply_movement(bals[row["po_id"]], in_delta=row["qty"])
+        rollups.stock_in(row["date"], pos[row["po_id"]][1], row["po_id"], row["qty"])
+    rollups.apply(db)
+
+    versions = bump_versions(db, "stock_ins")
+    if rows:
+        db.execute(insert(StockIN), [{**r, **stamped(versions, "stock_ins")} for r in rows])
+        log_history_many(db, [("Stock IN Added", f"IN Qty {r['qty']} for PO {po_nos[r['po_id']]}", "stock_in", r["id"]) for r in rows])
+    emit(db, "stock_in.bulk_created", count=len(rows))
+    for bal in bals.values():
+        emit_balance(db, bal, po_nos[bal.po_id])
+    db.commit()
+    return rows
+
 @app.get("/pos/{po_id}/ins/", response_model=List[schemas.StockIN])
-def read_stock_ins(po_id: str, db: Session = Depends(get_db)):
-    return db.query(StockIN).filter(StockIN.po_id == po_id).all()
+@query_budget(3)
+def read_stock_ins(po_id: str, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    not_modified = conditional_get(db, request, response, "stock_ins")
+    if not_modified is not None:
+        return not_modified
+    rows = db.query(*STOCK_IN_ROWS.columns).filter(StockIN.po_id == po_id).all()
+    return json_response(STOCK_IN_ROWS.dicts(rows), response)
 
 @app.put("/ins/{in_id}", response_model=schemas.StockIN)
+@query_budget(LEDGER + 9)
 def update_stock_in(in_id: str, stock_in: schemas.StockINCreate, db: Session = Depends(get_db)):
     db_in = db.query(StockIN).filter(StockIN.id == in_id).first()
     if not db_in:
         raise HTTPException(status_code=404, detail="Stock IN entry not found")
         
+    bal = lock_balance(db, db_in.po_id)
     old_qty = db_in.qty
     
     # Check if reducing stock would make OUT > IN for this PO
     if stock_in.qty < old_qty:
-        # Calculate total IN excluding this one + new qty
-        total_in_others = db.query(StockIN).filter(StockIN.po_id == db_in.po_id, StockIN.id != in_id).all()
-        sum_in = sum(i.qty for i in total_in_others) + stock_in.qty
-        
-        # Calculate total OUT
-        total_out = db.query(StockOUT).filter(StockOUT.po_id == db_in.po_id).all()
-        sum_out = sum(o.qty for o in total_out)
+        sum_in = bal.total_in - old_qty + stock_in.qty
+        sum_out = bal.total_out
         
         if sum_in < sum_out:
             raise HTTPException(status_code=400, detail=f"Cannot reduce Stock IN to {stock_in.qty}. Total OUT is {sum_out}, which would exceed total IN {sum_in}.")
 
+    apply_movement(bal, in_delta=stock_in.qty - old_qty)
+    product_id = db.query(PurchaseOrder.product_id).filter(PurchaseOrder.id == db_in.po_id).scalar()
+    Rollups().stock_in(db_in.date, product_id, db_in.po_id, old_qty, sign=-1).stock_in(stock_in.date, product_id, db_in.po_id, stock_in.qty).apply(db)
     db_in.date = stock_in.date
     db_in.qty = stock_in.qty
     db_in.note = stock_in.note
     db_in.edited = True
     
+    log_history(db, "Stock IN Updated", f"IN updated from {old_qty} to {stock_in.qty}", "stock_in", in_id)
+    stamp(bump_versions(db, "stock_ins"), db_in)
+    emit(db, "stock_in.updated", id=in_id, po_id=db_in.po_id, qty=stock_in.qty)
+    emit_balance(db, bal)
     db.commit()
     db.refresh(db_in)
-    log_history(db, "Stock IN Updated", f"IN updated from {old_qty} to {stock_in.qty}", "stock_in", in_id)
     return db_in
 
 @app.delete("/ins/{in_id}")
+@query_budget(LEDGER + 8)
 def delete_stock_in(in_id: str, db: Session = Depends(get_db)):
     db_in = db.query(StockIN).filter(StockIN.id == in_id).first()
     if not db_in:
         raise HTTPException(status_code=404, detail="Stock IN entry not found")
 
     # Validate stock usage
-    total_in_others = db.query(StockIN).filter(StockIN.po_id == db_in.po_id, StockIN.id != in_id).all()
-    sum_in = sum(i.qty for i in total_in_others)
-    
-    total_out = db.query(StockOUT).filter(StockOUT.po_id == db_in.po_id).all()
-    sum_out = sum(o.qty for o in total_out)
+    bal = lock_balance(db, db_in.po_id)
+    sum_in = bal.total_in - db_in.qty
+    sum_out = bal.total_out
     
     if sum_in < sum_out:
         raise HTTPException(status_code=400, detail=f"Cannot delete Stock IN. Remaining IN ({sum_in}) would be less than Total OUT ({sum_out}).")
 
+    apply_movement(bal, in_delta=-db_in.qty)
+    product_id = db.query(PurchaseOrder.product_id).filter(PurchaseOrder.id == db_in.po_id).scalar()
+    Rollups().stock_in(db_in.date, product_id, db_in.po_id, db_in.qty, sign=-1).apply(db)
     db.delete(db_in) # Hard delete or soft? Let's do hard since it's a mistake correction.
-    db.commit()
     log_history(db, "Stock IN Deleted", f"IN entry of {db_in.qty} deleted", "stock_in", in_id)
+    versions = bump_versions(db, "stock_ins")
+    db.add(Tombstone(table_name="stock_ins", row_id=in_id, revision=versions["stock_ins"]))
+    emit(db, "stock_in.deleted", id=in_id, po_id=db_in.po_id)
+    emit_balance(db, bal)
+    db.commit()
     return {"ok": True}
 
 # --- Stock OUT ---
 @app.post("/outs/", response_model=schemas.StockOUT)
+@query_budget(LEDGER + 8)
 def create_stock_out(stock_out: schemas.StockOUTCreate, db: Session = Depends(get_db)):
-    # Validate available stock
-    total_in = db.query(StockIN).filter(StockIN.po_id == stock_out.po_id).all()
-    sum_in = sum(i.qty for i in total_in)
-    
-    total_out = db.query(StockOUT).filter(StockOUT.po_id == stock_out.po_id).all()
-    sum_out = sum(o.qty for o in total_out)
-    
-    available = sum_in - sum_out
+    # Validate available stock (balance row stays locked until commit)
+    bal = lock_balance(db, stock_out.po_id)
+    if bal is None:
+        raise HTTPException(status_code=404, detail="PO not found")
+    available = bal.available
     if stock_out.qty > available:
         raise HTTPException(status_code=400, detail=f"Insufficient stock. Available: {available}, Requested: {stock_out.qty}")
 
     db_out = StockOUT(id=gen_id(), **stock_out.dict(), invoice_id=None)
     db.add(db_out)
-    db.commit()
-    db.refresh(db_out)
+    apply_movement(bal, out_delta=stock_out.qty)
+    Rollups().stock_out(stock_out.date, stock_out.product_id, stock_out.po_id, stock_out.qty).apply(db)
     
     po = db.query(PurchaseOrder).filter(PurchaseOrder.id == stock_out.po_id).first()
     po_no = po.po_no if po else "Unknown PO"
     
     log_history(db, "Stock OUT Added", f"OUT Qty {stock_out.qty} for PO {po_no}", "stock_out", db_out.id)
+    stamp(bump_versions(db, "stock_outs"), db_out)
+    emit(db, "stock_out.created", id=db_out.id, po_id=stock_out.po_id, po_no=po_no, qty=stock_out.qty)
+    emit_balance(db, bal, po_no)
+    db.commit()
+    db.refresh(db_out)
     return db_out
 
+@app.post("/outs/bulk", response_model=List[schemas.StockOUT])
+@query_budget(LEDGER + 7)
+def create_stock_outs_bulk(bulk: schemas.StockOUTBulk, db: Session = Depends(get_db)):
+    """Insert a whole batch of OUTs in one transaction; any bad row rejects the batch.
+
+    Availability is checked against the locked PO balances, cumulatively in row order.
+    """
+    po_nos = dict(db.query(PurchaseOrder.id, PurchaseOrder.po_no).filter(PurchaseOrder.id.in_({o.po_id for o in bulk.items})).all())
+    bals = lock_balances(db, po_nos.keys())
+
+    errors = []
+    rows = []
+    for n, o in enumerate(bulk.items):
+        bal = bals.get(o.po_id)
+        if bal is None:
+            errors.append({"row": n, "detail": f"PO {o.po_id} not found"})
+            continue
+        if o.qty > bal.available:
+            errors.append({"row": n, "detail": f"Insufficient stock. Available: {bal.available}, Requested: {o.qty}"})
+            continue
+        apply_movement(bal, out_delta=o.qty)
+        rows.append(dict(id=gen_id(), **o.dict(), invoice_id=None))
+
+    if errors:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=errors)
+
+    rollups = Rollups()
+    for r in rows:
+        rollups.stock_out(r["date"], r["product_id"], r["po_id"], r["qty"])
+    rollups.apply(db)
+
+    versions = bump_versions(db, "stock_outs")
+    if rows:
+        db.execute(insert(StockOUT), [{**r, **stamped(versions, "stock_outs")} for r in rows])
+        log_history_many(db, [("Stock OUT Added", f"OUT Qty {r['qty']} for PO {po_nos[r['po_id']]}", "stock_out", r["id"]) for r in rows])
+    emit(db, "stock_out.bulk_created", count=len(rows))
+    for bal in bals.values():
+        emit_balance(db, bal, po_nos[bal.po_id])
+    db.commit()
+    return rows
+
 @app.get("/outs/", response_model=List[schemas.StockOUT])
-def read_stock_outs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(StockOUT).order_by(StockOUT.date.desc()).offset(skip).limit(limit).all()
+@query_budget(3)
+def read_stock_outs(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_read_db)):
+    not_modified = conditional_get(db, request, response, "stock_outs")
+    if not_modified is not None:
+        return not_modified
+    q = db.query(*STOCK_OUT_ROWS.columns)
+    rows = paginate(q, response, [StockOUT.date, StockOUT.id], [date.fromisoformat, None], cursor=cursor, skip=skip, limit=limit, descending=True)
+    return json_response(STOCK_OUT_ROWS.dicts(rows), response)
 
 # --- Invoices ---
 @app.post("/invoices/", response_model=schemas.Invoice)
+@query_budget(13)
 def create_invoice(invoice_req: schemas.InvoiceCreate, db: Session = Depends(get_db)):
-    # 1. Generate Invoice No (simple logic for now, ideally count + 1 from DB)
-    count = db.query(Invoice).count() + 1
-    inv_no = f"SI-{str(count).zfill(5)}"
+    # 1. Generate Invoice No (sequence / counter row, never scans invoices)
+    inv_no = run_blocking(invoice_numbers.next_invoice_no)
     
     # 2. Create Invoice
     db_inv = Invoice(
@@ -240,10 +491,11 @@ def create_invoice(invoice_req: schemas.InvoiceCreate, db: Session = Depends(get
         invoice_no=inv_no, 
         date=datetime.utcnow().date(), 
         status="Draft", 
-        print_count=0
+        print_count=0,
+        line_count=0,
+        total_amount=0
     )
     db.add(db_inv)
-    db.commit()
     
     # 3. Associate OUTs
     out_ids = invoice_req.out_ids
@@ -253,18 +505,109 @@ def create_invoice(invoice_req: schemas.InvoiceCreate, db: Session = Depends(get
         if o.invoice_id:
              raise HTTPException(status_code=400, detail=f"Stock OUT {o.id} is already invoiced.")
         o.invoice_id = db_inv.id
+    adjust_invoice_totals(db, db_inv, outs)
     
+    log_history(db, "Invoice Created", f"Invoice {inv_no} created with {len(outs)} items", "invoice", db_inv.id)
+    stamp(bump_versions(db, "invoices", "stock_outs"), db_inv, *outs)
+    emit(db, "invoice.created", id=db_inv.id, invoice_no=inv_no, line_count=db_inv.line_count, total_amount=db_inv.total_amount)
     db.commit()
     db.refresh(db_inv)
-    
-    log_history(db, "Invoice Created", f"Invoice {inv_no} created with {len(out_ids)} items", "invoice", db_inv.id)
     return db_inv
 
+@app.post("/invoices/batch", response_model=schemas.InvoiceBatchResult)
+@query_budget(12)
+def create_invoice_batch(batch: schemas.InvoiceBatchRequest, db: Session = Depends(get_db)):
+    """Invoice every uninvoiced OUT in a date range, one invoice per product, PO or day.
+
+    With dry_run nothing is written and the planned invoices come back with
+    their totals. Otherwise all invoices are created in one transaction.
+    """
+    if batch.group_by not in BATCH_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(BATCH_GROUPINGS)}")
+    if batch.date_from > batch.date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+
+    groups = plan_batch_invoices(db, batch.date_from, batch.date_to, batch.group_by)
+    if groups and not batch.dry_run:
+        for g, inv_no in zip(groups, run_blocking(invoice_numbers.next_invoice_nos, len(groups))):
+            g["invoice_id"], g["invoice_no"] = gen_id(), inv_no
+        versions = bump_versions(db, "invoices", "stock_outs")
+        groups = create_batch_invoices(db, groups, batch.date_from, batch.date_to, batch.group_by, versions, datetime.utcnow().date())
+        log_history_many(db, [
+            ("Invoice Created", f"Invoice {g['invoice_no']} created with {g['line_count']} items (batch by {batch.group_by})", "invoice", g["invoice_id"])
+            for g in groups
+        ])
+        emit(db, "invoice.batch_created", count=len(groups), group_by=batch.group_by, date_from=batch.date_from, date_to=batch.date_to)
+        db.commit()
+
+    return {
+        "dry_run": batch.dry_run,
+        "group_by": batch.group_by,
+        "invoice_count": len(groups),
+        "line_count": sum(g["line_count"] for g in groups),
+        "total_amount": sum(g["total_amount"] for g in groups),
+        "invoices": [{**g, "key": str(g["key"])} for g in groups],
+    }
+
 @app.get("/invoices/", response_model=List[schemas.Invoice])
-def read_invoices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Invoice).order_by(Invoice.date.desc()).offset(skip).limit(limit).all()
+@query_budget(3)
+def read_invoices(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_read_db)):
+    not_modified = conditional_get(db, request, response, "invoices")
+    if not_modified is not None:
+        return not_modified
+    q = db.query(*INVOICE_ROWS.columns)
+    rows = paginate(q, response, [Invoice.date, Invoice.id], [date.fromisoformat, None], cursor=cursor, skip=skip, limit=limit, descending=True)
+    return json_response(INVOICE_ROWS.dicts(rows), response)
+
+@app.get("/invoices/{invoice_id}", response_model=schemas.InvoiceDetail)
+@query_budget(3)
+def read_invoice(invoice_id: str, db: Session = Depends(get_db)):
+    db_inv = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+    if not db_inv:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    db_inv.items = invoice_items(db, invoice_id)
+    return db_inv
+
+@app.get("/invoices/{invoice_id}/document")
+@query_budget(2)
+def read_invoice_document(invoice_id: str, format: str = "html", db: Session = Depends(get_db)):
+    """Print-ready invoice (html, or pdf when weasyprint is installed), served from the render cache when current."""
+    if format not in DOCUMENT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(DOCUMENT_FORMATS)}")
+    db_inv = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+    if not db_inv:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    try:
+        body, cached = invoice_document(db, db_inv, format)
+    except RenderUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return Response(
+        content=body,
+        media_type=DOCUMENT_FORMATS[format],
+        headers={"X-Render-Cache": "hit" if cached else "miss", "Content-Disposition": f'inline; filename="{db_inv.invoice_no}.{format}"'},
+    )
+
+@app.post("/invoices/documents", response_model=List[schemas.InvoiceDocument])
+@query_budget(2)
+def render_invoice_documents(req: schemas.InvoiceDocumentsRequest, db: Session = Depends(get_db)):
+    """Render (e.g. after a batch run) every listed invoice not already cached, in the worker process pool."""
+    if req.format not in DOCUMENT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(DOCUMENT_FORMATS)}")
+    invoices = db.query(Invoice).filter(Invoice.id.in_(req.invoice_ids)).all()
+    missing = set(req.invoice_ids) - {inv.id for inv in invoices}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Invoices not found: {', '.join(sorted(missing))}")
+    try:
+        rendered = render_invoices(db, invoices, req.format)
+    except RenderUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return [
+        {"invoice_id": inv.id, "invoice_no": inv.invoice_no, "content_version": inv.content_version, "size": size, "cached": cached}
+        for inv, size, cached in rendered
+    ]
 
 @app.put("/invoices/{invoice_id}/status")
+@query_budget(6)
 def update_invoice_status(invoice_id: str, status_val: str, db: Session = Depends(get_db)):
     db_inv = db.query(Invoice).filter(Invoice.id == invoice_id).first()
     if not db_inv:
@@ -275,11 +618,14 @@ def update_invoice_status(invoice_id: str, status_val: str, db: Session = Depend
     if status_val == "Printed":
         db_inv.print_count += 1
         
-    db.commit()
     log_history(db, "Invoice Status Changed", f"Invoice {db_inv.invoice_no} status: {old_status} -> {status_val}", "invoice", invoice_id)
+    stamp(bump_versions(db, "invoices"), db_inv)
+    emit(db, "invoice.status", id=invoice_id, invoice_no=db_inv.invoice_no, status=status_val, print_count=db_inv.print_count)
+    db.commit()
     return {"ok": True, "status": status_val, "print_count": db_inv.print_count}
 
 @app.post("/invoices/{invoice_id}/items", response_model=schemas.Invoice)
+@query_budget(11)
 def add_invoice_items(invoice_id: str, item_update: schemas.InvoiceUpdateItems, db: Session = Depends(get_db)):
     db_inv = db.query(Invoice).filter(Invoice.id == invoice_id).first()
     if not db_inv:
@@ -292,14 +638,20 @@ def add_invoice_items(invoice_id: str, item_update: schemas.InvoiceUpdateItems,
     for o in outs:
         if o.invoice_id and o.invoice_id != invoice_id:
              raise HTTPException(status_code=400, detail=f"Stock OUT {o.id} is already in another invoice.")
+    new_outs = [o for o in outs if o.invoice_id != invoice_id]
+    for o in new_outs:
         o.invoice_id = invoice_id
+    adjust_invoice_totals(db, db_inv, new_outs)
     
+    log_history(db, "Invoice Updated", f"Added {len(outs)} items to Invoice {db_inv.invoice_no}", "invoice", invoice_id)
+    stamp(bump_versions(db, "invoices", "stock_outs"), db_inv, *new_outs)
+    emit(db, "invoice.updated", id=invoice_id, invoice_no=db_inv.invoice_no, line_count=db_inv.line_count, total_amount=db_inv.total_amount)
     db.commit()
     db.refresh(db_inv)
-    log_history(db, "Invoice Updated", f"Added {len(outs)} items to Invoice {db_inv.invoice_no}", "invoice", invoice_id)
     return db_inv
 
 @app.delete("/invoices/{invoice_id}/items/{out_id}")
+@query_budget(10)
 def remove_invoice_item(invoice_id: str, out_id: str, db: Session = Depends(get_db)):
     db_inv = db.query(Invoice).filter(Invoice.id == invoice_id).first()
     if not db_inv:
@@ -313,10 +665,198 @@ def remove_invoice_item(invoice_id: str, out_id: str, db: Session = Depends(get_
         raise HTTPException(status_code=404, detail="Item not found in this invoice")
         
     db_out.invoice_id = None
-    db.commit()
+    adjust_invoice_totals(db, db_inv, [db_out], sign=-1)
     log_history(db, "Invoice Updated", f"Removed item from Invoice {db_inv.invoice_no}", "invoice", invoice_id)
+    stamp(bump_versions(db, "invoices", "stock_outs"), db_inv, db_out)
+    emit(db, "invoice.updated", id=invoice_id, invoice_no=db_inv.invoice_no, line_count=db_inv.line_count, total_amount=db_inv.total_amount)
+    db.commit()
     return {"ok": True}
+# --- Dashboard ---
+@app.get("/dashboard/", response_model=schemas.Dashboard)
+@query_budget(6)
+def read_dashboard(request: Request, response: Response, product_id: Optional[str] = None, po_status: Optional[str] = None, limit: int = 100, db: Session = Depends(get_db)):
+    """Everything the UI needs on load, built from a handful of GROUP BY queries."""
+    not_modified = conditional_get(db, request, response, "products", "purchase_orders", "stock_ins", "stock_outs", "invoices")
+    if not_modified is not None:
+        return not_modified
+    if po_status not in (None, "open", "closed"):
+        raise HTTPException(status_code=400, detail="po_status must be 'open' or 'closed'")
+
+    products = db.query(Product).filter(Product.is_active == True).all()
+
+    in_totals = db.query(StockIN.po_id.label("po_id"), func.sum(StockIN.qty).label("qty")).group_by(StockIN.po_id).subquery()
+    out_totals = db.query(StockOUT.po_id.label("po_id"), func.sum(StockOUT.qty).label("qty")).group_by(StockOUT.po_id).subquery()
+    sum_in = func.coalesce(in_totals.c.qty, 0)
+    sum_out = func.coalesce(out_totals.c.qty, 0)
+
+    po_q = (
+        db.query(PurchaseOrder, sum_in, sum_out)
+        .outerjoin(in_totals, in_totals.c.po_id == PurchaseOrder.id)
+        .outerjoin(out_totals, out_totals.c.po_id == PurchaseOrder.id)
+        .filter(PurchaseOrder.is_active == True)
+    )
+    outs_q = db.query(StockOUT)
+    inv_q = db.query(Invoice)
+    if product_id:
+        po_q = po_q.filter(PurchaseOrder.product_id == product_id)
+        outs_q = outs_q.filter(StockOUT.product_id == product_id)
+        inv_q = inv_q.filter(Invoice.id.in_(db.query(StockOUT.invoice_id).filter(StockOUT.product_id == product_id)))
+    if po_status == "open":
+        po_q = po_q.filter(sum_out < PurchaseOrder.po_qty)
+    elif po_status == "closed":
+        po_q = po_q.filter(sum_out >= PurchaseOrder.po_qty)
+
+    # PO totals ride along as plain attributes so the orm_mode schemas pick them up
+    pos = []
+    for po, total_in, total_out in po_q.all():
+        po.total_in, po.total_out, po.remaining = total_in, total_out, total_in - total_out
+        pos.append(po)
+
+    return {
+        "products": products,
+        "pos": pos,
+        "outs": outs_q.order_by(StockOUT.date.desc()).limit(limit).all(),
+        "invoices": inv_q.order_by(Invoice.date.desc()).limit(limit).all(),
+    }
+
+# --- Reports ---
+@app.get("/reports/movements", response_model=List[schemas.MovementReportRow])
+@query_budget(2)
+def read_movement_report(request: Request, response: Response, date_from: Optional[date] = None, date_to: Optional[date] = None, granularity: str = "day", group_by: str = "product", product_id: Optional[str] = None, po_id: Optional[str] = None, db: Session = Depends(get_db)):
+    """IN/OUT quantities and invoiced value per day, week or month, from the daily rollups.
+
+    group_by is product, po or total. Weeks start on Monday; the first and
+    last period only cover the days inside the requested range.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    if group_by not in GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(GROUPINGS)}")
+    not_modified = conditional_get(db, request, response, "products", "stock_ins", "stock_outs", "invoices")
+    if not_modified is not None:
+        return not_modified
+    return movement_report(db, date_from, date_to, granularity, group_by, product_id, po_id)
+
+# --- Delta sync ---
+@app.get("/sync", response_model=schemas.SyncResponse)
+@query_budget(8)
+def read_sync(since: Optional[str] = None, db: Session = Depends(get_db)):
+    """Rows changed since the `since` watermark; omit it for a full snapshot."""
+    return json_response(changes_since(db, decode_watermark(since) if since else None))
+
+# --- Search ---
+@app.get("/search", response_model=List[schemas.SearchHit])
+@query_budget(2)
+def search_records(q: str, types: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db)):
+    """Products, materials, POs and invoice numbers matching q (prefix or substring), best first.
+
+    `types` is a comma-separated subset of product, material, po, invoice.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    kinds = SEARCH_TYPES
+    if types:
+        kinds = tuple(t.strip() for t in types.split(",") if t.strip())
+        unknown = set(kinds) - set(SEARCH_TYPES)
+        if unknown or not kinds:
+            raise HTTPException(status_code=400, detail=f"types must be among: {', '.join(SEARCH_TYPES)}")
+    return search(db, q, kinds, limit)
+
+# --- Change feed ---
+@app.get("/events")
+async def change_feed():
+    """Server-sent change events: po.balance, stock_out.created, invoice.status, ...
+
+    A {"type": "resync"} event means this client fell behind and should reload.
+    """
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Import ---
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024  # bigger uploads spill to a temp file
+
+def _run_import(kind: str, spool, dry_run: bool):
+    db = SessionLocal()
+    try:
+        return import_csv(db, kind, io.TextIOWrapper(spool, encoding="utf-8-sig", newline=""), source=f"upload:{kind}", dry_run=dry_run)
+    except CSVImportError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    finally:
+        db.close()
+
+@app.post("/import/{kind}")
+async def import_data(kind: str, request: Request, dry_run: bool = False):
+    """Import a CSV request body (see importer.py for the columns)."""
+    if kind not in IMPORTERS:
+        raise HTTPException(status_code=404, detail=f"Unknown import, expected one of: {', '.join(IMPORTERS)}")
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        return await run_in_threadpool(_run_import, kind, spool, dry_run)
+
+# --- Export ---
+@app.get("/export/{dataset}")
+@query_budget(1)
+def export_dataset(dataset: str, format: str = "csv", date_from: Optional[date] = None, date_to: Optional[date] = None):
+    # Streams straight from a server-side cursor; the generator opens its own session
+    if dataset not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export, expected one of: {', '.join(EXPORTS)}")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+    filename = f"{dataset}-{date_from or 'start'}-{date_to or 'end'}.{format}"
+    return StreamingResponse(
+        stream_export(dataset, format, date_from, date_to),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# --- Internal ---
+@app.get("/internal/pool", include_in_schema=False)
+def read_pool_metrics():
+    pools = {"primary": engine.pool}
+    if async_engine is not None:
+        pools["async"] = async_engine.sync_engine.pool
+    if replica_engine is not None:
+        pools["replica"] = replica_engine.pool
+    if async_replica_engine is not None:
+        pools["async_replica"] = async_replica_engine.sync_engine.pool
+    return {name: pool_metrics[name].snapshot(pool) for name, pool in pools.items()}
+
+@app.get("/internal/replica", include_in_schema=False)
+def read_replica_status():
+    return replica_router.snapshot()
+
+@app.get("/internal/cache", include_in_schema=False)
+def read_cache_metrics():
+    return {"catalog": catalog.snapshot(), "invoice_documents": render_cache.snapshot()}
+
+@app.get("/internal/events", include_in_schema=False)
+def read_event_metrics():
+    return broker.snapshot()
+
+@app.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+def read_metrics():
+    # Prometheus text exposition format
+    return route_metrics.render() + render_pool_metrics(read_pool_metrics()) + render_cache_metrics(read_cache_metrics())
+
 # --- History ---
 @app.get("/history/", response_model=List[schemas.HistoryLog])
-def read_history(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(HistoryLog).order_by(HistoryLog.ts.desc()).offset(skip).limit(limit).all()
+@query_budget(2)
+def read_history(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_read_db)):
+    h = history_source(db)
+    rows_of = Projection(schemas.HistoryLog, h)
+    rows = paginate(db.query(*rows_of.columns), response, [h.c.ts, h.c.id], [datetime.fromisoformat, int], cursor=cursor, skip=skip, limit=limit, descending=True)
+    return json_response(rows_of.dicts(rows), response)
+
+@app.get("/history/search", response_model=List[schemas.HistoryEntry])
+@query_budget(2)
+def read_history_search(ref_type: Optional[str] = None, ref_id: Optional[str] = None, date_from: Optional[date] = None, date_to: Optional[date] = None, limit: int = 100, include_archived: bool = True, db: Session = Depends(get_db)):
+    """History of a record (ref_type/ref_id) and/or a date range, newest first, archived months included."""
+    if not (ref_type or ref_id or date_from or date_to):
+        raise HTTPException(status_code=400, detail="Give ref_type/ref_id or a date range")
+    return search_history(db, ref_type, ref_id, date_from, date_to, limit=min(limit, 1000), include_archived=include_archived)
+
+# --- Async mode (DB_ASYNC=1) ---
+if DB_ASYNC:
+    install_async_routes(app, get_db, get_async_db)
+    install_async_routes(app, get_read_db, get_async_read_db)
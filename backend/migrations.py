@@ -0,0 +1,93 @@
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.orm import Session
+
+from database import Base
+import models  # noqa: F401  (registers every table on Base.metadata)
+from versions import ensure_versions
+from search import install_search_index
+from history_store import install_history_partitions
+
+
+def _default_sql(column, dialect):
+    default = column.default
+    if default is None or not default.is_scalar:
+        return ""
+    return " DEFAULT " + str(literal(default.arg).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def add_missing_columns(engine):
+    """ALTER TABLE ... ADD COLUMN for model columns the live table doesn't have yet."""
+    inspector = inspect(engine)
+    added = set()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}{_default_sql(column, engine.dialect)}'))
+                added.add((table.name, column.name))
+    return added
+
+
+def create_missing_indexes(engine):
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _backfill_invoice_totals(db: Session):
+    from invoicing import recompute_invoice_totals
+    recompute_invoice_totals(db)
+
+
+def _backfill_rollups(db: Session):
+    from rollups import rebuild_rollups
+    rebuild_rollups(db)
+
+
+# Run once when the named column is first added to an existing table
+BACKFILLS = {
+    ("invoices", "total_amount"): _backfill_invoice_totals,
+}
+
+# Run once when the named table is first created in a database that already has data
+TABLE_BACKFILLS = {
+    "daily_rollups": _backfill_rollups,
+}
+
+
+def upgrade(engine):
+    """Bring a database created by an older version of the app up to the current models."""
+    existing = set(inspect(engine).get_table_names())
+    install_history_partitions(engine)  # before create_all, which would make history_logs a plain table
+    Base.metadata.create_all(bind=engine)
+    added = add_missing_columns(engine)
+    create_missing_indexes(engine)
+    ensure_versions(engine)
+    install_search_index(engine)
+
+    pending = [fn for key, fn in BACKFILLS.items() if key in added]
+    if existing:
+        pending += [fn for table, fn in TABLE_BACKFILLS.items() if table not in existing]
+    if pending:
+        db = Session(bind=engine)
+        try:
+            for fn in pending:
+                fn(db)
+            db.commit()
+        finally:
+            db.close()
+    return added
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    for table, column in sorted(upgrade(engine)):
+        print(f"Added {table}.{column}")
+    print("Schema is up to date")
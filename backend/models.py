@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Date, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Date, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -11,11 +11,18 @@ class Product(Base):
     code = Column(String, unique=True, index=True, nullable=False)
     rate = Column(Float, nullable=False)
     is_active = Column(Boolean, default=True)
+    revision = Column(Integer, nullable=False, default=0, index=True)  # table change version of the last write
+    updated_at = Column(DateTime, nullable=True)
 
     materials = relationship("Material", back_populates="product", cascade="all, delete-orphan")
     pos = relationship("PurchaseOrder", back_populates="product")
     outs = relationship("StockOUT", back_populates="product")
 
+    # Partial "active only" indexes cover the soft-delete filters (list routes, dashboard)
+    __table_args__ = (
+        Index("ix_products_active", "id", sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
+
 
 class Material(Base):
     __tablename__ = "materials"
@@ -24,9 +31,15 @@ class Material(Base):
     product_id = Column(String, ForeignKey("products.id"), nullable=False)
     name = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
+    revision = Column(Integer, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, nullable=True)
 
     product = relationship("Product", back_populates="materials")
 
+    __table_args__ = (
+        Index("ix_materials_product_active", "product_id", sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
+
 
 class PurchaseOrder(Base):
     __tablename__ = "purchase_orders"
@@ -37,10 +50,48 @@ class PurchaseOrder(Base):
     po_qty = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    revision = Column(Integer, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, nullable=True)
 
     product = relationship("Product", back_populates="pos")
     ins = relationship("StockIN", back_populates="po", cascade="all, delete-orphan")
     outs = relationship("StockOUT", back_populates="po")
+    balance = relationship("POBalance", back_populates="po", uselist=False, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_purchase_orders_active", "id", sqlite_where=is_active == True, postgresql_where=is_active == True),
+        Index("ix_purchase_orders_product_active", "product_id", "id", sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
+
+
+class POBalance(Base):
+    __tablename__ = "po_balances"
+
+    # Running totals per PO, kept in step with stock_ins / stock_outs by ledger.py
+    po_id = Column(String, ForeignKey("purchase_orders.id"), primary_key=True)
+    total_in = Column(Integer, nullable=False, default=0)
+    total_out = Column(Integer, nullable=False, default=0)
+    available = Column(Integer, nullable=False, default=0)
+
+    po = relationship("PurchaseOrder", back_populates="balance")
+
+
+class DailyRollup(Base):
+    __tablename__ = "daily_rollups"
+
+    # IN/OUT and invoiced totals per day, product and PO, kept in step incrementally by rollups.py
+    day = Column(Date, primary_key=True)
+    product_id = Column(String, ForeignKey("products.id"), primary_key=True)
+    po_id = Column(String, ForeignKey("purchase_orders.id"), primary_key=True)
+    in_qty = Column(Integer, nullable=False, default=0)
+    out_qty = Column(Integer, nullable=False, default=0)
+    invoiced_qty = Column(Integer, nullable=False, default=0)
+    invoiced_value = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_daily_rollups_product_day", "product_id", "day"),
+        Index("ix_daily_rollups_po_day", "po_id", "day"),
+    )
 
 
 class StockIN(Base):
@@ -52,9 +103,16 @@ class StockIN(Base):
     qty = Column(Integer, nullable=False)
     note = Column(String, nullable=True)
     edited = Column(Boolean, default=False)
+    revision = Column(Integer, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, nullable=True)
 
     po = relationship("PurchaseOrder", back_populates="ins")
 
+    __table_args__ = (
+        Index("ix_stock_ins_po_qty", "po_id", "qty"),  # covers the per-PO sums
+        Index("ix_stock_ins_date_id", "date", "id"),
+    )
+
 
 class StockOUT(Base):
     __tablename__ = "stock_outs"
@@ -66,11 +124,23 @@ class StockOUT(Base):
     qty = Column(Integer, nullable=False)
     note = Column(String, nullable=True)
     invoice_id = Column(String, ForeignKey("invoices.id"), nullable=True)
+    revision = Column(Integer, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, nullable=True)
 
     product = relationship("Product", back_populates="outs")
     po = relationship("PurchaseOrder", back_populates="outs")
     invoice = relationship("Invoice", back_populates="outs")
 
+    __table_args__ = (
+        Index("ix_stock_outs_date_id", "date", "id"),
+        Index("ix_stock_outs_po_qty", "po_id", "qty"),  # covers the per-PO sums
+        Index("ix_stock_outs_product_date", "product_id", "date"),
+        # Invoiced and not-yet-invoiced OUTs are looked up separately: lines by invoice,
+        # and batch invoicing's date range over the (few) OUTs not on an invoice yet
+        Index("ix_stock_outs_invoice", "invoice_id", sqlite_where=invoice_id != None, postgresql_where=invoice_id != None),
+        Index("ix_stock_outs_uninvoiced", "date", "id", sqlite_where=invoice_id == None, postgresql_where=invoice_id == None),
+    )
+
 
 class Invoice(Base):
     __tablename__ = "invoices"
@@ -80,9 +150,20 @@ class Invoice(Base):
     date = Column(Date, nullable=False)
     status = Column(String, default="Draft")  # Draft, Ready, Printed
     print_count = Column(Integer, default=0)
+    # Denormalized from the attached stock_outs, kept current by invoicing.py
+    line_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0)
+    # Bumped whenever the printed lines change; keys the rendered document cache (documents.py)
+    content_version = Column(Integer, nullable=False, default=0)
+    revision = Column(Integer, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, nullable=True)
 
     outs = relationship("StockOUT", back_populates="invoice")
 
+    __table_args__ = (
+        Index("ix_invoices_date_id", "date", "id"),
+    )
+
 
 class HistoryLog(Base):
     __tablename__ = "history_logs"
@@ -94,3 +175,33 @@ class HistoryLog(Base):
     details = Column(Text, nullable=True)
     ref_type = Column(String, nullable=True)  # e.g., 'product', 'invoice'
     ref_id = Column(String, nullable=True)
+
+    # Partitioned by month on ts (history_store.py); AUTOINCREMENT keeps SQLite ids growing across rotations
+    __table_args__ = (
+        Index("ix_history_logs_ts_id", "ts", "id"),
+        Index("ix_history_logs_ref", "ref_type", "ref_id", "ts"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+
+    # Hard-deleted rows, so GET /sync can tell clients to drop them
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(String, nullable=False)
+    revision = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_tombstones_table_revision", "table_name", "revision"),
+    )
+
+
+class Counter(Base):
+    __tablename__ = "counters"
+
+    # Named monotonically increasing counters (e.g. invoice numbers)
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import date, datetime
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *parsers):
+    """Turn an opaque cursor back into its values, one parser per value (None = as is)."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(parsers):
+            raise ValueError("wrong cursor length")
+        return [p(v) if p else v for p, v in zip(parsers, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(query, response: Response, columns, parsers, cursor: str = None, skip: int = 0, limit: int = 100, descending: bool = False):
+    """Page a query by (sort key..., id) and put the next cursor in the X-Next-Cursor header.
+
+    `columns` is the sort key followed by the unique tiebreaker (usually the id); an
+    index on the same columns keeps every page an index range scan. With a cursor,
+    `skip` is ignored; without one the old offset paging still works.
+    """
+    key = tuple_(*columns) if len(columns) > 1 else columns[0]
+    if cursor:
+        values = decode_cursor(cursor, *parsers)
+        bound = tuple_(*values) if len(values) > 1 else values[0]
+        query = query.filter(key < bound if descending else key > bound)
+
+    query = query.order_by(*(c.desc() for c in columns) if descending else columns)
+    if skip and not cursor:
+        query = query.offset(skip)
+
+    limit = max(limit, 0)  # limit=0 is an empty page, as before cursors
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if limit > 0:
+            last = rows[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*(getattr(last, c.key) for c in columns))
+    return rows
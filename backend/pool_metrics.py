@@ -0,0 +1,108 @@
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Counters for one engine's connection pool, fed by SQLAlchemy pool events."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checked_out = 0
+        self.connects = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def observe_wait(self, seconds: float):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def attach(self, pool):
+        @event.listens_for(pool, "checkout")
+        def _checkout(dbapi_conn, record, proxy):
+            with self._lock:
+                self.checkouts += 1
+                self.checked_out += 1
+
+        @event.listens_for(pool, "checkin")
+        def _checkin(dbapi_conn, record):
+            with self._lock:
+                self.checked_out = max(0, self.checked_out - 1)
+
+        @event.listens_for(pool, "connect")
+        def _connect(dbapi_conn, record):
+            with self._lock:
+                self.connects += 1
+                # A fresh connection while the pool is already at size means overflow
+                if isinstance(pool, QueuePool) and pool.overflow() > 0:
+                    self.overflow_events += 1
+
+        @event.listens_for(pool, "invalidate")
+        def _invalidate(dbapi_conn, record, exception):
+            with self._lock:
+                self.invalidations += 1
+
+        @event.listens_for(pool, "soft_invalidate")
+        def _soft_invalidate(dbapi_conn, record, exception):
+            with self._lock:
+                self.soft_invalidations += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "checked_out": self.checked_out,
+                "connects": self.connects,
+                "overflow_events": self.overflow_events,
+                "timeouts": self.timeouts,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+                "wait_seconds_total": round(self.wait_total, 6),
+                "wait_seconds_max": round(self.wait_max, 6),
+                "wait_seconds_avg": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+        data["pool"] = pool.status()
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), overflow=pool.overflow(), idle=pool.checkedin())
+        return data
+
+
+class _TimedPoolMixin:
+    """Measures how long each checkout waited for a free connection."""
+
+    metrics: PoolMetrics = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                with self.metrics._lock:
+                    self.metrics.timeouts += 1
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_wait(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def timed_pool_class(metrics: PoolMetrics, use_async: bool = False):
+    # Bound as a class attribute so it survives pool.recreate() after dispose/invalidation
+    base = TimedAsyncQueuePool if use_async else TimedQueuePool
+    return type(base.__name__, (base,), {"metrics": metrics})
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from fastapi import Request
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import SessionLocal, AsyncSessionLocal, engine, replica_engine, async_engine, async_replica_engine
+from models import Counter
+from versions import VERSION_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# After a write, a client reads from the primary for this long (read-your-writes)
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+# Reads go back to the primary while the replica is further behind than this
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1.0"))
+CLIENT_ID_HEADER = "X-Client-Id"
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_VERSIONS_TOTAL = select(func.coalesce(func.sum(Counter.value), 0)).where(Counter.name.like(VERSION_PREFIX + "%"))
+
+
+def client_key(request: Request) -> str:
+    """The browser tab's X-Client-Id (frontend/script.js), else its address."""
+    return request.headers.get(CLIENT_ID_HEADER) or (request.client.host if request.client else "unknown")
+
+
+class ReplicaRouter:
+    """Decides, per read, whether the replica may serve it.
+
+    Lag is measured with the table version counters every write bumps: a
+    background thread compares their total on both sides every check_interval
+    seconds, and the replica counts as behind since the first check that saw
+    the primary ahead of where it is now. Clients that wrote in the last
+    sticky_seconds stay on the primary. Stickiness is kept per process, so
+    with several workers route a client to the same one or raise the window
+    to cover the replica's normal lag.
+    """
+
+    def __init__(self, primary, replica, sticky_seconds: float = REPLICA_STICKY_SECONDS, max_lag: float = REPLICA_MAX_LAG_SECONDS, check_interval: float = REPLICA_CHECK_INTERVAL):
+        self.primary = primary
+        self.replica = replica
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._sticky = {}  # client key -> monotonic deadline
+        self._ahead = []  # (monotonic time, primary total) seen while the replica was behind
+        self.healthy = False  # until the first check passes
+        self.lag = None
+        self.error = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.replica is not None
+
+    def wrote(self, client: str):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sticky) > 10000:
+                self._sticky = {k: t for k, t in self._sticky.items() if t > now}
+            self._sticky[client] = now + self.sticky_seconds
+
+    def use_replica(self, client: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            ok = self.enabled and self.healthy and self._sticky.get(client, 0) <= now
+            if ok:
+                self.replica_reads += 1
+            else:
+                self.primary_reads += 1
+            return ok
+
+    def replica_failed(self, exc: Exception):
+        """A replica query failed mid-request: stop routing there until a check succeeds."""
+        with self._lock:
+            self.healthy = False
+            self.error = str(exc)
+
+    def check(self):
+        """Measure the replica's lag once and update `healthy`."""
+        try:
+            with self.primary.connect() as conn:
+                primary_total = conn.execute(_VERSIONS_TOTAL).scalar()
+            with self.replica.connect() as conn:
+                replica_total = conn.execute(_VERSIONS_TOTAL).scalar()
+        except Exception as exc:
+            if self.error is None:
+                logger.warning("Replica check failed, reads stay on the primary: %s", exc)
+            with self._lock:
+                self.healthy, self.lag, self.error = False, None, str(exc)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._ahead = [(t, total) for t, total in self._ahead if total > replica_total]
+            if primary_total > replica_total:
+                self._ahead.append((now, primary_total))
+            self.lag = now - self._ahead[0][0] if self._ahead else 0.0
+            self.healthy = self.lag <= self.max_lag
+            self.error = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.check_interval)
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="replica-check", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "healthy": self.healthy,
+                "lag_seconds": None if self.lag is None else round(self.lag, 3),
+                "error": self.error,
+                "sticky_clients": sum(1 for t in self._sticky.values() if t > time.monotonic()),
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads,
+            }
+
+
+replica_router = ReplicaRouter(engine, replica_engine)
+
+
+class ReplicaSession(Session):
+    """Read session on the replica that falls back to the primary.
+
+    A statement that fails on the replica marks it unhealthy and runs again on
+    the primary (info["primary"]), which then serves the rest of the session,
+    so the request that hit the failure still gets its rows.
+    """
+
+    def _with_fallback(self, run, *args, **kw):
+        try:
+            return run(self, *args, **kw)
+        except DBAPIError as exc:
+            primary = self.info.pop("primary", None)
+            if primary is None:
+                raise
+            logger.warning("Replica read failed, retrying on the primary: %s", exc)
+            replica_router.replica_failed(exc)
+            self.rollback()
+            self.bind = primary
+            return run(self, *args, **kw)
+
+    def execute(self, *args, **kw):
+        return self._with_fallback(Session.execute, *args, **kw)
+
+    def scalar(self, *args, **kw):
+        return self._with_fallback(Session.scalar, *args, **kw)
+
+    def scalars(self, *args, **kw):
+        return self._with_fallback(Session.scalars, *args, **kw)
+
+
+ReplicaSessionLocal = None
+if replica_engine is not None:
+    ReplicaSessionLocal = sessionmaker(class_=ReplicaSession, autocommit=False, autoflush=False, bind=replica_engine, info={"primary": engine})
+
+AsyncReplicaSessionLocal = None
+if async_replica_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    AsyncReplicaSessionLocal = async_sessionmaker(
+        async_replica_engine, sync_session_class=ReplicaSession, autoflush=False, expire_on_commit=False, info={"primary": async_engine.sync_engine},
+    )
+
+
+def get_read_db(request: Request):
+    """Session for read-only routes: the replica when it's healthy and the client hasn't just written."""
+    db = ReplicaSessionLocal() if replica_router.use_replica(client_key(request)) else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    on_replica = replica_router.use_replica(client_key(request)) and AsyncReplicaSessionLocal is not None
+    async with (AsyncReplicaSessionLocal() if on_replica else AsyncSessionLocal()) as db:
+        yield db
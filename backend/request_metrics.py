@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+# In test/CI runs, QUERY_BUDGET_ENFORCE=1 turns an exceeded budget into a 500
+QUERY_BUDGET_ENFORCE = os.getenv("QUERY_BUDGET_ENFORCE", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time", "budget", "route", "committed")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.budget = None  # set by bind_budget when budgets are enforced
+        self.route = None
+        self.committed = False
+
+
+# A mutable holder, so counts made in threadpool threads / greenlets (which run
+# on a copy of the context) land on the request's own stats object.
+_current: ContextVar = ContextVar("request_stats", default=None)
+# Process-wide watchers for assert_max_queries (the app may run on another thread)
+_watchers = []
+_watchers_lock = threading.Lock()
+
+
+def current_stats():
+    return _current.get()
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def query_budget(max_statements: int):
+    """Declare how many SQL statements a route may issue; checked at commit and by the metrics middleware."""
+    def decorator(fn):
+        fn.query_budget = max_statements
+        return fn
+    return decorator
+
+
+def check_budget(endpoint, stats: RequestStats, route: str):
+    budget = getattr(endpoint, "query_budget", None)
+    if budget is not None and stats.statements > budget:
+        raise QueryBudgetExceeded(f"{route} issued {stats.statements} SQL statements, budget is {budget}")
+
+
+async def bind_budget(request: Request):
+    """App dependency under QUERY_BUDGET_ENFORCE: hands the route's budget to the commit check below."""
+    stats, route = _current.get(), request.scope.get("route")
+    if stats is not None and route is not None:
+        stats.budget = getattr(route.endpoint, "query_budget", None)
+        stats.route = f"{request.method} {route.path}"
+
+
+@event.listens_for(Session, "before_commit")
+def _check_budget_before_commit(session):
+    # Over budget fails the commit, so the write rolls back instead of persisting behind a 500
+    stats = _current.get()
+    if stats is None or stats.budget is None:
+        return
+    session.flush()
+    if stats.statements > stats.budget:
+        raise QueryBudgetExceeded(f"{stats.route} issued {stats.statements} SQL statements before commit, budget is {stats.budget}")
+    stats.committed = True
+
+
+@contextmanager
+def assert_max_queries(max_statements: int):
+    """Fail if the block (e.g. a TestClient call) issues more than max_statements statements.
+
+    Counts every statement in the process while the block runs, so keep it single-request.
+    """
+    stats = RequestStats()
+    with _watchers_lock:
+        _watchers.append(stats)
+    try:
+        yield stats
+    finally:
+        with _watchers_lock:
+            _watchers.remove(stats)
+    if stats.statements > max_statements:
+        raise QueryBudgetExceeded(f"{stats.statements} SQL statements issued, budget is {max_statements}")
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _current.get()
+        for target in ([stats] if stats is not None else []) + _watchers:
+            target.statements += 1
+            target.db_time += elapsed
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = ",".join(f'{k}="{v}"' for k, v in zip(label_names, labels))
+            for bound, n in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+class RouteMetrics:
+    """Per-route latency, DB time and statement-count histograms in Prometheus text format."""
+
+    LABELS = ("method", "route")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = Histogram("http_request_duration_seconds", "Total request latency", LATENCY_BUCKETS)
+        self.db_time = Histogram("db_time_per_request_seconds", "Time spent in SQL per request", LATENCY_BUCKETS)
+        self.statements = Histogram("db_statements_per_request", "SQL statements issued per request", STATEMENT_BUCKETS)
+        self.responses = {}  # (method, route, status) -> count
+
+    def observe(self, method: str, route: str, status: int, latency: float, stats: RequestStats):
+        labels = (method, route)
+        with self._lock:
+            self.latency.observe(labels, latency)
+            self.db_time.observe(labels, stats.db_time)
+            self.statements.observe(labels, stats.statements)
+            key = (method, route, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self) -> str:
+        with self._lock:
+            lines = ["# HELP http_requests_total Requests by route and status", "# TYPE http_requests_total counter"]
+            for (method, route, status), n in sorted(self.responses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+            for hist in (self.latency, self.db_time, self.statements):
+                lines.extend(hist.render(self.LABELS))
+        return "\n".join(lines) + "\n"
+
+
+def render_pool_metrics(snapshots: dict) -> str:
+    fields = {
+        "checked_out": ("gauge", "Connections currently checked out"),
+        "checkouts": ("counter", "Total pool checkouts"),
+        "overflow_events": ("counter", "Connections opened beyond pool_size"),
+        "timeouts": ("counter", "Checkouts that timed out waiting for a connection"),
+        "invalidations": ("counter", "Connections invalidated"),
+        "wait_seconds_total": ("counter", "Total time spent waiting for a connection"),
+    }
+    lines = []
+    for field, (kind, help_text) in fields.items():
+        name = f"db_pool_{field}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for pool, snap in snapshots.items():
+            lines.append(f'{name}{{pool="{pool}"}} {snap[field]}')
+    return "\n".join(lines) + "\n"
+
+
+def render_cache_metrics(snapshots: dict) -> str:
+    lines = []
+    for field in ("hits", "misses", "evictions", "invalidations"):
+        name = f"cache_{field}_total"
+        lines += [f"# HELP {name} Cache {field}", f"# TYPE {name} counter"]
+        for cache, snap in snapshots.items():
+            lines.append(f'{name}{{cache="{cache}"}} {snap[field]}')
+    return "\n".join(lines) + "\n"
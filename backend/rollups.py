@@ -0,0 +1,210 @@
+import argparse
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import case, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import DailyRollup, Product, PurchaseOrder, StockIN, StockOUT
+
+AMOUNTS = ("in_qty", "out_qty", "invoiced_qty", "invoiced_value")
+GRANULARITIES = ("day", "week", "month")
+GROUPINGS = ("product", "po", "total")
+
+
+class Rollups:
+    """Deltas for the daily_rollups rows touched by one transaction.
+
+    Collect the changes with stock_in/stock_out/invoiced, then apply() them in a
+    single upsert (row-level increments, so concurrent writers don't clash).
+    Invoiced quantities and values are booked on the OUT's date.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0, 0, 0.0])
+
+    def stock_in(self, day, product_id, po_id, qty, sign: int = 1):
+        self.deltas[(day, product_id, po_id)][0] += sign * qty
+        return self
+
+    def stock_out(self, day, product_id, po_id, qty, sign: int = 1):
+        self.deltas[(day, product_id, po_id)][1] += sign * qty
+        return self
+
+    def invoiced(self, day, product_id, po_id, qty, rate, sign: int = 1):
+        d = self.deltas[(day, product_id, po_id)]
+        d[2] += sign * qty
+        d[3] += sign * qty * rate
+        return self
+
+    def apply(self, db: Session):
+        rows = [dict(day=k[0], product_id=k[1], po_id=k[2], **dict(zip(AMOUNTS, v))) for k, v in sorted(self.deltas.items()) if any(v)]
+        if rows:
+            _upsert(db, rows)
+        self.deltas.clear()
+
+
+def _upsert(db: Session, rows):
+    table = DailyRollup.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # No portable upsert: update, then insert the rows that didn't exist
+        for row in rows:
+            key = (table.c.day == row["day"]) & (table.c.product_id == row["product_id"]) & (table.c.po_id == row["po_id"])
+            if not db.execute(update(table).where(key).values({c: table.c[c] + row[c] for c in AMOUNTS})).rowcount:
+                db.execute(table.insert().values(**row))
+        return
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.product_id, table.c.po_id],
+        set_={c: table.c[c] + stmt.excluded[c] for c in AMOUNTS},
+    )
+    db.execute(stmt, rows)
+
+
+def reprice_rollups(db: Session, product_id: str, rate: float):
+    """Invoiced values follow the product rate, as invoice totals do (see update_product)."""
+    db.execute(
+        update(DailyRollup).where(DailyRollup.product_id == product_id).values(invoiced_value=DailyRollup.invoiced_qty * rate),
+        execution_options={"synchronize_session": False},
+    )
+
+
+# --- Rebuild ---
+def _in_range(column, date_from, date_to):
+    conds = []
+    if date_from:
+        conds.append(column >= date_from)
+    if date_to:
+        conds.append(column <= date_to)
+    return conds
+
+
+def compute_rollups(db, date_from: date = None, date_to: date = None) -> dict:
+    """Rollup rows recomputed from stock_ins / stock_outs, keyed by (day, product_id, po_id)."""
+    totals = defaultdict(lambda: [0, 0, 0, 0.0])
+    ins = (
+        select(StockIN.date, PurchaseOrder.product_id, StockIN.po_id, func.sum(StockIN.qty))
+        .join(PurchaseOrder, PurchaseOrder.id == StockIN.po_id)
+        .where(*_in_range(StockIN.date, date_from, date_to))
+        .group_by(StockIN.date, PurchaseOrder.product_id, StockIN.po_id)
+    )
+    for day, product_id, po_id, qty in db.execute(ins):
+        totals[(day, product_id, po_id)][0] = int(qty)
+
+    invoiced = StockOUT.invoice_id != None
+    outs = (
+        select(
+            StockOUT.date, StockOUT.product_id, StockOUT.po_id, func.sum(StockOUT.qty),
+            func.sum(case((invoiced, StockOUT.qty), else_=0)),
+            func.sum(case((invoiced, StockOUT.qty * Product.rate), else_=0)),
+        )
+        .join(Product, Product.id == StockOUT.product_id)
+        .where(*_in_range(StockOUT.date, date_from, date_to))
+        .group_by(StockOUT.date, StockOUT.product_id, StockOUT.po_id)
+    )
+    for day, product_id, po_id, qty, inv_qty, inv_value in db.execute(outs):
+        totals[(day, product_id, po_id)][1:] = [int(qty), int(inv_qty or 0), float(inv_value or 0)]
+    return totals
+
+
+def _same(stored, expected) -> bool:
+    return stored[:3] == expected[:3] and abs(stored[3] - expected[3]) < 0.005
+
+
+def rebuild_rollups(db, date_from: date = None, date_to: date = None, fix: bool = True):
+    """Recompute the rollups for a date range (everything by default) from the raw stock tables.
+
+    Returns (key, stored, expected) tuples for the rows that were wrong or
+    missing. With fix=False nothing is written. The caller commits.
+    """
+    expected = compute_rollups(db, date_from, date_to)
+    stored = {
+        (r.day, r.product_id, r.po_id): [r.in_qty, r.out_qty, r.invoiced_qty, r.invoiced_value]
+        for r in db.execute(select(DailyRollup).where(*_in_range(DailyRollup.day, date_from, date_to))).scalars()
+    }
+    zero = [0, 0, 0, 0.0]
+    mismatches = [
+        (key, stored.get(key), expected.get(key, zero))
+        for key in sorted(stored.keys() | expected.keys())
+        if not _same(stored.get(key, zero), expected.get(key, zero))
+    ]
+    if fix and mismatches:
+        db.execute(delete(DailyRollup).where(*_in_range(DailyRollup.day, date_from, date_to)))
+        rows = [dict(day=k[0], product_id=k[1], po_id=k[2], **dict(zip(AMOUNTS, v))) for k, v in expected.items()]
+        if rows:
+            db.execute(DailyRollup.__table__.insert(), rows)
+    return mismatches
+
+
+# --- Reports ---
+def _period(column, granularity: str, dialect: str):
+    if granularity == "day":
+        return column
+    if dialect == "postgresql":
+        return func.date_trunc(granularity, column).cast(column.type)
+    if granularity == "week":
+        return func.date(column, "-6 days", "weekday 1")  # the Monday on or before
+    return func.date(column, "start of month")
+
+
+def movement_report(db: Session, date_from: date = None, date_to: date = None, granularity: str = "day", group_by: str = "product", product_id: str = None, po_id: str = None):
+    """IN/OUT quantities and invoiced value per period, read from the rollups only.
+
+    Weeks start on Monday; each period is labelled by its first day.
+    """
+    period = _period(DailyRollup.day, granularity, db.get_bind().dialect.name).label("period")
+    keys = [period]
+    if group_by in ("product", "po"):
+        keys.append(DailyRollup.product_id)
+    if group_by == "po":
+        keys.append(DailyRollup.po_id)
+    conds = _in_range(DailyRollup.day, date_from, date_to)
+    if product_id:
+        conds.append(DailyRollup.product_id == product_id)
+    if po_id:
+        conds.append(DailyRollup.po_id == po_id)
+
+    sums = [func.sum(getattr(DailyRollup, c)) for c in AMOUNTS]
+    stmt = (
+        select(*keys, *(s.label(c) for s, c in zip(sums, AMOUNTS)))
+        .where(*conds)
+        .group_by(*keys)
+        .having(or_(*(s != 0 for s in sums)))  # rows netted back to zero by edits/deletes
+        .order_by(*keys)
+    )
+    rows = []
+    for r in db.execute(stmt).mappings():
+        row = dict(r)
+        if isinstance(row["period"], str):
+            row["period"] = date.fromisoformat(row["period"])
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify the daily IN/OUT rollups")
+    parser.add_argument("--verify", action="store_true", help="only report mismatches, don't write")
+    parser.add_argument("--date-from", type=date.fromisoformat)
+    parser.add_argument("--date-to", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    upgrade(engine)
+    db = SessionLocal()
+    try:
+        mismatches = rebuild_rollups(db, args.date_from, args.date_to, fix=not args.verify)
+        db.commit()
+    finally:
+        db.close()
+
+    for key, current, expected in mismatches[:50]:
+        print(f"{key[0]} product {key[1]} PO {key[2]}: stored {current} -> expected {expected}")
+    print(f"{len(mismatches)} rollup row(s) {'out of sync' if args.verify else 'rebuilt'}")
+    if args.verify and mismatches:
+        raise SystemExit(1)
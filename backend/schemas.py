@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, date
 
 # --- Product ---
@@ -61,6 +61,9 @@ class StockINBase(BaseModel):
 class StockINCreate(StockINBase):
     pass
 
+class StockINBulk(BaseModel):
+    items: List[StockINCreate]
+
 class StockIN(StockINBase):
     id: str
     edited: bool
@@ -79,6 +82,9 @@ class StockOUTBase(BaseModel):
 class StockOUTCreate(StockOUTBase):
     pass
 
+class StockOUTBulk(BaseModel):
+    items: List[StockOUTCreate]
+
 class StockOUT(StockOUTBase):
     id: str
     invoice_id: Optional[str] = None
@@ -101,11 +107,68 @@ class InvoiceUpdateItems(BaseModel):
 class Invoice(InvoiceBase):
     id: str
     print_count: int
+    line_count: int = 0
+    total_amount: float = 0
     # outs: List[StockOUT] = []
 
     class Config:
         orm_mode = True
 
+class InvoiceItem(BaseModel):
+    id: str
+    date: date
+    qty: int
+    note: Optional[str] = None
+    product_id: str
+    product_name: str
+    product_code: str
+    rate: float
+    po_id: str
+    po_no: str
+    amount: float
+
+    class Config:
+        orm_mode = True
+
+class InvoiceDetail(Invoice):
+    items: List[InvoiceItem] = []
+
+class InvoiceDocumentsRequest(BaseModel):
+    invoice_ids: List[str]
+    format: str = "html"  # html or pdf
+
+class InvoiceDocument(BaseModel):
+    invoice_id: str
+    invoice_no: str
+    content_version: int
+    size: int  # bytes
+    cached: bool  # already rendered before this request
+
+class InvoiceBatchRequest(BaseModel):
+    date_from: date
+    date_to: date
+    group_by: str = "product"  # product, po or day: one invoice per group
+    dry_run: bool = False
+
+class InvoiceBatchGroup(BaseModel):
+    key: str  # product id, PO id or day
+    label: str  # product code, PO number or day
+    line_count: int
+    qty: int
+    total_amount: float
+    date_from: date  # earliest / latest OUT in the group
+    date_to: date
+    invoice_id: Optional[str] = None  # not set on a dry run
+    invoice_no: Optional[str] = None
+
+class InvoiceBatchResult(BaseModel):
+    dry_run: bool
+    group_by: str
+    invoice_count: int
+    line_count: int
+    total_amount: float
+    invoices: List[InvoiceBatchGroup] = []
+
 # --- History ---
 class HistoryLog(BaseModel):
     id: int
@@ -118,3 +181,48 @@ class HistoryLog(BaseModel):
 
     class Config:
         orm_mode = True
+
+class HistoryEntry(HistoryLog):
+    archived: bool = False  # read from an archive file rather than the database
+
+# --- Dashboard ---
+class POSummary(PurchaseOrder):
+    total_in: int
+    total_out: int
+    remaining: int
+
+class Dashboard(BaseModel):
+    products: List[Product]
+    pos: List[POSummary]
+    outs: List[StockOUT]
+    invoices: List[Invoice]
+
+# --- Reports ---
+class MovementReportRow(BaseModel):
+    period: date  # first day of the day/week/month
+    product_id: Optional[str] = None
+    po_id: Optional[str] = None
+    in_qty: int
+    out_qty: int
+    invoiced_qty: int
+    invoiced_value: float
+
+# --- Delta sync ---
+class SyncResponse(BaseModel):
+    watermark: str
+    products: List[Product] = []
+    materials: List[Material] = []
+    purchase_orders: List[PurchaseOrder] = []
+    stock_ins: List[StockIN] = []
+    stock_outs: List[StockOUT] = []
+    invoices: List[Invoice] = []
+    deleted: Dict[str, List[str]] = {}  # table -> ids of hard-deleted rows
+
+# --- Search ---
+class SearchHit(BaseModel):
+    type: str  # product, material, po, invoice
+    id: str
+    product_id: Optional[str] = None
+    field: str  # the column that matched
+    text: str
+    match: str  # exact, prefix, substring
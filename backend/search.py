@@ -0,0 +1,185 @@
+import logging
+import os
+from sqlalchemy import func, inspect, literal, select, text, union_all, case
+from sqlalchemy.orm import Session
+
+from models import Product, Material, PurchaseOrder, Invoice
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+# Trigram matching needs at least 3 characters; shorter queries match prefixes only
+MIN_SUBSTRING = 3
+
+# kind -> (table, searched columns, product id column, active flag column)
+SOURCES = {
+    "product": ("products", ("name", "code"), "id", "is_active"),
+    "material": ("materials", ("name",), "product_id", "is_active"),
+    "po": ("purchase_orders", ("po_no",), "product_id", "is_active"),
+    "invoice": ("invoices", ("invoice_no",), None, None),
+}
+SEARCH_TYPES = tuple(SOURCES)
+
+MATCH_EXACT, MATCH_PREFIX, MATCH_SUBSTRING = "exact", "prefix", "substring"
+_MATCH_ORDER = {MATCH_EXACT: 0, MATCH_PREFIX: 1, MATCH_SUBSTRING: 2}
+
+_fts_ready = False
+
+
+# --- Index installation ---
+def _pg_statements():
+    yield "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+    for table, columns, _, _ in SOURCES.values():
+        for column in columns:
+            yield f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)"
+
+
+def _doc_values(kind, row, columns, product_col):
+    product = f"{row}.{product_col}" if product_col else "NULL"
+    return [f"'{kind}', {row}.id, {product}, '{column}', {row}.{column}" for column in columns]
+
+
+def _sqlite_statements():
+    # search_docs holds one row per searchable value; search_fts is a trigram
+    # index over it (external content), kept in step by the triggers below.
+    yield """CREATE TABLE search_docs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        ref_id TEXT NOT NULL,
+        product_id TEXT,
+        field TEXT NOT NULL,
+        text TEXT NOT NULL COLLATE NOCASE
+    )"""
+    yield "CREATE INDEX ix_search_docs_ref ON search_docs (kind, ref_id)"
+    yield "CREATE INDEX ix_search_docs_text ON search_docs (text)"
+    yield "CREATE VIRTUAL TABLE search_fts USING fts5(text, content='search_docs', content_rowid='id', tokenize='trigram')"
+    yield "CREATE TRIGGER search_docs_ai AFTER INSERT ON search_docs BEGIN INSERT INTO search_fts(rowid, text) VALUES (new.id, new.text); END"
+    yield "CREATE TRIGGER search_docs_ad AFTER DELETE ON search_docs BEGIN INSERT INTO search_fts(search_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+
+    insert = "INSERT INTO search_docs (kind, ref_id, product_id, field, text)"
+    for kind, (table, columns, product_col, active_col) in SOURCES.items():
+        active = f" WHERE {active_col}" if active_col else ""
+        for values in _doc_values(kind, table, columns, product_col):
+            yield f"{insert} SELECT {values} FROM {table}{active}"
+
+        new_active = f" WHERE new.{active_col}" if active_col else ""
+        new_docs = " UNION ALL ".join(f"SELECT {v}{new_active}" for v in _doc_values(kind, "new", columns, product_col))
+        drop_docs = f"DELETE FROM search_docs WHERE kind = '{kind}' AND ref_id = old.id;"
+        watched = ", ".join(c for c in (*columns, product_col, active_col) if c and c != "id")
+        yield f"CREATE TRIGGER search_{table}_ai AFTER INSERT ON {table} BEGIN {insert} {new_docs}; END"
+        yield f"CREATE TRIGGER search_{table}_au AFTER UPDATE OF {watched} ON {table} BEGIN {drop_docs} {insert} {new_docs}; END"
+        yield f"CREATE TRIGGER search_{table}_ad AFTER DELETE ON {table} BEGIN {drop_docs} END"
+
+
+def install_search_index(engine):
+    """Create the search indexes if missing: pg_trgm GIN indexes on Postgres, an FTS5 trigram table on SQLite.
+
+    Without them search still works, by plain LIKE scans.
+    """
+    global _fts_ready
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        try:
+            with engine.begin() as conn:
+                for stmt in _pg_statements():
+                    conn.execute(text(stmt))
+        except Exception:
+            logger.warning("pg_trgm indexes unavailable, search falls back to unindexed ILIKE", exc_info=True)
+    elif dialect == "sqlite":
+        if inspect(engine).has_table("search_docs"):
+            _fts_ready = True
+            return
+        try:
+            with engine.begin() as conn:
+                for stmt in _sqlite_statements():
+                    conn.exec_driver_sql(stmt)
+            _fts_ready = True
+        except Exception:
+            logger.warning("FTS5 trigram tokenizer unavailable, search falls back to LIKE", exc_info=True)
+
+
+# --- Queries ---
+def _escape_like(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _match(q: str, value: str) -> str:
+    value = value.lower()
+    if value == q:
+        return MATCH_EXACT
+    return MATCH_PREFIX if value.startswith(q) else MATCH_SUBSTRING
+
+
+def _search_fts(db: Session, q: str, types, limit: int):
+    # Unary + keeps the planner off ix_search_docs_ref, which would scan every doc of a kind
+    kinds = ", ".join(f"'{k}'" for k in types)
+    columns = "d.kind, d.ref_id, d.product_id, d.field, d.text"
+    # Prefix hits walk the text index in order, so the exact match (if any) comes first
+    rows = db.execute(
+        text(f"SELECT d.id, {columns} FROM search_docs d WHERE d.text >= :lo AND d.text < :hi AND +d.kind IN ({kinds}) ORDER BY d.text LIMIT :n"),
+        {"lo": q, "hi": q + "\uffff", "n": limit},
+    ).all()
+    if len(rows) < limit and len(q) >= MIN_SUBSTRING:
+        seen = {r[0] for r in rows}
+        phrase = '"' + q.replace('"', '""') + '"'
+        more = db.execute(
+            text(f"SELECT d.id, {columns} FROM search_fts JOIN search_docs d ON d.id = search_fts.rowid "
+                 f"WHERE search_fts MATCH :phrase AND +d.kind IN ({kinds}) LIMIT :n"),
+            {"phrase": phrase, "n": limit + len(rows)},
+        ).all()
+        rows += [r for r in more if r[0] not in seen]
+    return [r[1:] for r in rows]
+
+
+def _search_like(db: Session, q: str, types, limit: int):
+    models = {"product": Product, "material": Material, "po": PurchaseOrder, "invoice": Invoice}
+    prefix = _escape_like(q) + "%"
+    pattern = prefix if len(q) < MIN_SUBSTRING else "%" + prefix
+    selects = []
+    for kind in types:
+        model = models[kind]
+        _, columns, product_col, active_col = SOURCES[kind]
+        for column in columns:
+            value = getattr(model, column)
+            stmt = select(
+                literal(kind).label("kind"),
+                model.id.label("ref_id"),
+                (getattr(model, product_col) if product_col else literal(None)).label("product_id"),
+                literal(column).label("field"),
+                value.label("text"),
+            ).where(value.ilike(pattern, escape="\\"))
+            if active_col:
+                stmt = stmt.where(getattr(model, active_col) == True)
+            selects.append(stmt)
+    u = union_all(*selects).subquery()
+    lowered = func.lower(u.c.text)
+    rank = case((lowered == q, 0), (lowered.like(prefix, escape="\\"), 1), else_=2)
+    return db.execute(
+        select(u.c.kind, u.c.ref_id, u.c.product_id, u.c.field, u.c.text).order_by(rank, func.length(u.c.text), u.c.text).limit(limit)
+    ).all()
+
+
+def search(db: Session, q: str, types=SEARCH_TYPES, limit: int = 20) -> list:
+    """Products (name/code), materials, POs and invoices matching q, best first.
+
+    Exact matches rank above prefix matches, which rank above substring
+    matches; shorter values first within each. Inactive records are skipped and
+    a record matching on two fields is returned once.
+    """
+    q = q.strip().lower()
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    # Fetch extra rows: a product can match on both name and code
+    fetch = limit * 2
+    if _fts_ready and db.get_bind().dialect.name == "sqlite":
+        rows = _search_fts(db, q, types, fetch)
+    else:
+        rows = _search_like(db, q, types, fetch)
+
+    hits = {}
+    for kind, ref_id, product_id, field, value in rows:
+        hit = {"type": kind, "id": ref_id, "product_id": product_id, "field": field, "text": value, "match": _match(q, value)}
+        best = hits.get((kind, ref_id))
+        if best is None or _MATCH_ORDER[hit["match"]] < _MATCH_ORDER[best["match"]]:
+            hits[(kind, ref_id)] = hit
+    ranked = sorted(hits.values(), key=lambda h: (_MATCH_ORDER[h["match"]], len(h["text"]), h["text"].lower()))
+    return ranked[:limit]
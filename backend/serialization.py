@@ -0,0 +1,70 @@
+"""Fast JSON path for large list responses.
+
+Returning ORM objects makes FastAPI hydrate full entities, validate each one
+through the orm_mode response_model and encode the result with the stdlib json
+module. Handlers on the fast path select just the schema's columns, turn the
+rows into dicts (Projection) and return a FastJSONResponse, which FastAPI sends
+as is. The JSON is the same as the response_model would produce: same keys in
+the same order, floats as floats. The response_model stays on the route for
+the OpenAPI docs.
+"""
+import json
+import typing
+from datetime import date, datetime
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional, see requirements.txt
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson (stdlib json when it isn't installed)."""
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def json_response(content, response: Response = None) -> FastJSONResponse:
+    """Wrap content, carrying over headers already set on the injected Response (ETag, X-Next-Cursor)."""
+    return FastJSONResponse(content, headers=dict(response.headers) if response is not None else None)
+
+
+def _is_float(annotation) -> bool:
+    return annotation is float or float in typing.get_args(annotation)
+
+
+class Projection:
+    """The columns a response schema needs, in its field order, and row -> dict conversion.
+
+    `source` is a mapped class or a table/subquery with the schema's field names
+    as column names.
+    """
+
+    def __init__(self, schema, source):
+        self.fields = list(schema.model_fields)
+        get = (lambda name: getattr(source, name)) if isinstance(source, type) else (lambda name: source.c[name])
+        self.columns = [get(name).label(name) for name in self.fields]
+        # SQLite hands back whole-number REALs as ints; pydantic would have made them floats
+        self._floats = [name for name, f in schema.model_fields.items() if _is_float(f.annotation)]
+
+    def dicts(self, rows) -> list:
+        fields, floats = self.fields, self._floats
+        out = []
+        for row in rows:
+            d = dict(zip(fields, row))
+            for name in floats:
+                if d[name] is not None:
+                    d[name] = float(d[name])
+            out.append(d)
+        return out
@@ -0,0 +1,53 @@
+"""Tests run against a scratch SQLite database; run from backend/ with ``python -m pytest``."""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="samara-tests-")
+# The app reads its configuration at import time, so this has to come first
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["INVOICE_RENDER_DIR"] = os.path.join(_tmp, "render_cache")
+os.environ["HISTORY_ARCHIVE_DIR"] = os.path.join(_tmp, "history_archive")
+os.environ["QUERY_BUDGET_ENFORCE"] = "1"
+for name in ("DATABASE_REPLICA_URL", "DB_ASYNC", "HISTORY_BUFFERED"):
+    os.environ.pop(name, None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCALE = 0.05  # ~5 products, 100 POs, 4k stock movements
+
+
+@pytest.fixture(scope="session")
+def engine():
+    from database import engine
+    from migrations import upgrade
+
+    upgrade(engine)
+    return engine
+
+
+@pytest.fixture(scope="session")
+def dataset(engine):
+    """A small synthetic dataset (bench/datagen.py), seeded once per run."""
+    from bench.datagen import reset, seed
+
+    with engine.begin() as conn:
+        reset(conn)
+        return seed(conn, SCALE)
+
+
+@pytest.fixture(scope="session")
+def client(dataset):
+    from fastapi.testclient import TestClient
+    import main
+
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def product(client):
+    """A fresh product, so a test can change it without touching the shared dataset."""
+    code = f"T-{uuid.uuid4().hex[:8]}"
+    return client.post("/products/", json={"name": code, "code": code, "rate": 2.0}).json()
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+import time
+
+from sqlalchemy.util import greenlet_spawn
+
+from async_mode import run_blocking
+
+
+def test_run_blocking_calls_directly_in_sync_mode():
+    assert run_blocking(threading.get_ident) == threading.get_ident()
+
+
+def test_run_blocking_keeps_the_event_loop_free():
+    async def scenario():
+        loop_thread = threading.get_ident()
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        # greenlet_spawn is what AsyncSession.run_sync runs the handler body in
+        blocked = greenlet_spawn(lambda: run_blocking(lambda: time.sleep(0.2) or threading.get_ident()))
+        worker_thread, _ = await asyncio.gather(blocked, ticker())
+        return loop_thread, worker_thread, ticks
+
+    loop_thread, worker_thread, ticks = asyncio.run(scenario())
+    assert worker_thread != loop_thread
+    assert ticks[-1] - ticks[0] < 0.2  # the loop kept running while the call slept
@@ -0,0 +1,33 @@
+from catalog import CatalogCache
+from database import SessionLocal
+from request_metrics import assert_max_queries
+
+
+def test_over_cap_is_remembered(client, product):
+    cache = CatalogCache(max_products=2, check_interval=3600)
+    db = SessionLocal()
+    try:
+        assert cache.product_by_code(db, product["code"]).id == product["id"]
+        assert cache.snapshot()["over_cap"]
+        # Only the lookup itself: the catalogue isn't re-read to learn it is still too big
+        with assert_max_queries(1):
+            assert cache.product_by_name(db, product["name"]).id == product["id"]
+        with assert_max_queries(1):
+            assert cache.rates(db, [product["id"]]) == {product["id"]: product["rate"]}
+    finally:
+        db.close()
+
+
+def test_over_cap_is_rechecked_when_products_change(client, product):
+    cache = CatalogCache(max_products=10_000, check_interval=0)
+    db = SessionLocal()
+    try:
+        cache.max_products = 2
+        cache.product_by_code(db, product["code"])
+        assert cache.snapshot()["over_cap"]
+        cache.max_products = 10_000
+        client.put(f"/products/{product['id']}", json={**product, "rate": 3.0})
+        assert cache.rates(db, [product["id"]]) == {product["id"]: 3.0}
+        assert not cache.snapshot()["over_cap"]
+    finally:
+        db.close()
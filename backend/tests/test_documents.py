@@ -0,0 +1,25 @@
+import os
+
+from documents import RenderCache
+
+
+def test_render_cache_tracks_size_without_rescanning(tmp_path, monkeypatch):
+    cache = RenderCache(str(tmp_path), max_bytes=250)
+    scans = []
+    tidy = cache.tidy
+    monkeypatch.setattr(cache, "tidy", lambda: scans.append(1) or tidy())
+
+    cache.put("a", 1, "html", b"x" * 100)
+    assert len(scans) == 1  # the first write learns the directory size
+    cache.put("b", 1, "html", b"x" * 100)
+    cache.put("a", 2, "html", b"x" * 100)  # supersedes a.1 in place
+    assert len(scans) == 1
+    assert cache.invalidations == 1
+    assert cache.get("a", 1, "html") is None
+
+    os.utime(cache._path("a", 2, "html"), (0, 0))  # least recently served
+    cache.put("c", 1, "html", b"x" * 100)  # 300 bytes: over budget
+    assert len(scans) == 2
+    assert cache.evictions == 1
+    assert cache.get("a", 2, "html") is None
+    assert cache.snapshot()["bytes"] == 200
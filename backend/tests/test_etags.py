@@ -0,0 +1,33 @@
+def _etag(client, path, **params):
+    response = client.get(path, params=params)
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+
+def _status(client, path, etag, **params):
+    return client.get(path, params=params, headers={"If-None-Match": etag}).status_code
+
+
+def test_not_modified_until_the_table_changes(client, product):
+    etag = _etag(client, "/products/", limit=5)
+    assert _status(client, "/products/", etag, limit=5) == 304
+    assert _status(client, "/products/", etag.removeprefix("W/"), limit=5) == 304  # weak comparison
+    assert _status(client, "/products/", "*", limit=5) == 304
+    assert _status(client, "/products/", etag, limit=6) == 200  # the query is part of the tag
+
+    # A write to another table leaves the tag alone
+    client.post("/pos/", json={"product_id": product["id"], "po_no": f"PO-{product['code']}", "po_qty": 1})
+    assert _status(client, "/products/", etag, limit=5) == 304
+
+    client.put(f"/products/{product['id']}", json={"name": product["name"], "code": product["code"], "rate": 9.0})
+    assert _status(client, "/products/", etag, limit=5) == 200
+    assert _etag(client, "/products/", limit=5) != etag
+
+
+def test_rolled_back_write_keeps_the_tag(client, product):
+    # Duplicate PO number: rejected, so the purchase_orders version must not move
+    po = {"product_id": product["id"], "po_no": f"PO-{product['code']}", "po_qty": 1}
+    client.post("/pos/", json=po)
+    etag = _etag(client, "/pos/", limit=5)
+    assert client.post("/pos/", json=po).status_code == 400
+    assert _status(client, "/pos/", etag, limit=5) == 304
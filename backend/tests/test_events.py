@@ -0,0 +1,93 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from database import SessionLocal
+from events import PgNotifyBridge, broker, emit
+from request_metrics import QueryBudgetExceeded
+
+
+class _FakeCursor:
+    def __init__(self, sent):
+        self.sent = sent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        if len(params[1]) >= 8000:
+            raise ValueError("payload string too long")
+        self.sent.append(json.loads(params[1]))
+
+
+class _FakeRaw:
+    def __init__(self, sent):
+        self.sent = sent
+        self.driver_connection = type("Conn", (), {"closed": 0})()
+
+    def cursor(self):
+        return _FakeCursor(self.sent)
+
+    def close(self):
+        pass
+
+
+def test_oversized_event_is_truncated():
+    db = SessionLocal()
+    try:
+        emit(db, "invoice.batch_created", ids=["x" * 36] * 500)
+        emit(db, "invoice.created", id="a")
+        assert db.info["change_events"] == [{"type": "invoice.batch_created", "truncated": True}, {"type": "invoice.created", "id": "a"}]
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_failed_notify_drops_only_that_event(monkeypatch):
+    sent = []
+    bridge = PgNotifyBridge(None, broker)
+    monkeypatch.setattr(bridge, "_connect", lambda: _FakeRaw(sent))
+    bridge.send([{"type": "a"}, {"type": "big", "ids": ["x" * 36] * 500}, {"type": "b"}])
+    bridge.send(None)
+    bridge._notify_loop()
+    assert [ev["type"] for ev in sent] == ["a", "b"]
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+    monkeypatch.setattr(broker, "publish", events.extend)
+    return events
+
+
+def test_events_wait_for_commit(engine, published):
+    db = SessionLocal()
+    try:
+        db.execute(select(1))  # handlers always have a transaction open by the time they emit
+        emit(db, "test.rolled_back")
+        db.rollback()
+        emit(db, "test.committed")
+        assert published == []
+        db.commit()
+    finally:
+        db.close()
+    assert published == [{"type": "test.committed"}]
+
+
+def test_rolled_back_request_emits_nothing(client, published, monkeypatch):
+    import main
+
+    code = f"E-{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(main.create_product, "query_budget", 1)  # emit() runs, then the commit fails
+    with pytest.raises(QueryBudgetExceeded):
+        client.post("/products/", json={"name": code, "code": code, "rate": 1.0})
+    assert published == []
+
+    monkeypatch.setattr(main.create_product, "query_budget", 7)
+    assert client.post("/products/", json={"name": code, "code": code, "rate": 1.0}).status_code == 200
+    assert [ev["type"] for ev in published] == ["product.created"]
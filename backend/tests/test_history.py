@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import func
+
+import history
+from database import SessionLocal
+from models import HistoryLog
+
+
+@pytest.fixture
+def history_buffer(engine):
+    buffer = history.start_buffering(SessionLocal, max_rows=10_000, max_delay=3600)
+    yield buffer
+    history.stop_buffering()
+
+
+def _count():
+    db = SessionLocal()
+    try:
+        return db.query(func.count(HistoryLog.id)).scalar()
+    finally:
+        db.close()
+
+
+def test_buffered_rows_wait_for_commit(history_buffer):
+    db = SessionLocal()
+    try:
+        history.log_history(db, "Test", "committed", "test", "1")
+        history.log_history_many(db, [("Test", "committed", "test", "2")])
+        assert history_buffer._rows == []
+        db.commit()
+    finally:
+        db.close()
+    assert [r["ref_id"] for r in history_buffer._rows] == ["1", "2"]
+    before = _count()
+    history_buffer.flush()
+    assert _count() == before + 2
+
+
+def test_buffered_rows_dropped_on_rollback(history_buffer):
+    db = SessionLocal()
+    try:
+        db.query(HistoryLog.id).first()  # handlers always touch the database before they fail
+        history.log_history(db, "Test", "rolled back", "test", "3")
+        history.log_history_many(db, [("Test", "rolled back", "test", "4")])
+        db.rollback()
+        db.commit()  # a later commit on the same session must not pick them up
+    finally:
+        db.close()
+    assert history_buffer._rows == []
@@ -0,0 +1,106 @@
+import io
+import uuid
+
+import pytest
+from sqlalchemy import event, func
+
+import history
+import importer
+from database import SessionLocal
+from importer import CSVImportError, import_csv
+from models import HistoryLog, POBalance, Product, PurchaseOrder, StockIN, StockOUT
+from versions import read_versions
+
+
+@pytest.fixture(params=[False, True], ids=["direct", "buffered"])
+def history_buffer(request, engine):
+    if not request.param:
+        yield None
+        return
+    yield history.start_buffering(SessionLocal, max_rows=10_000, max_delay=3600)
+    history.stop_buffering()
+
+
+@pytest.fixture
+def product_code(engine):
+    code = f"IMP-{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        db.add(Product(id=str(uuid.uuid4()), name=code, code=code, rate=1.0, is_active=True))
+        db.commit()
+    finally:
+        db.close()
+    return code
+
+
+def _counts(history_buffer):
+    if history_buffer is not None:
+        history_buffer.flush()
+    db = SessionLocal()
+    try:
+        return db.query(func.count(HistoryLog.id)).scalar(), db.query(func.count(PurchaseOrder.id)).scalar()
+    finally:
+        db.close()
+
+
+def _run(kind, text, dry_run=False):
+    db = SessionLocal()
+    try:
+        return import_csv(db, kind, io.StringIO(text), source="test", dry_run=dry_run)
+    finally:
+        db.close()
+
+
+def test_dry_run_leaves_history_unchanged(history_buffer, product_code, monkeypatch):
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_ROWS", 1)
+    tag = uuid.uuid4().hex[:8]
+    before = _counts(history_buffer)
+    summary = _run("pos", f"po_no,product_code,po_qty\nA-{tag},{product_code},10\nB-{tag},{product_code},5\n", dry_run=True)
+    assert summary["pos"] == 2
+    assert _counts(history_buffer) == before
+
+
+def test_rejected_file_leaves_history_unchanged(history_buffer, product_code, monkeypatch):
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_ROWS", 1)  # the valid first line is inserted and logged before the bad one
+    tag = uuid.uuid4().hex[:8]
+    before = _counts(history_buffer)
+    with pytest.raises(CSVImportError):
+        _run("pos", f"po_no,product_code,po_qty\nA-{tag},{product_code},10\nB-{tag},NO-SUCH-CODE,5\n")
+    assert _counts(history_buffer) == before
+
+
+def test_import_logs_each_chunk(history_buffer, product_code, monkeypatch):
+    monkeypatch.setattr(importer, "IMPORT_CHUNK_ROWS", 1)
+    tag = uuid.uuid4().hex[:8]
+    history_rows, pos = _counts(history_buffer)
+    _run("pos", f"po_no,product_code,po_qty\nA-{tag},{product_code},10\nB-{tag},{product_code},5\n")
+    assert _counts(history_buffer) == (history_rows + 2, pos + 2)
+
+
+def test_movements_bump_versions_after_locking_balances(engine, product_code):
+    tag = uuid.uuid4().hex[:8]
+    _run("pos", f"po_no,product_code,po_qty\nA-{tag},{product_code},10\n")
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        summary = _run("movements", f"type,po_no,date,qty\nIN,A-{tag},2024-01-02,7\nOUT,A-{tag},2024-01-03,3\n")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert (summary["ins"], summary["outs"]) == (1, 1)
+
+    # Same lock order as POST /ins/ and /outs/: balance rows first, version counters last
+    balances = next(i for i, s in enumerate(statements) if "FROM po_balances" in s)
+    counters = next(i for i, s in enumerate(statements) if s.startswith("UPDATE counters"))
+    assert balances < counters
+
+    db = SessionLocal()
+    try:
+        versions = read_versions(db, ["stock_ins", "stock_outs"])
+        po_id = db.query(PurchaseOrder.id).filter(PurchaseOrder.po_no == f"A-{tag}").scalar()
+        assert db.query(StockIN.revision).filter(StockIN.po_id == po_id).scalar() == versions["stock_ins"]
+        assert db.query(StockOUT.revision).filter(StockOUT.po_id == po_id).scalar() == versions["stock_outs"]
+        assert db.get(POBalance, po_id).available == 4
+    finally:
+        db.close()
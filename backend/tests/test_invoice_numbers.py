@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from invoice_numbers import INVOICE_PREFIX, InvoiceNumberAllocator
+
+
+def _n(invoice_no):
+    return int(invoice_no[len(INVOICE_PREFIX):])
+
+
+def test_numbers_are_unique_across_threads_and_processes(engine):
+    # Two allocators stand in for two worker processes sharing the counter
+    workers = [InvoiceNumberAllocator(engine), InvoiceNumberAllocator(engine, block_size=4)]
+    with ThreadPoolExecutor(8) as pool:
+        numbers = list(pool.map(lambda i: workers[i % 2].next_invoice_no(), range(64)))
+    assert len(set(numbers)) == len(numbers)
+
+
+def test_block_allocator(engine):
+    a, b = InvoiceNumberAllocator(engine, block_size=5), InvoiceNumberAllocator(engine, block_size=5)
+    first = _n(a.next_invoice_no())
+    other = _n(b.next_invoice_no())
+    assert other == first + 5  # a reserved a whole block up front
+    assert [_n(a.next_invoice_no()) for _ in range(4)] == list(range(first + 1, first + 5))
+
+    # A batch takes what's left of the block, then reserves the rest in one go, in order
+    batch = [_n(x) for x in b.next_invoice_nos(7)]
+    assert batch[:4] == list(range(other + 1, other + 5))
+    assert batch[4:] == sorted(batch[4:]) and batch[4] > other + 4
+    assert len(set(batch)) == 7
+
+
+def test_created_invoices_get_distinct_numbers(client, product):
+    po = client.post("/pos/", json={"product_id": product["id"], "po_no": f"PO-{product['code']}", "po_qty": 100}).json()
+    client.post("/ins/", json={"po_id": po["id"], "date": "2024-01-01", "qty": 10})
+    outs = [client.post("/outs/", json={"product_id": product["id"], "po_id": po["id"], "date": "2024-01-01", "qty": 1}).json() for _ in range(3)]
+    numbers = [client.post("/invoices/", json={"out_ids": [o["id"]]}).json()["invoice_no"] for o in outs]
+    assert len(set(numbers)) == 3
+    assert numbers == sorted(numbers, key=_n)
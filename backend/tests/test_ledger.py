@@ -0,0 +1,58 @@
+import uuid
+from datetime import date
+
+import pytest
+
+from database import SessionLocal
+from ledger import rebuild_balances
+from models import POBalance
+
+TODAY = date.today().isoformat()
+
+
+@pytest.fixture
+def po(client, product):
+    return client.post("/pos/", json={"product_id": product["id"], "po_no": f"PO-{product['code']}", "po_qty": 100}).json()
+
+
+def _balance(po_id):
+    db = SessionLocal()
+    try:
+        bal = db.get(POBalance, po_id)
+        assert rebuild_balances(db, fix=False) == []  # the ledger agrees with the raw rows
+        return bal.total_in, bal.total_out, bal.available
+    finally:
+        db.close()
+
+
+def test_out_cannot_overdraw(client, po):
+    stock_in = client.post("/ins/", json={"po_id": po["id"], "date": TODAY, "qty": 10}).json()
+    out = {"product_id": po["product_id"], "po_id": po["id"], "date": TODAY}
+    assert client.post("/outs/", json={**out, "qty": 6}).status_code == 200
+    assert _balance(po["id"]) == (10, 6, 4)
+
+    response = client.post("/outs/", json={**out, "qty": 5})
+    assert response.status_code == 400
+    assert "Available: 4" in response.json()["detail"]
+    # Bulk rows are checked cumulatively: each fits, together they don't
+    assert client.post("/outs/bulk", json={"items": [{**out, "qty": 3}, {**out, "qty": 3}]}).status_code == 400
+    assert client.put(f"/ins/{stock_in['id']}", json={"po_id": po["id"], "date": TODAY, "qty": 5}).status_code == 400
+    assert client.delete(f"/ins/{stock_in['id']}").status_code == 400
+    assert _balance(po["id"]) == (10, 6, 4)
+
+    assert client.post("/outs/", json={**out, "qty": 4}).status_code == 200
+    assert client.put(f"/ins/{stock_in['id']}", json={"po_id": po["id"], "date": TODAY, "qty": 12}).status_code == 200
+    assert _balance(po["id"]) == (12, 10, 2)
+
+
+@pytest.mark.parametrize("path", ["/ins/", "/outs/"])
+def test_unknown_po_is_404(client, product, path):
+    po_id = str(uuid.uuid4())
+    body = {"po_id": po_id, "product_id": product["id"], "date": TODAY, "qty": 1}
+    response = client.post(path, json=body)
+    assert response.status_code == 404, response.text
+    db = SessionLocal()
+    try:
+        assert db.get(POBalance, po_id) is None
+    finally:
+        db.close()
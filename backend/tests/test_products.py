@@ -0,0 +1,20 @@
+from datetime import date
+
+TODAY = date.today().isoformat()
+
+
+def test_rate_change_reprices_invoices(client, product):
+    po = client.post("/pos/", json={"product_id": product["id"], "po_no": f"PO-{product['code']}", "po_qty": 100}).json()
+    client.post("/ins/", json={"po_id": po["id"], "date": TODAY, "qty": 10})
+    out = client.post("/outs/", json={"product_id": product["id"], "po_id": po["id"], "date": TODAY, "qty": 4}).json()
+    inv = client.post("/invoices/", json={"out_ids": [out["id"]]}).json()
+    assert inv["total_amount"] == 8.0
+    watermark = client.get("/sync").json()["watermark"]
+
+    response = client.put(f"/products/{product['id']}", json={"name": product["name"], "code": product["code"], "rate": 2.5})
+    assert response.status_code == 200, response.text
+
+    assert client.get(f"/invoices/{inv['id']}").json()["total_amount"] == 10.0
+    changes = client.get("/sync", params={"since": watermark}).json()
+    assert [p["id"] for p in changes["products"]] == [product["id"]]
+    assert [i["id"] for i in changes["invoices"]] == [inv["id"]]
@@ -0,0 +1,24 @@
+import uuid
+
+import pytest
+
+from request_metrics import QueryBudgetExceeded
+
+
+def test_write_over_budget_is_rolled_back(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.create_product, "query_budget", 1)
+    code = f"B-{uuid.uuid4().hex[:8]}"
+    with pytest.raises(QueryBudgetExceeded, match="before commit"):
+        client.post("/products/", json={"name": code, "code": code, "rate": 1.0})
+    monkeypatch.undo()
+    assert code not in {p["code"] for p in client.get("/products/", params={"limit": 10_000}).json()}
+
+
+def test_read_over_budget_fails(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.read_pos, "query_budget", 0)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get("/pos/", params={"limit": 1})
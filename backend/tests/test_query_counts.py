@@ -0,0 +1,61 @@
+"""SQL statements per request stay constant as the number of rows grows (no N+1)."""
+import uuid
+from datetime import date
+
+import pytest
+
+from request_metrics import assert_max_queries
+
+TODAY = date.today().isoformat()
+
+
+def _count(call, budget: int):
+    with assert_max_queries(budget) as stats:
+        response = call()
+    assert response.status_code == 200, response.text
+    return stats.statements, response
+
+
+@pytest.fixture
+def po(client):
+    product = client.get("/products/", params={"limit": 1}).json()[0]
+    tag = uuid.uuid4().hex[:8]
+    return client.post("/pos/", json={"product_id": product["id"], "po_no": f"QC-{tag}", "po_qty": 10_000}).json()
+
+
+@pytest.mark.parametrize("path", ["/products/", "/pos/", "/outs/", "/invoices/", "/history/"])
+def test_list_routes(client, path):
+    small, rows = _count(lambda: client.get(path, params={"limit": 2}), 2)
+    large, more = _count(lambda: client.get(path, params={"limit": 100}), 2)
+    assert len(more.json()) > len(rows.json())
+    assert small == large
+
+
+def test_dashboard(client):
+    small, _ = _count(lambda: client.get("/dashboard/", params={"limit": 2}), 5)
+    large, _ = _count(lambda: client.get("/dashboard/", params={"limit": 100}), 5)
+    assert small == large
+
+
+def test_bulk_ins(client, po):
+    small, _ = _count(lambda: client.post("/ins/bulk", json={"items": [{"po_id": po["id"], "date": TODAY, "qty": 10}] * 5}), 7)
+    large, _ = _count(lambda: client.post("/ins/bulk", json={"items": [{"po_id": po["id"], "date": TODAY, "qty": 10}] * 50}), 7)
+    assert small == large
+
+
+def test_bulk_outs_and_invoices(client, po):
+    client.post("/ins/", json={"po_id": po["id"], "date": TODAY, "qty": 1000})
+    out = {"product_id": po["product_id"], "po_id": po["id"], "date": TODAY, "qty": 1}
+    small, few = _count(lambda: client.post("/outs/bulk", json={"items": [out] * 5}), 7)
+    large, many = _count(lambda: client.post("/outs/bulk", json={"items": [out] * 50}), 7)
+    assert small == large
+
+    few_ids, many_ids = [o["id"] for o in few.json()], [o["id"] for o in many.json()]
+    client.post("/invoices/", json={"out_ids": few_ids[:1]})  # warms the product catalog cache
+    small, inv = _count(lambda: client.post("/invoices/", json={"out_ids": few_ids[1:3]}), 11)
+    large, _ = _count(lambda: client.post("/invoices/", json={"out_ids": many_ids[:40]}), 11)
+    assert small == large
+
+    added, _ = _count(lambda: client.post(f"/invoices/{inv.json()['id']}/items", json={"out_ids": few_ids[3:]}), 9)
+    added_more, _ = _count(lambda: client.post(f"/invoices/{inv.json()['id']}/items", json={"out_ids": many_ids[40:]}), 9)
+    assert added == added_more
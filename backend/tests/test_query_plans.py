@@ -0,0 +1,47 @@
+"""Every statement the API issues must be served by an index (see bench/plans.py)."""
+import pytest
+
+from bench.plans import ALLOWED_SCANS, Recorder, check, drive, explain
+
+HOT_TABLES = ("stock_outs", "stock_ins", "history_logs", "invoices")
+
+
+@pytest.fixture(scope="module")
+def plans(client):
+    recorder = Recorder()
+    drive(client, recorder)
+    return check(recorder)
+
+
+def test_every_route_was_explained(plans):
+    report, _ = plans
+    assert len(report) >= 50
+    assert all(report.values())
+
+
+def test_no_full_scans_on_hot_tables(plans):
+    report, _ = plans
+    scans = [
+        f"{step}: {table}: {entry['sql'][:160]} -> {entry['plan']}"
+        for step, entries in report.items()
+        for entry in entries
+        for table in entry["full_scans"]
+        if table in HOT_TABLES and (step, table) not in ALLOWED_SCANS
+    ]
+    assert not scans, "full table scans:\n" + "\n".join(scans)
+
+
+def test_no_unlisted_full_scans(plans):
+    _, failures = plans
+    assert not failures, "\n".join(f"{step}: {table}: {' '.join(sql.split())[:160]}" for step, table, sql in failures)
+
+
+def test_dropped_index_is_reported(engine, dataset):
+    statement = "SELECT stock_outs.id FROM stock_outs WHERE stock_outs.invoice_id = ?"
+    # Two connections: SQLite would reuse the first plan from its statement cache
+    with engine.connect() as conn, engine.connect() as scratch:
+        assert explain(conn, statement, ("x",))[1] == []
+        with scratch.begin() as trans:
+            scratch.exec_driver_sql("DROP INDEX ix_stock_outs_invoice")
+            assert explain(scratch, statement, ("x",))[1] == ["stock_outs"]
+            trans.rollback()
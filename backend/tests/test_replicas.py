@@ -0,0 +1,23 @@
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Counter
+from replicas import ReplicaSession, replica_router
+
+
+def test_failed_replica_read_is_retried_on_primary(engine, tmp_path):
+    broken = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")  # no tables: every read fails
+    sessions = sessionmaker(class_=ReplicaSession, bind=broken, info={"primary": engine})
+    replica_router.healthy = True
+
+    db = sessions()
+    try:
+        expected = db.query(func.count(Counter.name)).scalar()
+        assert db.execute(select(func.count(Counter.name))).scalar() == expected
+        assert db.get_bind() is engine
+    finally:
+        db.close()
+    assert not replica_router.healthy
+
+    # The primary is only borrowed by the session that failed
+    assert sessions().info["primary"] is engine
@@ -0,0 +1,43 @@
+from datetime import date
+
+TODAY = date.today().isoformat()
+
+
+def _ids(rows):
+    return [r["id"] for r in rows]
+
+
+def test_watermark_returns_only_later_changes(client, product):
+    snapshot = client.get("/sync").json()
+    assert product["id"] in _ids(snapshot["products"])
+    watermark = snapshot["watermark"]
+
+    unchanged = client.get("/sync", params={"since": watermark}).json()
+    assert unchanged["watermark"] == watermark
+    assert all(unchanged[t] == [] for t in ("products", "purchase_orders", "stock_ins", "stock_outs", "invoices"))
+
+    po = client.post("/pos/", json={"product_id": product["id"], "po_no": f"PO-{product['code']}", "po_qty": 10}).json()
+    changes = client.get("/sync", params={"since": watermark}).json()
+    assert _ids(changes["purchase_orders"]) == [po["id"]]
+    assert changes["products"] == []
+    assert changes["watermark"] != watermark
+
+    # Catching up from the new watermark sees nothing twice
+    assert client.get("/sync", params={"since": changes["watermark"]}).json()["purchase_orders"] == []
+
+
+def test_deletes_reach_sync(client, product):
+    po = client.post("/pos/", json={"product_id": product["id"], "po_no": f"PO-{product['code']}", "po_qty": 10}).json()
+    stock_in = client.post("/ins/", json={"po_id": po["id"], "date": TODAY, "qty": 3}).json()
+    watermark = client.get("/sync").json()["watermark"]
+
+    assert client.delete(f"/ins/{stock_in['id']}").status_code == 200
+    assert client.delete(f"/products/{product['id']}").status_code == 200
+    changes = client.get("/sync", params={"since": watermark}).json()
+    assert changes["deleted"]["stock_ins"] == [stock_in["id"]]  # hard delete: a tombstone
+    assert changes["stock_ins"] == []
+    assert [(p["id"], p["is_active"]) for p in changes["products"]] == [(product["id"], False)]  # soft delete
+
+
+def test_bad_watermark_is_400(client):
+    assert client.get("/sync", params={"since": "not-a-watermark"}).status_code == 400
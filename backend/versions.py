@@ -0,0 +1,90 @@
+import hashlib
+from datetime import datetime
+from fastapi import Request, Response
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Counter
+
+# Per-table change versions, stored as rows in the counters table
+VERSIONED_TABLES = ("products", "materials", "purchase_orders", "stock_ins", "stock_outs", "invoices")
+VERSION_PREFIX = "version:"
+
+
+def ensure_versions(engine):
+    """Create the counter rows for every versioned table that doesn't have one yet."""
+    names = [VERSION_PREFIX + t for t in VERSIONED_TABLES]
+    with engine.begin() as conn:
+        existing = set(conn.execute(select(Counter.name).where(Counter.name.in_(names))).scalars())
+        missing = [dict(name=n, value=0) for n in names if n not in existing]
+        if missing:
+            conn.execute(insert(Counter), missing)
+
+
+def bump_versions(db: Session, *tables) -> dict:
+    """Advance the change version of tables modified by the caller's transaction.
+
+    Call it last, right before commit, so the counter rows stay locked as briefly
+    as possible. Returns the new versions, keyed by table.
+    """
+    rows = db.execute(
+        update(Counter)
+        .where(Counter.name.in_([VERSION_PREFIX + t for t in tables]))
+        .values(value=Counter.value + 1)
+        .returning(Counter.name, Counter.value)
+        .execution_options(synchronize_session=False)
+    )
+    return {name[len(VERSION_PREFIX):]: value for name, value in rows}
+
+
+def stamp(versions: dict, *objs):
+    """Set revision/updated_at on ORM objects written by this transaction (see GET /sync)."""
+    now = datetime.utcnow()
+    for obj in objs:
+        obj.revision = versions[obj.__tablename__]
+        obj.updated_at = now
+
+
+def stamped(versions: dict, table: str) -> dict:
+    """revision/updated_at values for rows inserted as plain dicts."""
+    return {"revision": versions[table], "updated_at": datetime.utcnow()}
+
+
+def stamp_where(db: Session, versions: dict, model, *criteria):
+    """Stamp rows this transaction already wrote, for writers that can only bump after writing them."""
+    db.execute(
+        update(model).where(*criteria).values(**stamped(versions, model.__tablename__)),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def read_versions(db: Session, tables) -> dict:
+    rows = db.execute(select(Counter.name, Counter.value).where(Counter.name.in_([VERSION_PREFIX + t for t in tables])))
+    return {name[len(VERSION_PREFIX):]: value for name, value in rows}
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" name the same representation
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+def conditional_get(db: Session, request: Request, response: Response, *tables):
+    """ETag a list response from the versions of the tables it reads.
+
+    Returns a 304 Response when the client's If-None-Match still matches;
+    otherwise sets ETag on `response` and returns None. The versions are read
+    before the rows, so a tag can only ever be older than the data it labels.
+    """
+    versions = read_versions(db, tables)
+    key = "|".join(f"{t}:{versions.get(t, 0)}" for t in tables) + "|" + request.url.path + "?" + request.url.query
+    etag = 'W/"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # no-cache: browsers revalidate with If-None-Match
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -41,11 +41,14 @@
     history: []
   };
 
+  // Identifies this tab to the API, so its reads see its own writes (replica routing)
+  const CLIENT_ID = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
   // Helper fetch wrapper
   async function api(endpoint, options = {}) {
     try {
       const res = await fetch(`${API_URL}${endpoint}`, {
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', 'X-Client-Id': CLIENT_ID },
         ...options
       });
       if (!res.ok) {
@@ -62,49 +65,20 @@
   // Initial Load
   async function loadAll() {
     try {
-      // Parallel fetch
-      const [prods, pos, outs, invs] = await Promise.all([
-        api('/products/'),
-        api('/pos/'),
-        api('/outs/'),
-        api('/invoices/')
-      ]);
-      state.products = prods;
-      state.pos = pos;
-      state.outs = outs;
-      state.invoices = invs;
-
-      // Stock INs are inside POs ? No, separate endpoint.
-      // We will need to fetch INs for displayed POs or cache them.
-      // For global search and stats, we might need them all?
-      // Let's fetch ins for all known POs? inefficient.
-      // Let's change strategy: fetch INs only when needed or load ALL for MVP scale.
-      // Since backend doesn't have /ins/ endpoint for all, we might need to add it or iterate.
-      // Iterating is bad. We should assume for MVP size we can fetch aggregated data or add an endpoint.
-      // But I didn't add GET /ins/ global. I'll rely on on-demand load or specific PO views.
-      // HOWEVER, tab 1 table shows total IN. We need that data.
-      // I will add a client-side loop to fetch INs for displayed POs or ...
-      // BETTER: Add a backend endpoint to get all INs. For now, let's just fetch for relevant POs in view.
-
-      // Wait, to calculate 'remaining' for Tab 2, we need all INs.
-      // I'll fetch INs for each PO in the background for now (inefficient but works for 0-50 POs).
-      await fetchAllIns();
-
+      // One snapshot call: products, POs with IN/OUT totals, recent OUTs and invoice summaries.
+      const snap = await api('/dashboard/');
+      state.products = snap.products;
+      state.pos = snap.pos;
+      state.outs = snap.outs;
+      state.invoices = snap.invoices;
+
+      // Per-PO INs are only loaded on demand (openInHistory); totals come with the POs.
       renderAll();
     } catch (e) {
       console.error(e);
     }
   }
 
-  async function fetchAllIns() {
-    // This is temporary until we have a proper bulk endpoint
-    state.ins = [];
-    for (const po of state.pos) {
-      const ins = await api(`/pos/${po.id}/ins/`);
-      state.ins.push(...ins);
-    }
-  }
-
   /* 
      NOTE: 
      - Relationships in state are by ID.
@@ -117,8 +91,8 @@
   // ---------- Derived Computations ----------
   const getProduct = (pid) => state.products.find(p => p.id === pid);
   const getPO = (poid) => state.pos.find(p => p.id === poid);
-  const poInTotal = (poid) => state.ins.filter(x => x.po_id === poid).reduce((a, b) => a + Number(b.qty || 0), 0);
-  const poOutTotal = (poid) => state.outs.filter(x => x.po_id === poid).reduce((a, b) => a + Number(b.qty || 0), 0);
+  const poInTotal = (poid) => Number(getPO(poid)?.total_in || 0);
+  const poOutTotal = (poid) => Number(getPO(poid)?.total_out || 0);
   const poRemainingIn = (poid) => Math.max(0, poInTotal(poid) - poOutTotal(poid));
 
   // No more local pushHistory, backend handles it.
@@ -143,27 +117,24 @@
     if (!q) { toast('Type something to search'); return; }
 
     const results = [];
-    // Products
-    for (const p of state.products) {
-      if (p.name.toLowerCase().includes(q) || p.code.toLowerCase().includes(q)) {
-        results.push({ label: `Product: ${p.name} (${p.code})`, tab: 0, focus: { type: 'product', id: p.id } });
-      }
-      // Materials loaded on demand... cant search them easily without fetching all.
-      // Skipping material search for now unless we fetch all materials.
-    }
-
-    // POs
-    for (const po of state.pos) {
-      if (po.po_no.toLowerCase().includes(q)) {
-        const p = getProduct(po.product_id);
-        results.push({ label: `PO: ${po.po_no} → ${p?.name || ''} (${p?.code || ''})`, tab: 1, focus: { type: 'po', id: po.id, productId: po.product_id } });
-      }
+    // Products, materials, POs and invoices: indexed search on the backend
+    let hits = [];
+    try {
+      hits = await api(`/search?q=${encodeURIComponent(q)}&limit=30`);
+    } catch (e) {
+      return;
     }
-
-    // Invoices
-    for (const inv of state.invoices) {
-      if (inv.invoice_no.toLowerCase().includes(q)) {
-        results.push({ label: `Invoice: ${inv.invoice_no} (${inv.status})`, tab: 3, focus: { type: 'invoice', id: inv.id } });
+    for (const h of hits) {
+      const p = getProduct(h.product_id);
+      if (h.type === 'product') {
+        results.push({ label: `Product: ${p?.name || h.text} (${p?.code || ''})`, tab: 0, focus: { type: 'product', id: h.id } });
+      } else if (h.type === 'material') {
+        results.push({ label: `Material: ${h.text} → ${p?.name || ''} (${p?.code || ''})`, tab: 0, focus: { type: 'material', id: h.id, productId: h.product_id } });
+      } else if (h.type === 'po') {
+        results.push({ label: `PO: ${h.text} → ${p?.name || ''} (${p?.code || ''})`, tab: 1, focus: { type: 'po', id: h.id, productId: h.product_id } });
+      } else if (h.type === 'invoice') {
+        const inv = state.invoices.find(i => i.id === h.id);
+        results.push({ label: `Invoice: ${h.text}${inv ? ` (${inv.status})` : ''}`, tab: 3, focus: { type: 'invoice', id: h.id } });
       }
     }
 
@@ -818,24 +789,15 @@
     const tb = $('#invoiceTbody');
     tb.innerHTML = '';
     state.invoices.forEach(inv => {
-      // Calculate total locally or fetch?
-      // We have OUTs in state.
-      // Filter OUTs for this invoice
-      const invOuts = state.outs.filter(o => o.invoice_id === inv.id);
-      let total = 0;
-      invOuts.forEach(o => {
-        const p = getProduct(o.product_id);
-        total += (o.qty * (p?.rate || 0));
-      });
-
+      // Line count and total are maintained by the backend
       const statusColors = { 'Draft': 'bg-gray-100 text-gray-800', 'Ready': 'bg-blue-100 text-blue-800', 'Printed': 'bg-green-100 text-green-800' };
 
       const tr = document.createElement('tr');
       tr.innerHTML = `
         <td class="px-4 py-3 font-medium">${inv.invoice_no}</td>
         <td class="px-4 py-3">${inv.date}</td>
-        <td class="px-4 py-3 text-right">${invOuts.length}</td>
-        <td class="px-4 py-3 text-right font-bold">${fmt(total)}</td>
+        <td class="px-4 py-3 text-right">${inv.line_count}</td>
+        <td class="px-4 py-3 text-right font-bold">${fmt(inv.total_amount)}</td>
         <td class="px-4 py-3"><span class="px-2 py-1 rounded text-xs font-semibold ${statusColors[inv.status] || ''}">${inv.status}</span></td>
         <td class="px-4 py-3 text-right">
           <button class="viewBtn px-2 py-1 border rounded" data-id="${inv.id}">View</button>
@@ -846,9 +808,12 @@
     $$('.viewBtn').forEach(b => b.addEventListener('click', () => openInvoiceView(b.dataset.id)));
   }
 
-  function openInvoiceView(invId) {
-    const inv = state.invoices.find(i => i.id === invId);
-    if (!inv) return;
+  async function openInvoiceView(invId) {
+    // Header, totals and line items (with product/PO details) come in one call
+    let inv;
+    try {
+      inv = await api(`/invoices/${invId}`);
+    } catch (e) { return; }
     selectedInvoiceId = invId;
 
     const v = $('#invoiceView');
@@ -886,35 +851,28 @@
     }
 
     // Items
-    const invOuts = state.outs.filter(o => o.invoice_id === inv.id);
     const tbody = $('#invItemsTbody');
     tbody.innerHTML = '';
-    let total = 0;
-    invOuts.forEach(o => {
-      const p = getProduct(o.product_id);
-      const po = getPO(o.po_id);
-      const sub = o.qty * (p?.rate || 0);
-      total += sub;
-
+    inv.items.forEach(o => {
       const removeBtn = (inv.status !== 'Printed')
         ? `<button class="text-xs text-rose-500 hover:bg-rose-50 border rounded px-2 py-1 ml-2 btnRemoveItem" data-oid="${o.id}">Remove</button>`
         : '';
 
       const tr = document.createElement('tr');
       tr.innerHTML = `
-           <td class="p-2">${p?.name}</td>
-           <td class="p-2">${p?.code}</td>
-           <td class="p-2">${po?.po_no}</td>
+           <td class="p-2">${o.product_name}</td>
+           <td class="p-2">${o.product_code}</td>
+           <td class="p-2">${o.po_no}</td>
            <td class="p-2 text-right">${o.qty}</td>
-           <td class="p-2 text-right">${fmt(p?.rate)}</td>
+           <td class="p-2 text-right">${fmt(o.rate)}</td>
            <td class="p-2 text-right flex justify-end items-center gap-2">
-             ${fmt(sub)}
+             ${fmt(o.amount)}
              ${removeBtn}
            </td>
        `;
       tbody.appendChild(tr);
     });
-    $('#invTotal').textContent = fmt(total);
+    $('#invTotal').textContent = fmt(inv.total_amount);
 
     // Remove Item Logic
     tbody.querySelectorAll('.btnRemoveItem').forEach(btn => {
@@ -967,11 +925,24 @@
       btnArea.appendChild(addBtn);
     }
 
-    // 3. Print
+    // 3. Print: the backend renders the document once and serves reprints from its cache
     const printBtn = document.createElement('button');
     printBtn.className = 'px-4 py-2 rounded-xl border text-sm hover:bg-white ml-2';
     printBtn.textContent = '🖨️ Print';
-    printBtn.onclick = () => window.print();
+    printBtn.onclick = async () => {
+      const w = window.open('', '_blank'); // before the await, or popup blockers step in
+      try {
+        const res = await fetch(`${API_URL}/invoices/${inv.id}/document`, { headers: { 'X-Client-Id': CLIENT_ID } });
+        if (!res.ok) throw new Error('Could not render the invoice');
+        w.document.write(await res.text());
+        w.document.close();
+        w.focus();
+        w.print();
+      } catch (e) {
+        if (w) w.close();
+        toast(`Error: ${e.message}`);
+      }
+    };
     btnArea.appendChild(printBtn);
   }
 
@@ -1052,4 +1023,15 @@
   // Start
   loadAll();
 
+  // Live updates: other users' changes arrive on the change feed; refresh the
+  // snapshot (a cheap 304 when nothing we show changed), batching bursts of events.
+  let reloadTimer = null;
+  if (window.EventSource) {
+    const feed = new EventSource(`${API_URL}/events`);
+    feed.onmessage = () => {
+      clearTimeout(reloadTimer);
+      reloadTimer = setTimeout(loadAll, 300);
+    };
+  }
+
 })();